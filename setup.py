@@ -190,8 +190,11 @@ CASACORE_YACC=[ 'casa-source/casatools/casacore/tables/TaQL/RecordGram.yy',
                 'casa-source/casatools/casacore/ms/MSSel/MSObservationGram.yy' ]
 
 CASAWVR_SOURCE = [ 'src/code/air_casawvr/cmdline/wvrgcal.cpp', 'src/code/air_casawvr/cmdline/wvrgcalerrors.cpp',
+                   'src/code/air_casawvr/cmdline/wvrgcalmain.cpp', 'src/code/air_casawvr/cmdline/wvrgcalresults.cpp',
                    'src/code/air_casawvr/cmdline/wvrgcalfeedback.cpp', 'src/code/air_casawvr/src/apps/arraygains.cpp',
                    'src/code/air_casawvr/src/apps/segmentation.cpp', 'src/code/air_casawvr/src/apps/arraydata.cpp',
+                   'src/code/air_casawvr/src/apps/wvrextract.cpp',
+                   'src/code/air_casawvr/src/apps/retcache.cpp',
                    'src/code/air_casawvr/casawvr/mswvrdata.cpp', 'src/code/air_casawvr/casawvr/msutils.cpp',
                    'src/code/air_casawvr/src/dipmodel_iface.cpp', 'src/code/air_casawvr/src/apps/almaresults.cpp',
                    'src/code/air_casawvr/src/apps/almaopts.cpp', 'src/code/air_casawvr/src/apps/almaabs_i.cpp',
@@ -207,7 +210,7 @@ CASAWVR_SOURCE = [ 'src/code/air_casawvr/cmdline/wvrgcal.cpp', 'src/code/air_cas
                    'src/code/air_casawvr/src/dtdltools.cpp', 'src/code/air_casawvr/casawvr/msantdata.cpp',
                    'src/code/air_casawvr/src/layers.cpp', 'src/code/air_casawvr/src/columns_data.cpp',
                    'src/code/air_casawvr/src/partitionsum.cpp', 'src/code/air_casawvr/src/partitionsum_testdata.cpp',
-                   'src/code/air_casawvr/src/libair_main.cpp',
+                   'src/code/air_casawvr/src/libair_main.cpp', 'src/code/air_casawvr/src/tbemulator.cpp',
 
                    'src/code/bnmin1/src/nestedsampler.cxx',
                    'src/code/bnmin1/src/nestederr.cxx', 'src/code/bnmin1/src/priors.cxx',
@@ -484,10 +487,14 @@ module_cflags = { '/casacore/': ['-DCFITSIO_VERSION_MAJOR=3', '-DCFITSIO_VERSION
                                           '-DNO_CRASH_REPORTER', '-fno-omit-frame-pointer', '-DWITHOUT_ACS', '-DWITHOUT_BOOST',
                                           '-DCASATOOLS', '-DCASA6' ] + platform_cflags[sys.platform] }
 
+### python extension running wvrgcal in-process (linked with CASAWVR_SOURCE minus the program's main)
+CASAWVR_MODULE_SOURCE = [ 'src/code/air_casawvr/cmdline/wvrgcalmodule.cpp' ]
+CASAWVR_MAIN_OBJECT = 'wvrgcalmain.o'
+
 xml_xlate = { }
-xml_files = [ 'xml/wvrgcal.xml' ]
+xml_files = [ 'xml/wvrgcal.xml', 'xml/wvrgcal_batch.xml' ]
 public_files = [ 'src/tasks/LICENSE.txt' ]
-private_scripts = [ 'src/tasks/task_wvrgcal.py' ]
+private_scripts = [ 'src/tasks/task_wvrgcal.py', 'src/tasks/task_wvrgcal_batch.py', 'src/tasks/wvrgcal_cache.py' ]
 private_modules = [  ]
 
 if pyversion < 3:
@@ -864,6 +871,13 @@ if __name__ == '__main__':
             print("WARNING: Couldn't copy libgfortran.so.3")
         
     cc.link( CCompiler.EXECUTABLE, objs, os.path.join(bindir,"wvrgcal"), libraries=libs, extra_preargs=props['build.flags.link.openmp'] + rpath + props['build.flags.link.gsl'] + archflags )
+
+    print("building in-process wvrgcal module...")
+    module_objs = cc.compile( CASAWVR_MODULE_SOURCE, os.path.join(tmpdir,"wvrgcal"), include_dirs=[ sysconfig.get_paths( )['include'] ] )
+    module_objs += [ o for o in objs if os.path.basename(o) != CASAWVR_MAIN_OBJECT ]
+    module_objs += [ os.path.join('local', 'lib', l) for l in ['libboost_filesystem.a', 'libboost_program_options.a', 'libboost_random.a', 'libboost_regex.a', 'libboost_system.a', 'libgsl.a', 'libgslcblas.a'] ]
+    cc.link( CCompiler.SHARED_OBJECT, module_objs, os.path.join(privatedir,"_wvrgcal" + sysconfig.get_config_var('EXT_SUFFIX')),
+             libraries=[ l for l in libs if 'boost' not in l ], extra_preargs=props['build.flags.link.openmp'] + rpath + archflags + ( [ '-undefined', 'dynamic_lookup' ] if sys.platform == 'darwin' else [ ] ) )
     if isexe("scripts/mod-closure") and not os.path.isfile(".created.closure"):
         print("generating module closure...")
         if Proc([ "scripts/mod-closure", moduledir, "lib=%s" % libdir ]) != 0:
@@ -132,18 +132,14 @@ namespace LibAIR2 {
 
   void dataSPWs(const casacore::MeasurementSet &ms,
 		std::vector<size_t> &spw,
-		const std::vector<size_t> &sortedI)
+		const MSScanIndex &idx)
   {
     std::map<size_t, size_t> map=DataDescSPWMap(ms);
-    const casacore::MSMainColumns cols(ms);
-    const casacore::ScalarColumn<casacore::Int> &dd=cols.dataDescId();
-    const size_t nrows=dd.nrow();          
+    const size_t nrows=idx.size();
     spw.resize(nrows);
     for(size_t ii=0; ii<nrows; ++ii)
     {
-      size_t i = sortedI[ii];
-
-      spw[ii]=map[dd(i)];
+      spw[ii]=map[idx.ddid[ii]];
     }
   }
 
@@ -21,6 +21,8 @@
 
 #include <ms/MeasurementSets/MeasurementSet.h>
 
+#include "msutils.hpp"
+
 namespace LibAIR2 {
 
   /// Information about an individual spectral window
@@ -66,7 +68,7 @@ namespace LibAIR2 {
    */
   void dataSPWs(const casacore::MeasurementSet &ms,
 		std::vector<size_t> &spw,
-		const std::vector<size_t> &sortedI);
+		const MSScanIndex &idx);
 
   /** \brief Total number of SPWs in the MS
    */
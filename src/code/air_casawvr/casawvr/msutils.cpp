@@ -11,6 +11,8 @@
 */
 
 #include <stdexcept>
+#include <exception>
+#include <algorithm>
 #include "msutils.hpp"
 
 #include <casacore/ms/MeasurementSets/MeasurementSet.h>
@@ -49,44 +51,121 @@ namespace LibAIR2 {
     }
   }
 
-  void fieldIDs(const casacore::MeasurementSet &ms,
-		std::vector<double> &time,
-		std::vector<int> &fieldID,
-		std::vector<int> &sourceID,
-		const std::vector<size_t> &sortedI)
+  /// Number of main table rows read at a time
+  static const size_t scanBlockRows=1<<20;
+
+  namespace {
+    struct ScanKey {
+      double time;
+      int ddid, field, state;
+
+      bool operator<(const ScanKey &o) const
+      {
+	if (time!=o.time) return time<o.time;
+	if (ddid!=o.ddid) return ddid<o.ddid;
+	if (field!=o.field) return field<o.field;
+	return state<o.state;
+      }
+      bool operator==(const ScanKey &o) const
+      {
+	return time==o.time && ddid==o.ddid && field==o.field && state==o.state;
+      }
+    };
+  }
+
+  void buildScanIndex(const casacore::MeasurementSet &ms,
+		      MSScanIndex &idx)
   {
     const casacore::MSMainColumns cols(ms);
-    const casacore::ScalarColumn<casacore::Int> &f= cols.fieldId();
-    const casacore::ScalarColumn<casacore::Double> &t= cols.time();
+    const size_t nrows=ms.nrow();
 
-    std::map<size_t, size_t> srcmap=getFieldSrcMap(ms);
+    // The blocks are read one at a time, since casacore tables are not
+    // thread-safe, and sorted in parallel
+    const long nblocks=(nrows+scanBlockRows-1)/scanBlockRows;
+    std::vector<ScanKey> keys;
+    std::exception_ptr error;
+#pragma omp parallel for schedule(dynamic)
+    for(long bi=0; bi<nblocks; ++bi)
+    {
+      try
+      {
+	const size_t b=bi*scanBlockRows;
+	const size_t n=std::min(scanBlockRows, nrows-b);
+	const casacore::Slicer rows(casacore::IPosition(1, b),
+				    casacore::IPosition(1, n));
+	casacore::Vector<casacore::Double> t;
+	casacore::Vector<casacore::Int> f, st, dd;
+#pragma omp critical(LibAIR2_wvrtable)
+	{
+	  t.reference(cols.time().getColumnRange(rows));
+	  f.reference(cols.fieldId().getColumnRange(rows));
+	  st.reference(cols.stateId().getColumnRange(rows));
+	  dd.reference(cols.dataDescId().getColumnRange(rows));
+	}
 
-    const size_t nrows=f.nrow();    
+	std::vector<ScanKey> block(n);
+	for(size_t i=0; i<n; ++i)
+	{
+	  block[i].time=t(i);
+	  block[i].ddid=dd(i);
+	  block[i].field=f(i);
+	  block[i].state=st(i);
+	}
+	std::sort(block.begin(), block.end());
+	block.erase(std::unique(block.begin(), block.end()), block.end());
+#pragma omp critical(LibAIR2_scankeys)
+	keys.insert(keys.end(), block.begin(), block.end());
+      }
+      catch(...)
+      {
+#pragma omp critical(LibAIR2_scanerror)
+	if(!error)
+	  error=std::current_exception();
+      }
+    }
+    if(error)
+      std::rethrow_exception(error);
+    std::sort(keys.begin(), keys.end());
+    keys.erase(std::unique(keys.begin(), keys.end()), keys.end());
+
+    std::map<size_t, size_t> srcmap=getFieldSrcMap(ms);
 
-    if(sortedI.size()!= nrows){
-      throw std::runtime_error("Time-sorted row vector must have same size as MS.");
+    const size_t nkeys=keys.size();
+    idx.time.resize(nkeys);
+    idx.field.resize(nkeys);
+    idx.source.resize(nkeys);
+    idx.hasSource.resize(nkeys);
+    idx.state.resize(nkeys);
+    idx.ddid.resize(nkeys);
+    for(size_t ii=0; ii<nkeys; ++ii)
+    {
+      idx.time[ii]=keys[ii].time;
+      idx.field[ii]=keys[ii].field;
+      std::map<size_t, size_t>::const_iterator src=srcmap.find(keys[ii].field);
+      idx.hasSource[ii]= (src!=srcmap.end());
+      idx.source[ii]= idx.hasSource[ii] ? (int)src->second : -1;
+      idx.state[ii]=keys[ii].state;
+      idx.ddid[ii]=keys[ii].ddid;
     }
+  }
 
-    time.resize(nrows);
-    fieldID.resize(nrows);
+  void fieldIDs(const MSScanIndex &idx,
+		std::vector<double> &time,
+		std::vector<int> &fieldID,
+		std::vector<int> &sourceID)
+  {
+    const size_t nrows=idx.size();
+
+    time=idx.time;
+    fieldID=idx.field;
     sourceID.resize(nrows);
     for(size_t ii=0; ii<nrows; ++ii)
     {
-      size_t i = sortedI[ii];
-
-      time[ii]=t(i);
-      fieldID[ii]=f(i);
-      if (srcmap.count(f(i)) == 0)
+      if (!idx.hasSource[ii])
       {
 	throw std::runtime_error("Encountered data without associated source");
       }
-      /**checking if compiler version has map::at*/
-#if __GNUC__ <= 4 and __GNUC_MINOR__ < 1
-      sourceID[ii]=srcmap[(f(i))];
-#else
-      sourceID[ii]=srcmap.at(f(i));
-#endif
-
+      sourceID[ii]=idx.source[ii];
     }
   }
 
@@ -21,6 +21,8 @@
 
 #include <ms/MeasurementSets/MeasurementSet.h>
 
+#include "../src/apps/scanindex.hpp"
+
 namespace LibAIR2 {
 
   /** Channel frequencies for spectral window spw     
@@ -30,13 +32,20 @@ namespace LibAIR2 {
 		      std::vector<double> &fres);
 
 
-  /** Retrieve row times, field IDs, and Source IDs
+  /** Build the time-sorted index of the main table
+
+      The table is read in blocks of rows so that the memory needed
+      is bounded by the block size and the size of the index.
+   */
+  void buildScanIndex(const casacore::MeasurementSet &ms,
+		      MSScanIndex &idx);
+
+  /** Retrieve row times, field IDs, and Source IDs in time order
    */
-  void fieldIDs(const casacore::MeasurementSet &ms,
+  void fieldIDs(const MSScanIndex &idx,
 		std::vector<double> &time,
 		std::vector<int> &fieldID,
-		std::vector<int> &sourceID,
-		const std::vector<size_t> &sortedI
+		std::vector<int> &sourceID
 		);
 
   /** \brief Connection between state_id and the ScanIntent (or
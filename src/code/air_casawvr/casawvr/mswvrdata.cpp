@@ -11,7 +11,15 @@
 */
 
 #include <set>
+#include <map>
+#include <unordered_map>
+#include <functional>
 #include <memory>
+#include <algorithm>
+#include <limits>
+#include <cmath>
+#include <stdexcept>
+#include <exception>
 #include <iostream>
 #include <iomanip>
 
@@ -23,8 +31,8 @@
 #include <casacore/ms/MeasurementSets/MeasurementSet.h>
 #include <casacore/ms/MeasurementSets/MSProcessor.h>
 #include <casacore/ms/MeasurementSets/MSColumns.h>
-#include <casacore/casa/Utilities/GenSort.h>
 #include <casacore/ms/MSOper/MSDerivedValues.h>
+#include <casacore/tables/TaQL/ExprNode.h>
 
 #include <casa/Arrays/Vector.h>
 #include <casa/Quanta/MVTime.h>
@@ -170,148 +178,241 @@ namespace LibAIR2 {
 
 
   void WVRTimeStatePoints(const casacore::MeasurementSet &ms,
+			  const MSScanIndex &idx,
 			  std::vector<double> &times,
 			  std::vector<size_t> &states,
 			  std::vector<size_t> &field,
 			  std::vector<size_t> &source,
 			  const std::vector<int> &wvrspws,
-			  const std::vector<size_t> &sortedI)
+			  const std::vector<double> &unflaggedTimes)
   {
     std::set<size_t> dsc_ids=WVRDataDescIDs(ms, wvrspws);
     size_t dsc_id = *dsc_ids.begin();
 
-    casacore::ScalarColumn<casacore::Double> c_times(ms,
-					       casacore::MS::columnName(casacore::MS::TIME));
-    casacore::ScalarColumn<casacore::Int> c_states(ms,
-					     casacore::MS::columnName(casacore::MS::STATE_ID));
-    casacore::ScalarColumn<casacore::Int> c_field(ms,
-					    casacore::MS::columnName(casacore::MS::FIELD_ID));
-
-    casacore::ScalarColumn<casacore::Int> c_desc_id(ms,
-					      casacore::MS::columnName(casacore::MS::DATA_DESC_ID));
-    casacore::ScalarColumn<casacore::Int> a1(ms,
-				       casacore::MS::columnName(casacore::MS::ANTENNA1));
-
-    casacore::ArrayColumn<casacore::Bool> c_flags(ms,
-					    casacore::MS::columnName(casacore::MS::FLAG));
-
-    std::map<size_t, size_t> srcmap=getFieldSrcMap(ms);
-
     times.resize(0);
     states.resize(0);
 
     double prev_time=0.;
 
-    const size_t nrows=c_desc_id.nrow();    
+    const size_t nrows=idx.size();
     for(size_t ii=0; ii<nrows; ++ii)
     {
-
-      size_t i = sortedI[ii];
-
-      if (c_times(i)>prev_time and  // only one entry per time stamp
-	  c_desc_id(i)==(int)dsc_id 
+      if (idx.time[ii]>prev_time and  // only one entry per time stamp
+	  idx.ddid[ii]==(int)dsc_id 
 	  )
       {
-	prev_time = c_times(i);
+	prev_time = idx.time[ii];
 
-	bool haveUnflaggedWvrData=false;
-	size_t iii=ii;
-	while(iii<nrows && c_times(sortedI[iii])==prev_time)
+	if(std::binary_search(unflaggedTimes.begin(), unflaggedTimes.end(), prev_time))
 	{
-	  // while in this timestamp, check if there is unflagged WVR data
-	  if(c_desc_id(sortedI[iii])==(int)dsc_id and 
-	     casacore::allEQ(casacore::False, c_flags(sortedI[iii]))) // i.e. not flagged
+	  if (!idx.hasSource[ii])
 	  {
-	    haveUnflaggedWvrData=true;
-	    break;
+	    throw std::out_of_range("Encountered WVR data without associated source");
 	  }
-	  iii++;
-	}
-	if(haveUnflaggedWvrData)
-	{
-	  times.push_back(c_times(i));
-	  states.push_back(c_states(i));
-	  field.push_back(c_field(i));
-#if __GNUC__ <= 4 and __GNUC_MINOR__ < 1
-	  source.push_back(srcmap[(c_field(i))]);
-#else
-	  source.push_back(srcmap.at(c_field(i)));
-#endif
+	  times.push_back(idx.time[ii]);
+	  states.push_back(idx.state[ii]);
+	  field.push_back(idx.field[ii]);
+	  source.push_back(idx.source[ii]);
 	}
       }
     }
   }
 
-  void loadPointing(const casacore::MeasurementSet &ms,
-		    std::vector<double> &time,
-		    std::vector<double> &az,
-		    std::vector<double> &el)
+  /// Hash of the (TIME, ANTENNA) key of the offsets table
+  struct OffsetKeyHash {
+    size_t operator()(const std::pair<double, int> &k) const
+    {
+      return std::hash<double>()(k.first) ^ (std::hash<int>()(k.second)*0x9e3779b97f4a7c15ULL);
+    }
+  };
+
+  /// Row of the offsets table for each (TIME, ANTENNA)
+  typedef std::unordered_map<std::pair<double, int>, size_t, OffsetKeyHash> OffsetIndex;
+
+  /// Number of WVR rows whose FLAG and DATA are read at a time
+  static const size_t loadBlockRows=1<<16;
+
+  /// The angle x reduced to [-pi, pi]
+  static double wrapPi(double x)
   {
-    const casacore::MSPointing &ptable=ms.pointing();
-    const casacore::MSPointingColumns ptablecols(ptable);
-    const casacore::ArrayColumn<casacore::Double> &dir=ptablecols.direction();
-    const casacore::ScalarColumn<casacore::Double> &ptime=ptablecols.time();
+    if(x>M_PI)
+      x-=2*M_PI;
+    else if(x<-M_PI)
+      x+=2*M_PI;
+    return x;
+  }
 
-    const size_t n=ptime.nrow();
-    if(n==0){
+  PointingIndex::PointingIndex(const casacore::MeasurementSet &ms,
+			       double tmin,
+			       double tmax)
+  {
+    const casacore::MSPointing &ptable=ms.pointing();
+    if(ptable.nrow()==0){
       throw LibAIR2::MSInputDataError("Didn't find any POINTING data points");
     }
 
-    time.resize(n); 
-    az.resize(n); 
-    el.resize(n);
+    // The scalar columns are cheap to read in full and are used to
+    // find, for each antenna, the samples bracketing the WVR time span
+    casacore::Vector<casacore::Double> ptime;
+    casacore::Vector<casacore::Int> pant;
+    casacore::ScalarColumn<casacore::Double>(ptable, casacore::MSPointing::columnName(casacore::MSPointing::TIME)).getColumn(ptime, casacore::True);
+    casacore::ScalarColumn<casacore::Int>(ptable, casacore::MSPointing::columnName(casacore::MSPointing::ANTENNA_ID)).getColumn(pant, casacore::True);
+
+    std::map<int, std::pair<double, double> > bracket;
+    for(size_t i=0; i<ptime.size(); ++i)
+    {
+      std::map<int, std::pair<double, double> >::iterator b=bracket.find(pant(i));
+      if(b==bracket.end())
+      {
+	b=bracket.insert(std::make_pair(pant(i),
+					std::make_pair(-std::numeric_limits<double>::infinity(),
+						       std::numeric_limits<double>::infinity()))).first;
+      }
+      if(ptime(i)<=tmin && ptime(i)>b->second.first)
+	b->second.first=ptime(i);
+      if(ptime(i)>=tmax && ptime(i)<b->second.second)
+	b->second.second=ptime(i);
+    }
+    double tlo=tmin, thi=tmax;
+    for(std::map<int, std::pair<double, double> >::const_iterator b=bracket.begin(); b!=bracket.end(); ++b)
+    {
+      if(b->second.first>-std::numeric_limits<double>::infinity())
+	tlo=std::min(tlo, b->second.first);
+      if(b->second.second<std::numeric_limits<double>::infinity())
+	thi=std::max(thi, b->second.second);
+    }
+
+    // Read the directions of the selected rows only, in bulk
+    const casacore::Table sel=ptable(ptable.col(casacore::MSPointing::columnName(casacore::MSPointing::TIME))>=tlo &&
+				     ptable.col(casacore::MSPointing::columnName(casacore::MSPointing::TIME))<=thi);
+    const size_t n=sel.nrow();
+    if(n==0){
+      throw LibAIR2::MSInputDataError("Didn't find any POINTING data points in the time range of the WVR data");
+    }
+    casacore::Vector<casacore::Double> stime;
+    casacore::Vector<casacore::Int> sant;
+    casacore::Array<casacore::Double> sdir;
+    casacore::ScalarColumn<casacore::Double>(sel, casacore::MSPointing::columnName(casacore::MSPointing::TIME)).getColumn(stime, casacore::True);
+    casacore::ScalarColumn<casacore::Int>(sel, casacore::MSPointing::columnName(casacore::MSPointing::ANTENNA_ID)).getColumn(sant, casacore::True);
+    casacore::ArrayColumn<casacore::Double>(sel, casacore::MSPointing::columnName(casacore::MSPointing::DIRECTION)).getColumn(sdir, casacore::True);
+    // DIRECTION cells are (2, NUM_POLY+1); only the zeroth order term
+    // is used
+    const size_t cellsize=sdir.nelements()/n;
+
+    casacore::Bool deleteDir;
+    const casacore::Double *pdir=sdir.getStorage(deleteDir);
+
+    std::vector<size_t> order(n);
     for(size_t i=0; i<n; ++i)
+      order[i]=i;
+    std::stable_sort(order.begin(), order.end(),
+		     [&stime](size_t a, size_t b) { return stime(a)<stime(b); });
+
+    for(size_t ii=0; ii<n; ++ii)
+    {
+      const size_t i=order[ii];
+      AntPointing &p=ants[sant(i)];
+      p.time.push_back(stime(i));
+      p.az.push_back(pdir[i*cellsize]);
+      p.el.push_back(pdir[i*cellsize+1]);
+    }
+
+    sdir.freeStorage(pdir, deleteDir);
+  }
+
+  AntSet PointingIndex::antennas() const
+  {
+    AntSet res;
+    for(std::map<int, AntPointing>::const_iterator i=ants.begin(); i!=ants.end(); ++i)
+      res.insert(i->first);
+    return res;
+  }
+
+  bool PointingIndex::has(int ant) const
+  {
+    return ants.count(ant)>0;
+  }
+
+  void PointingIndex::lookup(int ant,
+			     double t,
+			     bool interpolate,
+			     double &az,
+			     double &el) const
+  {
+    std::map<int, AntPointing>::const_iterator a=ants.find(ant);
+    if(a==ants.end())
+    {
+      throw std::out_of_range("No pointing data for the requested antenna");
+    }
+    const AntPointing &p=a->second;
+    const size_t n=p.time.size();
+    const size_t j=std::lower_bound(p.time.begin(), p.time.end(), t)-p.time.begin();
+
+    if(j==n)
+    {
+      az=p.az[n-1];
+      el=p.el[n-1];
+    }
+    else if(!interpolate || j==0 || p.time[j]==t || p.time[j]==p.time[j-1])
+    {
+      // first sample at or after t
+      az=p.az[j];
+      el=p.el[j];
+    }
+    else
     {
-      time[i]=ptime(i);
-      casacore::Array<casacore::Double> a;
-      dir.get(i, a,
-	      casacore::True);
-      az[i]=a(casacore::IPosition(2,0,0));
-      el[i]=a(casacore::IPosition(2,1,0));
+      const double f=(t-p.time[j-1])/(p.time[j]-p.time[j-1]);
+      // interpolate azimuth along the shorter way round
+      az=p.az[j-1]+f*wrapPi(p.az[j]-p.az[j-1]);
+      el=p.el[j-1]+f*(p.el[j]-p.el[j-1]);
     }
   }
 
-  /** Get the nearest pointing record to each WVR observation
+  /** Get the pointing of the reference antenna at each WVR observation
    */
   bool WVRNearestPointing(const casacore::MeasurementSet &ms,
 			  const std::vector<double> &time,
+			  const AntSet &wvrants,
+			  bool interpolate,
 			  std::vector<double> &az,
 			  std::vector<double> &el)
   {
+    size_t wrows=time.size();
+    az.resize(wrows);  
+    el.resize(wrows);
 
-    std::vector<double> ptime, paz, pel;
-    bool rval = true;
     try{
-      loadPointing(ms,
-		   ptime,
-		   paz,
-		   pel);
+      const PointingIndex pidx(ms,
+			       *std::min_element(time.begin(), time.end()),
+			       *std::max_element(time.begin(), time.end()));
+
+      // The az/el are stored once per time stamp: use the lowest
+      // numbered WVR antenna with pointing data as the reference
+      const AntSet pants=pidx.antennas();
+      int refant=*pants.begin();
+      for(AntSet::const_iterator i=pants.begin(); i!=pants.end(); ++i)
+      {
+	if(wvrants.count(*i))
+	{
+	  refant=*i;
+	  break;
+	}
+      }
+
+      for (size_t wi=0; wi<wrows; ++wi)
+      {
+	pidx.lookup(refant, time[wi], interpolate, az[wi], el[wi]);
+      }
     }
-    catch(const std::runtime_error rE){
+    catch(const std::exception &rE){
       std::cerr << std::endl << "WARNING: problem while accessing POINTING table:"
 		<< std::endl << "         LibAIR2::WVRNearestPointing: " << rE.what() << std::endl;
       std::cout << std::endl << "WARNING: problem while accessing POINTING table:"
 		<< std::endl << "         LibAIR2::WVRNearestPointing: " << rE.what() << std::endl;
-      rval = false;
+      return false;
     }
 
-    size_t wrows=time.size();
-    size_t prows=ptime.size();
-    
-    az.resize(wrows);  
-    el.resize(wrows);
-
-    size_t pi=0;
-
-    for (size_t wi=0; wi<wrows; ++wi)
-    {
-      while(pi<(prows-1) and  ptime[pi]<time[wi])
-	++pi;
-      az[wi]=paz[pi];
-      el[wi]=pel[pi];
-    }
-
-    return rval;
+    return true;
 
   }
 
@@ -321,7 +422,8 @@ namespace LibAIR2 {
 		       const std::vector<double> &time,
 		       const std::vector<size_t> &fields,
 		       std::vector<double> &az,
-		       std::vector<double> &el)
+		       std::vector<double> &el,
+		       double gridstep)
   {
 
     casacore::MSDerivedValues msd;
@@ -337,27 +439,86 @@ namespace LibAIR2 {
     az.resize(wrows);  
     el.resize(wrows);
 
+    if (gridstep<=0)
+    {
+      for (size_t wi=0; wi<wrows; ++wi)
+      {
+	etime.set(casacore::MVEpoch(casacore::Quantity(time[wi], "s")));
+	msd.setEpoch(etime);
+	msd.setFieldCenter(fields[wi]);
+	azel = msd.azel();
+	az[wi]=azel.getAngle().getValue()[0];
+	el[wi]=azel.getAngle().getValue()[1];
+      }
+      return;
+    }
+
+    // The conversion is done at the multiples of gridstep and cached
+    // per field, then interpolated linearly to the WVR time stamps
+    typedef std::map<long, std::pair<double, double> > grid_t;
+    std::map<size_t, grid_t> cache;
+
     for (size_t wi=0; wi<wrows; ++wi)
     {
-      etime.set(casacore::MVEpoch(casacore::Quantity(time[wi], "s")));
-      msd.setEpoch(etime);
-      msd.setFieldCenter(fields[wi]);
-      azel = msd.azel();
-      az[wi]=azel.getAngle().getValue()[0];
-      el[wi]=azel.getAngle().getValue()[1];
+      grid_t &g=cache[fields[wi]];
+      const long k=(long)std::floor(time[wi]/gridstep);
+      for(long kk=k; kk<=k+1; ++kk)
+      {
+	if (g.count(kk)==0)
+	{
+	  etime.set(casacore::MVEpoch(casacore::Quantity(kk*gridstep, "s")));
+	  msd.setEpoch(etime);
+	  msd.setFieldCenter(fields[wi]);
+	  azel = msd.azel();
+	  g[kk]=std::make_pair(azel.getAngle().getValue()[0],
+			       azel.getAngle().getValue()[1]);
+	}
+      }
+      const std::pair<double, double> &p0=g[k], &p1=g[k+1];
+      const double f=time[wi]/gridstep-k;
+      az[wi]=p0.first+f*wrapPi(p1.first-p0.first);
+      el[wi]=p0.second+f*(p1.second-p0.second);
+    }
+
+    // Bound on the interpolation error, |f''| h^2 / 8, with the
+    // second derivative estimated from the grid points
+    double maxerr=0;
+    for(std::map<size_t, grid_t>::const_iterator fi=cache.begin(); fi!=cache.end(); ++fi)
+    {
+      const grid_t &g=fi->second;
+      for(grid_t::const_iterator i=g.begin(); i!=g.end(); ++i)
+      {
+	grid_t::const_iterator prev=g.find(i->first-1), next=g.find(i->first+1);
+	if (prev==g.end() || next==g.end())
+	  continue;
+	const double d2az=wrapPi(next->second.first-i->second.first)-wrapPi(i->second.first-prev->second.first);
+	const double d2el=next->second.second-2*i->second.second+prev->second.second;
+	const double err=std::sqrt(std::pow(d2az*std::cos(i->second.second), 2)+d2el*d2el)/8;
+	maxerr=std::max(maxerr, err);
+      }
     }
+    size_t npoints=0;
+    for(std::map<size_t, grid_t>::const_iterator fi=cache.begin(); fi!=cache.end(); ++fi)
+      npoints+=fi->second.size();
+    std::cout << "Computed the FIELD table AZ/EL at " << npoints << " points on a "
+	      << gridstep << " s grid; estimated maximum interpolation error "
+	      << maxerr/M_PI*180*3600 << " arcsec" << std::endl;
 
     return;
 
   }
-			  
 
-  InterpArrayData *loadWVRData(const casacore::MeasurementSet &ms, const std::vector<int>& wvrspws,
-			       std::vector<size_t>& sortedI,
+
+  InterpArrayData *loadWVRData(const casacore::MeasurementSet &ms,
+			       const MSScanIndex &idx,
+			       const std::vector<int>& wvrspws,
 			       std::set<int>& flaggedantsInMain,
 			       double requiredUnflaggedFraction,
 			       bool usepointing,
-			       std::string offsetstable)
+			       std::string offsetstable,
+			       bool interppointing,
+			       double fieldtabstep,
+			       const std::set<size_t> *states)
   {
     bool haveOffsets=false;
     casacore::Vector<casacore::Double> offsetTime;
@@ -401,38 +562,126 @@ namespace LibAIR2 {
       requiredUnflaggedFraction=1.;
     }
 
-    casacore::ScalarColumn<casacore::Double> maintime(ms,
-						casacore::MS::columnName(casacore::MS::TIME));
-
-    const size_t nrows=maintime.nrow();
-
-    sortedI.resize(nrows);
     flaggedantsInMain.clear();
 
+    // Select the WVR autocorrelation rows. Only their scalar columns
+    // are read in full; FLAG and DATA are read in blocks of rows so
+    // that the memory needed does not grow with the size of the MS
+    casacore::Vector<casacore::Int> dscV(dsc_ids.size());
     {
-      casacore::Vector<casacore::uInt> sortedIV(nrows);
-      casacore::Vector<casacore::Double> mainTimesV = maintime.getColumn();
-      casacore::GenSortIndirect<casacore::Double>::sort(sortedIV,mainTimesV);
-      for(casacore::uInt i=0; i<nrows; i++){ // necessary for type conversion
-	sortedI[i] = (size_t) sortedIV(i); 
+      size_t j=0;
+      for(std::set<size_t>::const_iterator it=dsc_ids.begin(); it!=dsc_ids.end(); ++it)
+	dscV(j++)=*it;
+    }
+    const casacore::Table wvrtab=ms(ms.col(casacore::MS::columnName(casacore::MS::ANTENNA1)) ==
+				    ms.col(casacore::MS::columnName(casacore::MS::ANTENNA2)) &&
+				    ms.col(casacore::MS::columnName(casacore::MS::DATA_DESC_ID)).in(casacore::TableExprNode(dscV)));
+    const size_t nwvrrows=wvrtab.nrow();
+
+    casacore::Vector<casacore::Double> w_times;
+    casacore::Vector<casacore::Int> w_a1, w_dd;
+    if(nwvrrows>0){
+      casacore::ScalarColumn<casacore::Double>(wvrtab, casacore::MS::columnName(casacore::MS::TIME)).getColumn(w_times, casacore::True);
+      casacore::ScalarColumn<casacore::Int>(wvrtab, casacore::MS::columnName(casacore::MS::ANTENNA1)).getColumn(w_a1, casacore::True);
+      casacore::ScalarColumn<casacore::Int>(wvrtab, casacore::MS::columnName(casacore::MS::DATA_DESC_ID)).getColumn(w_dd, casacore::True);
+    }
+    const casacore::ArrayColumn<casacore::Bool> flagcol(wvrtab, casacore::MS::columnName(casacore::MS::FLAG));
+    const casacore::ArrayColumn<casacore::Complex> datacol(wvrtab, casacore::MS::columnName(casacore::MS::DATA));
+
+    // First pass, over FLAG only: which WVR rows are flagged, and the
+    // times at which there are unflagged data. The blocks are
+    // processed in parallel; the table is accessed by one thread at a
+    // time since casacore tables are not thread-safe (and all Table
+    // objects of the MS in this process share the same underlying
+    // table), but the decoding overlaps with the reading.
+    const long nblocks=(nwvrrows+loadBlockRows-1)/loadBlockRows;
+    std::vector<char> w_flagged(nwvrrows, 0);
+    std::vector<double> unflaggedTimes;
+    std::exception_ptr loadError;
+#pragma omp parallel for schedule(dynamic)
+    for(long bi=0; bi<nblocks; ++bi)
+    {
+      try
+      {
+	const size_t b=bi*loadBlockRows;
+	const size_t n=std::min(loadBlockRows, nwvrrows-b);
+	casacore::Array<casacore::Bool> flags;
+#pragma omp critical(LibAIR2_wvrtable)
+	flags.reference(flagcol.getColumnRange(casacore::Slicer(casacore::IPosition(1, b),
+								casacore::IPosition(1, n))));
+	const size_t cellsize=flags.nelements()/n;
+	casacore::Bool deleteFlags;
+	const casacore::Bool *pflags=flags.getStorage(deleteFlags);
+	std::vector<double> blockTimes;
+	for(size_t i=0; i<n; ++i)
+	{
+	  for(size_t k=0; k<cellsize; ++k)
+	  {
+	    if(pflags[i*cellsize+k])
+	    {
+	      w_flagged[b+i]=1;
+	      break;
+	    }
+	  }
+	  if(!w_flagged[b+i] && w_dd(b+i)==(int)*dsc_ids.begin())
+	    blockTimes.push_back(w_times(b+i));
+	}
+	flags.freeStorage(pflags, deleteFlags);
+#pragma omp critical(LibAIR2_wvrtimes)
+	unflaggedTimes.insert(unflaggedTimes.end(), blockTimes.begin(), blockTimes.end());
+      }
+      catch(...)
+      {
+#pragma omp critical(LibAIR2_wvrerror)
+	if(!loadError)
+	  loadError=std::current_exception();
       }
     }
+    if(loadError)
+      std::rethrow_exception(loadError);
+    std::sort(unflaggedTimes.begin(), unflaggedTimes.end());
+    unflaggedTimes.erase(std::unique(unflaggedTimes.begin(), unflaggedTimes.end()),
+			 unflaggedTimes.end());
 
     std::vector<double> times, az, el;
-    std::vector<size_t> states, fields, source;
+    std::vector<size_t> tstates, fields, source;
     WVRTimeStatePoints(ms,
+		       idx,
 		       times,
-		       states,
+		       tstates,
 		       fields,
 		       source,
 		       wvrspws,
-		       sortedI); 
+		       unflaggedTimes); 
 
     if (times.size() == 0){
       throw LibAIR2::MSInputDataError("Didn't find any WVR data points");
     }
+
+    // Only the time points in the requested states are kept. keptIndex
+    // holds the position of each time point in the output, or
+    // ntimes if it is left out.
+    const size_t ntimes=times.size();
+    std::vector<size_t> keptIndex(ntimes, ntimes);
+    std::vector<double> ktimes;
+    std::vector<size_t> kstates, kfields, ksource, kseqno;
+    for(size_t i=0; i<ntimes; ++i)
+    {
+      if(states!=NULL && states->count(tstates[i])==0)
+	continue;
+      keptIndex[i]=ktimes.size();
+      ktimes.push_back(times[i]);
+      kstates.push_back(tstates[i]);
+      kfields.push_back(fields[i]);
+      ksource.push_back(source[i]);
+      kseqno.push_back(i);
+    }
+
+    if (ktimes.size() == 0){
+      throw LibAIR2::MSInputDataError("Didn't find any WVR data points in the selected states");
+    }
     
-    if(usepointing && !WVRNearestPointing(ms, times, az, el)){
+    if(usepointing && !WVRNearestPointing(ms, ktimes, wvrants, interppointing, az, el)){
       std::cout << "Could not get antenna pointing information from POINTING table." << std::endl;
       std::cerr << "Could not get antenna pointing information from POINTING table." << std::endl;
       usepointing=false;
@@ -440,155 +689,171 @@ namespace LibAIR2 {
     if(!usepointing){
       std::cout << "Deriving antenna pointing information from FIELD table ..."	<< std::endl;
       std::cerr << "Deriving antenna pointing information from FIELD table ..."	<< std::endl;      
-      WVRFieldAZEl(ms, times, fields, az, el);
+      WVRFieldAZEl(ms, ktimes, kfields, az, el, fieldtabstep);
     }
 
     std::unique_ptr<InterpArrayData> 
-      res(new InterpArrayData(times, 
+      res(new InterpArrayData(ktimes, 
 			      el,
 			      az,
-			      states,
-			      fields,
-			      source,
-			      nAnts));
-
-    // This holds how far we've filled in for each of the antennas
-
-    int counter = -1;
+			      kstates,
+			      kfields,
+			      ksource,
+			      nAnts,
+			      kseqno));
 
     std::vector<size_t> nunflagged(nAnts, 0);
     std::vector<size_t> ntotal(nAnts, 0);
 
-    casacore::ArrayColumn<casacore::Complex> indata(ms, casacore::MS::columnName(casacore::MS::DATA));
-    casacore::ScalarColumn<casacore::Int> indsc_id(ms, casacore::MS::columnName(casacore::MS::DATA_DESC_ID));
-    casacore::ScalarColumn<casacore::Int> a1(ms, casacore::MS::columnName(casacore::MS::ANTENNA1));
-    casacore::ScalarColumn<casacore::Int> a2(ms, casacore::MS::columnName(casacore::MS::ANTENNA2));
-
-    casacore::ArrayColumn<casacore::Bool> inflags(ms, casacore::MS::columnName(casacore::MS::FLAG));
-
-    casacore::ScalarColumn<casacore::Double> c_times(ms, casacore::MS::columnName(casacore::MS::TIME));
-
-    std::vector<size_t> offsetSortedI;
-    size_t nOffRows=0;
+    // The rows of the offsets table are joined to the WVR rows by
+    // (TIME, ANTENNA); offsetOfRow holds for each WVR row the matching
+    // offsets row, or noOffset
+    const size_t noOffset=std::numeric_limits<size_t>::max();
+    std::vector<size_t> offsetOfRow;
 
     if(haveOffsets){ // prepare offset application
-      for(casacore::uInt i=0; i<nrows; i++){
-	if (a1(i) == a2(i) and 
-	    dsc_ids.count(indsc_id(i)) > 0)
-	  {
-	    ++nOffRows;
-	  }
+      OffsetIndex offsetIndex;
+      size_t nduplicate=0;
+      for(size_t j=0; j<offsetTime.size(); ++j)
+      {
+	if(!offsetIndex.insert(std::make_pair(std::make_pair((double)offsetTime(j), (int)offsetAnts(j)), j)).second)
+	  ++nduplicate;
       }
-
-      if(offsetTime.size() != nOffRows){
-	std::cout << "offsetTime.size() nOffRows nrows " << offsetTime.size() << " " 
-		  <<  nOffRows << " " << nrows << std::endl;
-	throw LibAIR2::MSInputDataError("Provided Offsets Table number of rows does not match the number of WVR data rows in MS.");
+      if(nduplicate>0){
+	std::cout << "WARNING: " << nduplicate << " rows of the offsets table repeat the TIME and ANTENNA of an earlier row and are ignored" << std::endl;
+	std::cerr << "WARNING: " << nduplicate << " rows of the offsets table repeat the TIME and ANTENNA of an earlier row and are ignored" << std::endl;
       }
-      offsetSortedI.resize(nOffRows);
-
-      casacore::Vector<casacore::uInt> offsetSortedIV(nOffRows);
-      casacore::GenSortIndirect<casacore::Double>::sort(offsetSortedIV,offsetTime);
-      for(casacore::uInt i=0; i<nOffRows; i++){ // necessary for type conversion
-	offsetSortedI[i] = (size_t) offsetSortedIV(i); 
+      offsetOfRow.assign(nwvrrows, noOffset);
+#pragma omp parallel for
+      for(long i=0; i<(long)nwvrrows; ++i)
+      {
+	const OffsetIndex::const_iterator o=offsetIndex.find(std::make_pair((double)w_times(i), (int)w_a1(i)));
+	if(o!=offsetIndex.end())
+	  offsetOfRow[i]=o->second;
       }
     }
-
-    //size_t offsetIndex=0;
-    size_t offI=0;
-    size_t offRow=0;
-    double prevtime=0;
-
-    for(size_t ii=0; ii<nrows; ++ii)
+    size_t nmissingOffset=0, nusedData=0;
+
+    // Second pass: the data of the unflagged rows at the selected
+    // times. Each row is placed by its time so the rows do not need
+    // to be visited in time order. The blocks are decoded in parallel
+    // and merged in row order, so that the result does not depend on
+    // the number of threads. The rows of the time points which are
+    // left out are only checked for the statistics of unflagged data.
+#pragma omp parallel for ordered schedule(dynamic)
+    for(long bi=0; bi<nblocks; ++bi)
     {
-      size_t i = sortedI[ii];
-
-      if (a1(i) == a2(i) and 
-	  dsc_ids.count(indsc_id(i)) > 0)
+      const size_t b=bi*loadBlockRows;
+      const size_t n=std::min(loadBlockRows, nwvrrows-b);
+
+      // Per row: index of the time stamp (ntimes if not selected),
+      // whether the sky temperatures are usable, and the sky
+      // temperatures
+      std::vector<size_t> counter(n, ntimes);
+      std::vector<char> good(n, 0);
+      std::vector<double> tsky(4*n, 0.);
+      bool ok=true;
+
+      try
       {
-
-	if(haveOffsets){
-	  offI = offsetSortedI[offRow];
-	  ++offRow;
-	}
-
-	int newtimestamp = 0;
-	if(c_times(i)>prevtime)
+	bool anyUnflagged=false;
+	for(size_t j=0; j<n; ++j)
 	{
-	  prevtime = c_times(i); 
-	  newtimestamp = 1;
+	  const double t = w_times(b+j);
+	  const std::vector<double>::const_iterator ti=std::lower_bound(times.begin(), times.end(), t);
+	  if(ti!=times.end() && *ti==t)
+	  {
+	    counter[j]=ti-times.begin();
+	    anyUnflagged=anyUnflagged || !w_flagged[b+j];
+	  }
 	}
-	
-	if(c_times(i)==times[counter+newtimestamp]) // there is data for this timestamp
-	{
 
-	  if(newtimestamp==1)
+	if(anyUnflagged)
+	{
+	  casacore::Array<casacore::Complex> data;
+#pragma omp critical(LibAIR2_wvrtable)
+	  data.reference(datacol.getColumnRange(casacore::Slicer(casacore::IPosition(1, b),
+								 casacore::IPosition(1, n))));
+	  const size_t cellsize=data.nelements()/n;
+	  casacore::Bool deleteData;
+	  const casacore::Complex *pdata=data.getStorage(deleteData);
+
+	  for(size_t j=0; j<n; ++j)
 	  {
-	    ++counter;
-	  }
+	    const size_t i=b+j;
+	    if(counter[j]==ntimes || w_flagged[i])
+	      continue;
 
-	  ++(ntotal[a1(i)]);
+	    // The first four values of the cell are the WVR channels
+	    const casacore::Complex *a=pdata+j*cellsize;
+	    const size_t offI = haveOffsets ? offsetOfRow[i] : noOffset;
 
-	  casacore::Array<casacore::Bool> fl;
-	  inflags.get(i, fl, ::casacore::True);
- 
-	  if(casacore::allEQ(casacore::False, inflags(i))) // i.e. not flagged
-	  {
-	    casacore::Array<std::complex<float> > a;
-	    indata.get(i,a, casacore::True);
 	    bool tobsbad=false;
-	    bool matchingOffset=true;
-	    
-	    if(haveOffsets){
-	      if(offsetTime(offI) != c_times(i)){
-		std::cerr << "WARNING: time disagreement: j i (offsetTime(j) - c_times(i)) "
-			  << offI << " " << i << " " << offsetTime(offI) - c_times(i)
-			  << std::endl;
-		matchingOffset=false;
-	      }
-	      if(offsetAnts(offI) != a1(i)){
-		std::cerr << "WARNING: antenna mismatch: j i offsetAnts(j) a1(i) "
-			  << offI << " " << i << " " << offsetAnts(offI) << " " << a1(i)
-			  << std::endl;
-		matchingOffset=false;
-	      }
-	    }
-
 	    for(size_t k=0; k<4; ++k)
-            {
-	      casacore::Double rdata = a(casacore::IPosition(2,k,0)).real();
-		
-	      if(haveOffsets && matchingOffset){
+	    {
+	      casacore::Double rdata = a[k].real();
+	      if(offI!=noOffset){
 		rdata -= offsets(k, offI);
 	      }
-
 	      if(2.7<rdata and rdata<300.){
-		res->set(counter,
-			 a1(i),
-			 k,
-			 rdata);
+		tsky[4*j+k]=rdata;
 	      }
 	      else{
 		tobsbad=true;
 	      }
 	    }
-	    if(tobsbad){ // TObs outside permitted range
-	      for(size_t k=0; k<4; ++k){
-		res->set(counter, a1(i), k, 0.);
-	      }
-	    }
-	    else{ 
-	      nunflagged[a1(i)]++;
-	    }
+	    good[j]=!tobsbad;
 	  }
-	  else{ // flagged
+	  data.freeStorage(pdata, deleteData);
+	}
+      }
+      catch(...)
+      {
+	ok=false;
+#pragma omp critical(LibAIR2_wvrerror)
+	if(!loadError)
+	  loadError=std::current_exception();
+      }
+
+#pragma omp ordered
+      if(ok)
+      {
+	for(size_t j=0; j<n; ++j)
+	{
+	  const size_t i=b+j;
+	  if(counter[j]==ntimes) // no data for this timestamp
+	    continue;
+	  const int ant = w_a1(i);
+
+	  ++(ntotal[ant]);
+
+	  if(!w_flagged[i]){
+	    ++nusedData;
+	    if(haveOffsets && offsetOfRow[i]==noOffset)
+	      ++nmissingOffset;
+	  }
+
+	  // flagged data and TObs outside the permitted range are set to zero
+	  if(keptIndex[counter[j]]!=ntimes){
 	    for(size_t k=0; k<4; ++k){
-	      res->set(counter, a1(i), k, 0.);
+	      res->set(keptIndex[counter[j]], ant, k, good[j] ? tsky[4*j+k] : 0.);
 	    }
 	  }
-	} // end if c_times ...
+	  if(good[j]){ 
+	    nunflagged[ant]++;
+	  }
+	}
       }
-    } // end for ii
+    }
+    if(loadError)
+      std::rethrow_exception(loadError);
+
+    if(nmissingOffset>0){
+      std::cout << "WARNING: no offsets found for " << nmissingOffset << " of " << nusedData
+		<< " unflagged WVR data points; these are used without offset" << std::endl;
+      std::cerr << "WARNING: no offsets found for " << nmissingOffset << " of " << nusedData
+		<< " unflagged WVR data points; these are used without offset" << std::endl;
+    }
 
     bool allFlagged=true;
     for(AntSet::iterator it=wvrants.begin(); it != wvrants.end(); it++)
@@ -15,9 +15,11 @@
 #define _LIBAIR_CASAWVR_MSWVRDATA_HPP__
 
 #include <set>
+#include <map>
 #include <vector>
 
 #include "../src/apps/antennautils.hpp"
+#include "msutils.hpp"
 #include <ms/MeasurementSets/MeasurementSet.h>
 
 namespace LibAIR2 {
@@ -82,25 +84,120 @@ namespace LibAIR2 {
   /** Time points, states, and field IDs at which WVR data have been
       recorded
 
+      \param unflaggedTimes Sorted times at which there are unflagged
+      WVR data in the first of the WVR data descriptions
+
    */
   void WVRTimeStatePoints(const casacore::MeasurementSet &ms,
+			  const MSScanIndex &idx,
 			  std::vector<double> &times,
 			  std::vector<size_t> &states,
 			  std::vector<size_t> &field,
 			  std::vector<size_t> &source,
 			  const std::vector<int> &wvrspws,
-			  const std::vector<size_t>& sortedI);
+			  const std::vector<double> &unflaggedTimes);
+
+  /** \brief Time-sorted pointing directions of each antenna
+
+      Built from the POINTING table with bulk column reads, keeping
+      only the samples in a given time range plus, for each antenna,
+      the nearest sample on either side of it.
+   */
+  class PointingIndex {
+
+    struct AntPointing {
+      std::vector<double> time, az, el;
+    };
+
+    std::map<int, AntPointing> ants;
+
+  public:
+
+    /** 
+	\param tmin, tmax The time range for which the pointing is
+	needed
+     */
+    PointingIndex(const casacore::MeasurementSet &ms,
+		  double tmin,
+		  double tmax);
+
+    /// Antennas with pointing data in the time range
+    AntSet antennas() const;
+
+    bool has(int ant) const;
+
+    /** Pointing direction of antenna ant at time t
+
+	\param interpolate If false, use the first sample at or after
+	t, otherwise interpolate linearly between the samples on
+	either side of t
+
+	Beyond the ends of the data the closest sample is used.
+     */
+    void lookup(int ant,
+		double t,
+		bool interpolate,
+		double &az,
+		double &el) const;
+
+  };
+
+  /** Get the pointing of a reference antenna, the lowest numbered of
+      wvrants with pointing data, at each time
+
+      \returns false if the POINTING table could not be used
+   */
+  bool WVRNearestPointing(const casacore::MeasurementSet &ms,
+			  const std::vector<double> &time,
+			  const AntSet &wvrants,
+			  bool interpolate,
+			  std::vector<double> &az,
+			  std::vector<double> &el);
+
+  /** Calculate the AZ and EL of the field being observed at each
+      time, as seen from antenna 0
+
+      \param gridstep If positive, do the conversion only at the
+      multiples of this time step (in seconds), caching the results per
+      field, and interpolate linearly to the requested times. The
+      estimated maximum interpolation error is printed. If zero or
+      negative, convert at each time.
+   */
+  void WVRFieldAZEl(const casacore::MeasurementSet &ms,
+		    const std::vector<double> &time,
+		    const std::vector<size_t> &fields,
+		    std::vector<double> &az,
+		    std::vector<double> &el,
+		    double gridstep=10.);
 
   /** Load all WVR data from a measurment set
+
+      \param idx The time-sorted index of the main table, see
+      buildScanIndex
+
+      \param interppointing Interpolate the POINTING table to the
+      WVR time stamps rather than using the next sample
+
+      \param fieldtabstep Time step of the AZ/EL computation from
+      the FIELD table, see WVRFieldAZEl
+
+      \param states If given, only the time points in these states
+      (e.g., skyStateIDs) are returned, as filterState would do, but
+      without holding the data of the other states in memory. The
+      fraction of unflagged data used for flagging antennas is still
+      computed from all states.
       
    */
   InterpArrayData *loadWVRData(const casacore::MeasurementSet &ms,
+			       const MSScanIndex &idx,
 			       const std::vector<int>& spws, 
-			       std::vector<size_t> &sortedI,
 			       std::set<int> &flaggedantsInMain,
 			       double requiredUnflaggedFraction=0.8,
 			       bool usepointing=true,
-			       std::string offsetstable="");
+			       std::string offsetstable="",
+			       bool interppointing=false,
+			       double fieldtabstep=10.,
+			       const std::set<size_t> *states=NULL);
 
 }
 
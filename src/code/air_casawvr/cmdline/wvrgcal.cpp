@@ -12,12 +12,18 @@
    measurement set, computes the predicted complex gain of each
    antenna as a function of time from these WVR data and then writes
    these solutions out to a CASA gain table. 
+
+   The program itself is in wvrgcalmain.cpp, the driver here is also
+   called in-process by the Python task via wvrgcalmodule.cpp.
    
 */
 
 
 #include <iostream>
+#include <cmath>
 #include <numeric>
+#include <sstream>
+#include <iomanip>
 
 #include <boost/program_options.hpp>
 #include <boost/scoped_ptr.hpp>
@@ -45,8 +51,12 @@
 #include "../src/apps/dtdlcoeffs.hpp"
 #include "../src/apps/almaresults.hpp"
 #include "../src/apps/segmentation.hpp"
+#include "../src/apps/wvrextract.hpp"
+#include "../src/apps/almaopts.hpp"
+#include "../src/tbemulator.hpp"
 #include "../src/libair_main.hpp"
 
+#include "wvrgcal.hpp"
 #include "wvrgcalerrors.hpp"
 #include "wvrgcalfeedback.hpp"
 
@@ -123,6 +133,48 @@ bool checkPars(const boost::program_options::variables_map &vm)
     return true;
   }
 
+  if (vm["smoothwvrtype"].as<std::string>()!="mean" and vm["smoothwvrtype"].as<std::string>()!="median")
+  {
+    warnMsg("smoothwvrtype parameter must be either mean or median");
+    return true;
+  }
+
+  if (vm.count("smoothtime") and vm["smoothtime"].as<double>() <= 0)
+  {
+    warnMsg("smoothtime parameter must be greater than 0");
+    return true;
+  }
+
+  if (vm["smoothtype"].as<std::string>()!="mean" and vm["smoothtype"].as<std::string>()!="median")
+  {
+    warnMsg("smoothtype parameter must be either mean or median");
+    return true;
+  }
+
+  if (vm["retcachetol"].as<double>() < 0 or vm["retcacheeltol"].as<double>() < 0)
+  {
+    warnMsg("retcachetol and retcacheeltol parameters must be 0. or greater");
+    return true;
+  }
+
+  if (vm["retcachesize"].as<int>() < 1)
+  {
+    warnMsg("retcachesize parameter must be 1 or greater");
+    return true;
+  }
+
+  if (vm["retrieval"].as<std::string>()!="nested" and vm["retrieval"].as<std::string>()!="map")
+  {
+    warnMsg("retrieval parameter must be either nested or map");
+    return true;
+  }
+
+  if (vm["nsztol"].as<double>() < 0 or vm["nsztol"].as<double>() >= 1)
+  {
+    warnMsg("nsztol parameter must be 0. or greater and less than 1.");
+    return true;
+  }
+
   if (vm.count("maxdistm") and vm["maxdistm"].as<double>() < 1)
   {
     warnMsg("maxdistm parameter must be 0. or greater");
@@ -325,6 +377,11 @@ void flagInterp(const casacore::MeasurementSet &ms,
   LibAIR2::AntSet wvrflag_s(wvrflag.begin(), 
 			   wvrflag.end());
 
+  // The weights of all antennas to be interpolated, applied together
+  // below. The antennas interpolated from are never in wvrflag, so
+  // the order does not matter.
+  LibAIR2::AntWeightMatrix weights;
+
   for(LibAIR2::AntSet::const_iterator i=wvrflag.begin();
       i!=wvrflag.end(); 
       ++i)
@@ -336,24 +393,7 @@ void flagInterp(const casacore::MeasurementSet &ms,
 						 3,
 						 maxdist_m);
     if(near.size()>= static_cast<unsigned int>(minnumants)){
-      //LibAIR2::interpBadAntW(d, *i, near);
-      const LibAIR2::InterpArrayData::wvrdata_t &data(d.g_wvrdata());
-      for(size_t ii=0; ii<d.g_time().size(); ++ii){
-	for(size_t k=0; k < 4; ++k){
-	  double p=0;
-	  for(LibAIR2::AntSetWeight::const_iterator j=near.begin(); j!=near.end(); ++j){
-	    double thisData = data[ii][j->second][k];
-	    if(thisData>0){
-	      p+=thisData*j->first;
-	    }
-	    else{ // no good data; set solution to zero => will be flagged later
-	      p=0.;
-	      break;
-	    }
-	  }
-	  d.set(ii, *i, k, p);
-	}
-      }
+      weights[*i]=near;
     }
     else
     { 
@@ -374,6 +414,8 @@ void flagInterp(const casacore::MeasurementSet &ms,
       interpImpossibleAnts.insert(*i);
     }
   }
+
+  LibAIR2::interpBadAntsW(d, weights);
   
 }
 
@@ -444,19 +486,18 @@ void printExpectedPerf(const LibAIR2::ArrayGains &g,
 void statTimeMask(const casacore::MeasurementSet &ms,
 		  const boost::program_options::variables_map &vm,
 		  std::vector<std::pair<double, double> > &tmask,
-		  const std::vector<size_t> &sortedI,
+		  const LibAIR2::MSScanIndex &idx,
 		  const std::vector<int> &wvrspws)
 {
   std::vector<int> flds;
   std::vector<double> time;
   std::vector<int> src;
-  LibAIR2::fieldIDs(ms,
+  LibAIR2::fieldIDs(idx,
 		   time,
 		   flds,
-		   src,
-		   sortedI);
+		   src);
   std::vector<size_t> spws;
-  LibAIR2::dataSPWs(ms, spws, sortedI);
+  LibAIR2::dataSPWs(ms, spws, idx);
 
   if (vm.count("statfield") == 0 && vm.count("statsource") == 0)
   {
@@ -770,6 +811,29 @@ LibAIR2::AntSet NoWVRAnts(const LibAIR2::aname_t &an)
 }
 
 
+/** The options which determine the WVR data loaded from the MS, for
+    validating a WVR extract file
+ */
+static std::string extractParams(const boost::program_options::variables_map &vm,
+				 const std::vector<int> &wvrspws,
+				 const std::string &offsetstable)
+{
+  std::ostringstream os;
+  os << std::setprecision(17) << "wvrspw=";
+  for(size_t i=0; i<wvrspws.size(); ++i)
+    os << wvrspws[i] << ",";
+  os << " mingoodfrac=" << vm["mingoodfrac"].as<double>()
+     << " usefieldtab=" << vm.count("usefieldtab")
+     << " interppointing=" << vm.count("interppointing")
+     << " fieldtabstep=" << vm["fieldtabstep"].as<double>()
+     << " offsets=" << offsetstable;
+  if (offsetstable!="")
+  {
+    os << "@" << LibAIR2::tableStamp(offsetstable);
+  }
+  return os.str();
+}
+
 static void defineOptions(boost::program_options::options_description &desc,
 			  boost::program_options::positional_options_description &p)
 {
@@ -819,6 +883,15 @@ static void defineOptions(boost::program_options::options_description &desc,
     ("smooth",
      value<int>(),
      "Smooth WVR data by this many samples before applying the correction")
+    ("smoothwvrtype",
+     value<std::string>()->default_value("mean"),
+     "Type of smoothing used with smooth: mean or median")
+    ("smoothtime",
+     value<double>(),
+     "Smooth the gain solutions on this timescale (in seconds) before writing them out")
+    ("smoothtype",
+     value<std::string>()->default_value("mean"),
+     "Type of smoothing used with smoothtime: mean or median")
     ("scale",
      value<double>()->default_value(1.0),
      "Scale the entire phase correction by this factor")
@@ -833,6 +906,34 @@ static void defineOptions(boost::program_options::options_description &desc,
      "If the fraction of unflagged data for an antenna is below this value (0. to 1.), the antenna is flagged.")
     ("usefieldtab",
      "Derive the antenna pointing information from the FIELD table instead of the POINTING table.")
+    ("fieldtabstep",
+     value<double>()->default_value(10.0),
+     "With usefieldtab, compute the AZ/EL at this time step (s) and interpolate to the WVR time stamps; 0 computes them at every time stamp")
+    ("wvr-extract",
+     "Keep the loaded WVR data and the index of the main table in a sidecar file next to the MS (<ms>.wvrextract) and, in later runs with this option, read them from there instead of scanning the main table of the MS as long as the MS and the options for loading the data are unchanged")
+    ("interppointing",
+     "Interpolate the POINTING table linearly to the WVR time stamps instead of using the next pointing sample.")
+    ("retcache",
+     value<std::string>(),
+     "Keep the results of the water vapour retrievals in this directory and reuse them, also in later runs, for the same inputs")
+    ("retcachetol",
+     value<double>()->default_value(0.),
+     "Reuse the retrieval of an earlier input whose sky temperatures agree within this tolerance (K); 0 requires identical inputs")
+    ("retcacheeltol",
+     value<double>()->default_value(0.),
+     "Reuse the retrieval of an earlier input whose elevation agrees within this tolerance (deg); 0 requires identical inputs")
+    ("retcachesize",
+     value<int>()->default_value(100000),
+     "Maximum number of retrievals kept in the retcache directory; the least recently used are removed")
+    ("retrieval",
+     value<std::string>()->default_value("nested"),
+     "Method of the water vapour retrievals: nested (nested sampling of the posterior) or map (fit for the maximum of the posterior with a normal approximation around it, which is much faster; nested sampling is used where the approximation is poor)")
+    ("nsztol",
+     value<double>()->default_value(0.),
+     "Stop the nested sampling of a retrieval once the estimated evidence of the remaining prior volume is less than this fraction of the evidence accumulated so far, e.g. 1e-3; 0. to always take the full number of samples")
+    ("tbemulator",
+     value<std::string>(),
+     "Interpolate the model sky brightness in the retrievals from a table kept in this file, instead of computing it; the table is computed and written to the file if it does not exist or is for a different WVR characterisation")
     ("spw",
      value< std::vector<int> >(),
      "Only write out corrections for these SPWs.")
@@ -845,51 +946,24 @@ static void defineOptions(boost::program_options::options_description &desc,
     ("offsets",
      value<std::string>(),
      "Name of the optional input table containing the temperature offsets, e.g. generated by remove_cloud")
+    ("results-out",
+     value<std::string>(),
+     "Write the antenna statistics, retrieved coefficients and timings to this file in JSON format")
     ;
   p.add("ms", -1);
 }
 
-int main(int argc,  char* argv[])
+/** The processing once the command line has been checked; the
+    return value is the exit status of the program
+ */
+static int wvrgcalRun(const boost::program_options::variables_map &vm,
+		      int argc,
+		      char* argv[],
+		      LibAIR2::WVRGCalResults &results)
 {
-  using namespace boost::program_options;
-
-#if defined(CASA6)
-  casa::AsdmStMan::registerClass( );
-#endif
-
   int rval = -2;
 
-  options_description desc("Allowed options");
-  positional_options_description p;
-  defineOptions(desc, p);
-
-
-  variables_map vm;
-  store(command_line_parser(argc, argv).
-	options(desc).positional(p).run(), 
- 	vm);
-  notify(vm);
-
-  LibAIR2::printBanner(std::cout);
-
-
-  
-  if (vm.count("help"))
-  {
-    std::cout<<"Write out a gain table based on WVR data"
-      	     <<std::endl
-	     <<std::endl
-	     <<"GPL license -- you have the right to the source code. See COPYING"
-	     <<std::endl
-	     <<std::endl
-	     <<desc;
-    return 0;
-  }
-
-  if (checkPars(vm))
-  {
-    return -1;
-  }
+  LibAIR2::StageTimer timer(results);
 
   checkWarnPars(vm);
   std::vector<std::set<std::string> > tied=getTied(vm);
@@ -997,22 +1071,111 @@ int main(int argc,  char* argv[])
     return -1;
   }
 
+  // Time-sorted index of the main table, shared by all the steps
+  // below which need the time, field, state and data description metadata
+  LibAIR2::MSScanIndex scanidx;
+
+  // The WVR data as loaded from the MS and the retrievals of the
+  // first iteration; the problem-antenna iteration starts again from
+  // these rather than reloading the data and redoing all retrievals
+  boost::scoped_ptr<LibAIR2::InterpArrayData> rawd;
+  std::set<int> flaggedantsInMain; // the antennas totally flagged in the MS main table
+  LibAIR2::ALMAAbsRetRecords retrecords;
+
+  // A valid WVR extract holds both the WVR data and the index, so
+  // that the main table does not need to be read at all
+  const std::string extname=LibAIR2::wvrExtractName(msname);
+  std::string extstamp, extparams;
+  if (vm.count("wvr-extract"))
+  {
+    extstamp=LibAIR2::tableStamp(msname);
+    extparams=extractParams(vm, wvrspws, offsetstable);
+    rawd.reset(LibAIR2::readWVRExtract(extname, extstamp, extparams, flaggedantsInMain, scanidx));
+    if (rawd)
+    {
+      std::cout << "Using the WVR data and main table index in " << extname << std::endl;
+    }
+  }
+  if (!rawd)
+  {
+    LibAIR2::buildScanIndex(ms, scanidx);
+  }
+
+  // The tabulated model sky brightness used by the retrievals, if requested
+  boost::scoped_ptr<LibAIR2::TbEmulatorTable> tbemu;
+  if (vm.count("tbemulator"))
+  {
+    const std::string emuname=vm["tbemulator"].as<std::string>();
+    tbemu.reset(LibAIR2::TbEmulatorTable::read(emuname,
+					       LibAIR2::ALMAWVRCharacter()));
+    if (tbemu)
+    {
+      std::cerr<<"Read the sky brightness table from "<<emuname<<std::endl;
+    }
+    else
+    {
+      std::cerr<<"Computing the sky brightness table ... ";
+      tbemu.reset(new LibAIR2::TbEmulatorTable(LibAIR2::ALMAWVRCharacter()));
+      std::cerr<<"done!"<<std::endl;
+      try {
+	tbemu->write(emuname);
+      }
+      catch(const std::runtime_error &rE){
+	std::cerr<<"Warning: could not write the sky brightness table: "<<rE.what()<<std::endl;
+      }
+    }
+    const boost::array<double, 4> &emuerr=tbemu->g_maxError();
+    std::cerr<<"Largest interpolation error of the table in each channel (K): ";
+    for(size_t k=0; k<4; ++k)
+      std::cerr<<emuerr[k]<<" ";
+    std::cerr<<std::endl;
+  }
+
+  LibAIR2::ALMARetOpts retopts;
+  if (vm["retrieval"].as<std::string>()=="map")
+    retopts.method=LibAIR2::ALMARetOpts::MAPLaplace;
+  retopts.Ztol=vm["nsztol"].as<double>();
+
+  LibAIR2::ALMAAbsRetCache retcache(vm["retcachetol"].as<double>(),
+				    vm["retcacheeltol"].as<double>()/180.*M_PI,
+				    vm.count("retcache") ? vm["retcache"].as<std::string>() : std::string(),
+				    vm["retcachesize"].as<int>(),
+				    (tbemu ? tbemu->tag() : std::string())+
+				    (retopts.method==LibAIR2::ALMARetOpts::MAPLaplace ? "map" : "")+
+				    (retopts.Ztol>0 ? "ztol"+boost::lexical_cast<std::string>(retopts.Ztol) : ""));
+
   int iterations = 0;
 
   while(rval<0 && iterations<2){
 
      iterations++;
 
-     std::vector<size_t> sortedI; // to be filled with the time-sorted row number index
-     std::set<int> flaggedantsInMain; // the antennas totally flagged in the MS main table
-     boost::scoped_ptr<LibAIR2::InterpArrayData> d (LibAIR2::loadWVRData(ms,
-									 wvrspws,
-									 sortedI, 
-									 flaggedantsInMain,
-									 vm["mingoodfrac"].as<double>(),
-									 vm.count("usefieldtab")==0,
-									 offsetstable)
-						   );
+     if (!rawd)
+     {
+       rawd.reset(LibAIR2::loadWVRData(ms,
+				       scanidx,
+				       wvrspws,
+				       flaggedantsInMain,
+				       vm["mingoodfrac"].as<double>(),
+				       vm.count("usefieldtab")==0,
+				       offsetstable,
+				       vm.count("interppointing")>0,
+				       vm["fieldtabstep"].as<double>(),
+				       &useID));
+       if (vm.count("wvr-extract"))
+       {
+	 try {
+	   LibAIR2::writeWVRExtract(extname, extstamp, extparams, *rawd, flaggedantsInMain, scanidx);
+	   std::cout << "Wrote the WVR data to " << extname << std::endl;
+	 }
+	 catch(const std::exception &e) {
+	   std::cout << "WARNING: " << e.what() << std::endl;
+	   std::cerr << "WARNING: " << e.what() << std::endl;
+	 }
+       }
+       timer.stage("load");
+     }
+     boost::scoped_ptr<LibAIR2::InterpArrayData> d (new LibAIR2::InterpArrayData(*rawd));
 
      // For debug purposes, print the loaded WVR data: 
      // for(size_t j=0; j<d->g_time().size(); ++j)
@@ -1020,10 +1183,10 @@ int main(int argc,  char* argv[])
      // 	for(size_t i=0; i < ms.antenna().nrow(); ++i)
      // 	  {
      // 	    std::cout << "row ant data " << j << " " << i << " "
-     // 		      << d->g_wvrdata()[j][i][0] << " "
-     // 		      << d->g_wvrdata()[j][i][1] << " " 
-     // 		      << d->g_wvrdata()[j][i][2] << " "
-     // 		      << d->g_wvrdata()[j][i][3] << std::endl; 
+     // 		      << d->g_tsky(j, i, 0) << " "
+     // 		      << d->g_tsky(j, i, 1) << " " 
+     // 		      << d->g_tsky(j, i, 2) << " "
+     // 		      << d->g_tsky(j, i, 3) << std::endl; 
      // 	  }
      // }
      
@@ -1035,11 +1198,10 @@ int main(int argc,  char* argv[])
      
      if (vm.count("smooth"))
      {
-	smoothWVR(*d, vm["smooth"].as<int>());
+	smoothWVR(*d, vm["smooth"].as<int>(),
+		  vm["smoothwvrtype"].as<std::string>()=="median" ? LibAIR2::WVRSmoothMedian : LibAIR2::WVRSmoothMean);
      }
      
-     d.reset(LibAIR2::filterState(*d, useID));
-
      LibAIR2::AntSet interpImpossibleAnts;
 
      // Flag and interpolate
@@ -1049,6 +1211,7 @@ int main(int argc,  char* argv[])
 		vm["maxdistm"].as<double>(),
 		vm["minnumants"].as<int>(),
 		interpImpossibleAnts);
+     timer.stage("flag/interpolate");
 
      // Determine the reference antenna for dTdL calculation
      int refant = -1; 
@@ -1122,11 +1285,10 @@ int main(int argc,  char* argv[])
 	   std::vector<int> flds;
 	   std::vector<double> time;
 	   std::vector<int> src;
-	   LibAIR2::fieldIDs(ms, 
+	   LibAIR2::fieldIDs(scanidx,
 			    time,
 			    flds,
-			    src,
-			    sortedI);
+			    src);
 	   try{
 	     std::vector<std::set<size_t> >  tiedi=tiedIDs(tied, ms);
 	     
@@ -1205,7 +1367,11 @@ int main(int argc,  char* argv[])
 	try {
 	   rlist=LibAIR2::doALMAAbsRet(inp,
 				       fb,
-				       problemAnts);
+				       problemAnts,
+				       &retrecords,
+				       &retcache,
+				       tbemu.get(),
+				       retopts);
 	}
 	catch(const std::runtime_error rE){
 	   rval = 1;
@@ -1230,6 +1396,7 @@ int main(int argc,  char* argv[])
 	      }
 	      std::cerr	<< "Reiterating ..." << std::endl;
 	      std::cout	<< "Reiterating ..." << std::endl;
+	      timer.stage("retrieval");
 	      continue;
 	   }
 	   else{
@@ -1242,11 +1409,50 @@ int main(int argc,  char* argv[])
 	
 	std::cerr<<"done!"
 		 <<std::endl;
+	retcache.prune();
+
+	{
+	  size_t nsampled=0, nconverged=0, niter=0, nmap=0;
+	  BOOST_FOREACH(const LibAIR2::ALMAResBase &r, rlist)
+	  {
+	    if(r.stop==LibAIR2::ALMAResBase::MAPFit)
+	      ++nmap;
+	    else if(r.stop!=LibAIR2::ALMAResBase::NotRetrieved)
+	    {
+	      ++nsampled;
+	      niter+=r.niter;
+	      if(r.stop==LibAIR2::ALMAResBase::EvidenceConverged)
+		++nconverged;
+	    }
+	  }
+	  if(nsampled>0)
+	    std::cout<<"Nested sampling retrievals: "<<nsampled
+		     <<", of which "<<nconverged<<" stopped on convergence of the evidence"
+		     <<"; mean number of iterations "<<niter/nsampled<<std::endl;
+	  if(nmap>0)
+	    std::cout<<"MAP fit retrievals: "<<nmap<<std::endl;
+	}
 	
 	
 	std::cout<<"       Retrieved parameters      "<<std::endl
 		 <<"----------------------------------------------------------------"<<std::endl
 		 <<rlist<<std::endl;
+
+	results.segments.clear();
+	{
+	  LibAIR2::ALMAAbsInpL::const_iterator ii=inp.begin();
+	  boost::ptr_list<LibAIR2::ALMAResBase>::const_iterator ri=rlist.begin();
+	  for(size_t j=0; ri!=rlist.end(); ++j, ++ii, ++ri)
+	  {
+	    const bool seg=(j<fb.size());
+	    results.segments.push_back(LibAIR2::WVRGCalSegment(ii->time,
+							      seg ? fb[j].first : ii->time,
+							      seg ? fb[j].second : ii->time,
+							      ii->antno,
+							      ii->source,
+							      *ri));
+	  }
+	}
 	
 	if (vm.count("segsource"))
 	{
@@ -1268,6 +1474,7 @@ int main(int argc,  char* argv[])
 	}  
 	
      }
+     timer.stage("retrieval");
     
      try{
        g.calc(*d,
@@ -1278,6 +1485,7 @@ int main(int argc,  char* argv[])
        std::cerr << "Problem while calculating gains: " << x.what() << std::endl;
        return 1;
      }
+     timer.stage("gains");
 
      if (vm.count("sourceflag"))
      {
@@ -1287,7 +1495,7 @@ int main(int argc,  char* argv[])
      }
      
      std::vector<std::pair<double, double> > tmask;
-     statTimeMask(ms, vm, tmask, sortedI, wvrspws);
+     statTimeMask(ms, vm, tmask, scanidx, wvrspws);
      
      std::vector<double> pathRMS;
      g.pathRMSAnt(tmask, pathRMS);
@@ -1300,12 +1508,13 @@ int main(int argc,  char* argv[])
 		       *coeffs,
 		       pathDisc);
      
-       std::cout<<LibAIR2::AntITable(anames,
-				     wvrflag,
-				     nowvr,
-				     pathRMS,
-				     pathDisc,
-				     interpImpossibleAnts);
+       results.antinfo=LibAIR2::AntITable(anames,
+					  wvrflag,
+					  nowvr,
+					  pathRMS,
+					  pathDisc,
+					  interpImpossibleAnts);
+       std::cout<<results.antinfo;
        
        printExpectedPerf(g, 
 			 *coeffs,
@@ -1318,10 +1527,18 @@ int main(int argc,  char* argv[])
        return 1;
      }
      
+     timer.stage("statistics");
+
      if (vm.count("scale"))
      {
 	g.scale(vm["scale"].as<double>());
      }
+
+     if (vm.count("smoothtime"))
+     {
+	g.smooth(vm["smoothtime"].as<double>(),
+		 vm["smoothtype"].as<std::string>()=="median" ? LibAIR2::ArrayGains::SmoothMedian : LibAIR2::ArrayGains::SmoothMean);
+     }
      
      LibAIR2::MSSpec sp;
      loadSpec(ms, sciencespws, sp);
@@ -1339,6 +1556,7 @@ int main(int argc,  char* argv[])
 			      buildCmdLine(argc,
 					   argv),
 			      interpImpossibleAnts);
+     timer.stage("write");
 
 #ifdef BUILD_HD5
      LibAIR2::writeAntPath(g,
@@ -1348,5 +1566,59 @@ int main(int argc,  char* argv[])
   } // end while
 
 
+  return rval;
+}
+
+int LibAIR2::wvrgcalMain(int argc,
+			 char* argv[],
+			 LibAIR2::WVRGCalResults &results)
+{
+  using namespace boost::program_options;
+
+#if defined(CASA6)
+  casa::AsdmStMan::registerClass( );
+#endif
+
+  options_description desc("Allowed options");
+  positional_options_description p;
+  defineOptions(desc, p);
+
+
+  variables_map vm;
+  store(command_line_parser(argc, argv).
+	options(desc).positional(p).run(), 
+ 	vm);
+  notify(vm);
+
+  LibAIR2::printBanner(std::cout);
+
+
+  
+  if (vm.count("help"))
+  {
+    std::cout<<"Write out a gain table based on WVR data"
+      	     <<std::endl
+	     <<std::endl
+	     <<"GPL license -- you have the right to the source code. See COPYING"
+	     <<std::endl
+	     <<std::endl
+	     <<desc;
+    return 0;
+  }
+
+  if (checkPars(vm))
+  {
+    return -1;
+  }
+
+  const int rval=wvrgcalRun(vm, argc, argv, results);
+
+  if (vm.count("results-out"))
+  {
+    LibAIR2::writeResultsJSON(vm["results-out"].as<std::string>(),
+			      results,
+			      rval);
+  }
+
   return rval;
 }
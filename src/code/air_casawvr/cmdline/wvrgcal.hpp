@@ -0,0 +1,33 @@
+/**
+   Maintained by ESO since 2013.
+
+   This file is part of LibAIR and is licensed under GNU Public
+   License Version 2
+
+   \file wvrgcal.hpp
+
+   The wvrgcal driver as a function so that it can be called both from
+   the command line program and in-process from the Python task
+
+*/
+#ifndef _LIBAIR_CMDLINE_WVRGCAL__
+#define _LIBAIR_CMDLINE_WVRGCAL__
+
+#include "wvrgcalresults.hpp"
+
+namespace LibAIR2 {
+
+  /** Run wvrgcal with the command line given by argc/argv
+
+      \param res Filled with the results of the run; only meaningful
+      if the return value is zero
+
+      \returns The exit status of the command line program
+   */
+  int wvrgcalMain(int argc,
+		  char* argv[],
+		  WVRGCalResults &res);
+
+}
+
+#endif
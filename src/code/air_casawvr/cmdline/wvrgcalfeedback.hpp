@@ -52,6 +52,10 @@ namespace LibAIR2 {
   {
 
   public:
+    AntITable(void)
+    {
+    }
+
     AntITable(const aname_t &names,
 	      const LibAIR2::AntSet &flag,
 	      const LibAIR2::AntSet &nowvr,
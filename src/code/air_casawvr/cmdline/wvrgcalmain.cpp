@@ -0,0 +1,22 @@
+/**
+   Maintained by ESO since 2013.
+
+   This file is part of LibAIR and is licensed under GNU Public
+   License Version 2
+
+   \file wvrgcalmain.cpp
+
+   The wvrgcal command line program. See wvrgcal.cpp for the
+   implementation.
+
+*/
+
+#include "wvrgcal.hpp"
+
+int main(int argc,  char* argv[])
+{
+  LibAIR2::WVRGCalResults results;
+  return LibAIR2::wvrgcalMain(argc,
+			      argv,
+			      results);
+}
@@ -0,0 +1,287 @@
+/**
+   Maintained by ESO since 2013.
+
+   This file is part of LibAIR and is licensed under GNU Public
+   License Version 2
+
+   \file wvrgcalmodule.cpp
+
+   Python extension module _wvrgcal which runs wvrgcal in-process,
+   avoiding the process start-up and the parsing of the printed
+   output in the Python task.
+
+   The single function run(args) takes the command line arguments of
+   the wvrgcal program (without the program name) as a list of
+   strings and returns a dictionary with the exit status ("rval"), the
+   text which the program would have printed on standard output
+   ("log"), the columns of the antenna information table ("Name",
+   "WVR", "Flag", "RMS_um", "Disc_um"), the retrieved coefficients
+   ("segments") and the time spent in each stage ("timings"). As the
+   output is captured by redirecting std::cout, concurrent calls are
+   run one after the other.
+
+*/
+
+#include <Python.h>
+
+#include <string>
+#include <vector>
+#include <sstream>
+#include <iostream>
+#include <exception>
+#include <mutex>
+
+#include "wvrgcal.hpp"
+
+/** Redirect std::cout for the lifetime of this object
+
+    The buffer of std::cout is shared by the whole process, so while
+    the redirection is in place anything printed to std::cout by other
+    threads also ends up in os. Runs of wvrgcal are therefore
+    serialised with runMutex.
+*/
+class CoutRedirect {
+
+  std::streambuf *old;
+
+public:
+
+  CoutRedirect(std::ostream &os):
+    old(std::cout.rdbuf(os.rdbuf()))
+  {
+  }
+
+  ~CoutRedirect()
+  {
+    std::cout.rdbuf(old);
+  }
+
+};
+
+/// Held during each run, which is done with the GIL released
+static std::mutex runMutex;
+
+/// Append x to list and release it; returns -1 and sets the Python
+/// error if x is NULL or the append fails
+static int appendItem(PyObject *list, PyObject *x)
+{
+  if (x == NULL)
+    return -1;
+  int r=PyList_Append(list, x);
+  Py_DECREF(x);
+  return r;
+}
+
+/// Set d[key]=v and release v; returns -1 and sets the Python error if
+/// v is NULL or the assignment fails
+static int setItem(PyObject *d, const char *key, PyObject *v)
+{
+  if (v == NULL)
+    return -1;
+  int r=PyDict_SetItemString(d, key, v);
+  Py_DECREF(v);
+  return r;
+}
+
+static PyObject *antInfoList(const LibAIR2::AntITable &at,
+			     PyObject *(*conv)(const LibAIR2::AntennaInfo &))
+{
+  PyObject *res=PyList_New(0);
+  if (res == NULL)
+    return NULL;
+  for(LibAIR2::AntITable::const_iterator i=at.begin(); i!=at.end(); ++i)
+  {
+    if (appendItem(res, conv(*i)) < 0)
+    {
+      Py_DECREF(res);
+      return NULL;
+    }
+  }
+  return res;
+}
+
+static PyObject *aiName(const LibAIR2::AntennaInfo &ai)
+{
+  return PyUnicode_DecodeUTF8(ai.name.c_str(), ai.name.size(), "replace");
+}
+
+static PyObject *aiWVR(const LibAIR2::AntennaInfo &ai)
+{
+  return PyBool_FromLong(ai.haswvr);
+}
+
+static PyObject *aiFlag(const LibAIR2::AntennaInfo &ai)
+{
+  return PyBool_FromLong(ai.flag);
+}
+
+static PyObject *aiRMS(const LibAIR2::AntennaInfo &ai)
+{
+  return PyFloat_FromDouble(ai.pathRMS/1e-6);
+}
+
+static PyObject *aiDisc(const LibAIR2::AntennaInfo &ai)
+{
+  return PyFloat_FromDouble(ai.pathDisc/1e-6);
+}
+
+static PyObject *floatList(const boost::array<double, 4> &a)
+{
+  PyObject *res=PyList_New(0);
+  if (res == NULL)
+    return NULL;
+  for(size_t k=0; k<a.size(); ++k)
+  {
+    if (appendItem(res, PyFloat_FromDouble(a[k])) < 0)
+    {
+      Py_DECREF(res);
+      return NULL;
+    }
+  }
+  return res;
+}
+
+static PyObject *segmentDict(const LibAIR2::WVRGCalSegment &s)
+{
+  PyObject *d=PyDict_New();
+  if (d == NULL)
+    return NULL;
+  if (setItem(d, "time", PyFloat_FromDouble(s.time)) < 0 ||
+      setItem(d, "start", PyFloat_FromDouble(s.start)) < 0 ||
+      setItem(d, "end", PyFloat_FromDouble(s.end)) < 0 ||
+      setItem(d, "antenna", PyLong_FromSize_t(s.antno)) < 0 ||
+      setItem(d, "source", PyLong_FromSize_t(s.source)) < 0 ||
+      setItem(d, "evidence", PyFloat_FromDouble(s.ev)) < 0 ||
+      setItem(d, "c", PyFloat_FromDouble(s.c)) < 0 ||
+      setItem(d, "c_err", PyFloat_FromDouble(s.c_err)) < 0 ||
+      setItem(d, "dTdL", floatList(s.dTdL)) < 0 ||
+      setItem(d, "dTdL_err", floatList(s.dTdL_err)) < 0)
+  {
+    Py_DECREF(d);
+    return NULL;
+  }
+  return d;
+}
+
+static PyObject *segmentList(const std::vector<LibAIR2::WVRGCalSegment> &segs)
+{
+  PyObject *res=PyList_New(0);
+  if (res == NULL)
+    return NULL;
+  for(size_t i=0; i<segs.size(); ++i)
+  {
+    if (appendItem(res, segmentDict(segs[i])) < 0)
+    {
+      Py_DECREF(res);
+      return NULL;
+    }
+  }
+  return res;
+}
+
+static PyObject *timingDict(const std::vector<std::pair<std::string, double> > &t)
+{
+  PyObject *res=PyDict_New();
+  if (res == NULL)
+    return NULL;
+  for(size_t i=0; i<t.size(); ++i)
+  {
+    if (setItem(res, t[i].first.c_str(), PyFloat_FromDouble(t[i].second)) < 0)
+    {
+      Py_DECREF(res);
+      return NULL;
+    }
+  }
+  return res;
+}
+
+static PyObject *wvrgcal_run(PyObject * /*self*/, PyObject *args)
+{
+  PyObject *pyargs;
+  if (!PyArg_ParseTuple(args, "O!", &PyList_Type, &pyargs))
+    return NULL;
+
+  std::vector<std::string> sargs(1, "wvrgcal");
+  for(Py_ssize_t i=0; i<PyList_Size(pyargs); ++i)
+  {
+    PyObject *s=PyObject_Str(PyList_GetItem(pyargs, i));
+    if (s == NULL)
+      return NULL;
+    const char *c=PyUnicode_AsUTF8(s);
+    if (c == NULL)
+    {
+      Py_DECREF(s);
+      return NULL;
+    }
+    sargs.push_back(c);
+    Py_DECREF(s);
+  }
+  std::vector<char *> argv;
+  for(size_t i=0; i<sargs.size(); ++i)
+    argv.push_back(&sargs[i][0]);
+  argv.push_back(NULL);
+
+  std::ostringstream log;
+  LibAIR2::WVRGCalResults results;
+  int rval;
+
+  Py_BEGIN_ALLOW_THREADS
+  {
+    // Taken with the GIL released so that a thread waiting here does
+    // not block the one running
+    std::lock_guard<std::mutex> lock(runMutex);
+    CoutRedirect redirect(log);
+    try {
+      rval=LibAIR2::wvrgcalMain((int)sargs.size(),
+				&argv[0],
+				results);
+    }
+    catch(const std::exception &x)
+    {
+      // The stand-alone program aborts in this case
+      std::cerr<<"wvrgcal: "<<x.what()<<std::endl;
+      log<<"ERROR: "<<x.what()<<std::endl;
+      rval=134;
+    }
+  }
+  Py_END_ALLOW_THREADS
+
+  const std::string slog=log.str();
+  PyObject *res=PyDict_New();
+  if (res == NULL)
+    return NULL;
+  if (setItem(res, "rval", PyLong_FromLong(rval & 0xff)) < 0 ||
+      setItem(res, "log", PyUnicode_DecodeUTF8(slog.c_str(), slog.size(), "replace")) < 0 ||
+      setItem(res, "Name", antInfoList(results.antinfo, aiName)) < 0 ||
+      setItem(res, "WVR", antInfoList(results.antinfo, aiWVR)) < 0 ||
+      setItem(res, "Flag", antInfoList(results.antinfo, aiFlag)) < 0 ||
+      setItem(res, "RMS_um", antInfoList(results.antinfo, aiRMS)) < 0 ||
+      setItem(res, "Disc_um", antInfoList(results.antinfo, aiDisc)) < 0 ||
+      setItem(res, "segments", segmentList(results.segments)) < 0 ||
+      setItem(res, "timings", timingDict(results.timings)) < 0)
+  {
+    Py_DECREF(res);
+    return NULL;
+  }
+  return res;
+}
+
+static PyMethodDef wvrgcal_methods[] = {
+  {"run", wvrgcal_run, METH_VARARGS,
+   "run(args) -- run wvrgcal in-process with the given command line arguments"},
+  {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef wvrgcal_module = {
+  PyModuleDef_HEAD_INIT,
+  "_wvrgcal",
+  "In-process interface to the wvrgcal program",
+  -1,
+  wvrgcal_methods,
+  NULL, NULL, NULL, NULL
+};
+
+PyMODINIT_FUNC PyInit__wvrgcal(void)
+{
+  return PyModule_Create(&wvrgcal_module);
+}
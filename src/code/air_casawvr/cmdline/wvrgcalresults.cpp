@@ -0,0 +1,200 @@
+/**
+   Maintained by ESO since 2013.
+
+   This file is part of LibAIR and is licensed under GNU Public
+   License Version 2
+
+   \file wvrgcalresults.cpp
+
+*/
+
+#include <cmath>
+#include <cstdio>
+#include <fstream>
+#include <iomanip>
+#include <limits>
+#include <stdexcept>
+
+#include "wvrgcalresults.hpp"
+#include "../src/apps/almaresults.hpp"
+
+namespace LibAIR2 {
+
+  WVRGCalSegment::WVRGCalSegment(double time,
+				 double start,
+				 double end,
+				 size_t antno,
+				 size_t source,
+				 const ALMAResBase &r):
+    time(time),
+    start(start),
+    end(end),
+    antno(antno),
+    source(source),
+    ev(r.ev),
+    c(r.c),
+    c_err(r.c_err)
+  {
+    for(size_t k=0; k<4; ++k)
+    {
+      dTdL[k]=r.dTdL[k];
+      dTdL_err[k]=r.dTdL_err[k];
+    }
+  }
+
+  void WVRGCalResults::addTiming(const std::string &stage,
+				 double seconds)
+  {
+    for(size_t i=0; i<timings.size(); ++i)
+    {
+      if(timings[i].first == stage)
+      {
+	timings[i].second+=seconds;
+	return;
+      }
+    }
+    timings.push_back(std::make_pair(stage, seconds));
+  }
+
+  StageTimer::StageTimer(WVRGCalResults &res):
+    res(res),
+    start(std::chrono::steady_clock::now())
+  {
+  }
+
+  void StageTimer::stage(const std::string &s)
+  {
+    const std::chrono::steady_clock::time_point now=std::chrono::steady_clock::now();
+    res.addTiming(s,
+		  std::chrono::duration<double>(now-start).count());
+    start=now;
+  }
+
+  /// JSON has no representation for non-finite numbers; use the
+  /// extension understood by the Python json module
+  static void jsonNumber(std::ostream &os, double x)
+  {
+    if (std::isnan(x))
+      os<<"NaN";
+    else if (std::isinf(x))
+      os<<(x>0 ? "Infinity" : "-Infinity");
+    else
+      os<<x;
+  }
+
+  static void jsonString(std::ostream &os, const std::string &s)
+  {
+    os<<'"';
+    for(size_t i=0; i<s.size(); ++i)
+    {
+      const unsigned char c=s[i];
+      if (c<0x20)
+      {
+	// Control characters are not allowed unescaped in JSON strings
+	char buf[8];
+	std::snprintf(buf, sizeof(buf), "\\u%04x", c);
+	os<<buf;
+	continue;
+      }
+      if (c=='"' or c=='\\')
+	os<<'\\';
+      os<<s[i];
+    }
+    os<<'"';
+  }
+
+  static void jsonBool(std::ostream &os, bool b)
+  {
+    os<<(b ? "true" : "false");
+  }
+
+  static void jsonArray(std::ostream &os, const boost::array<double, 4> &a)
+  {
+    os<<"[";
+    for(size_t k=0; k<a.size(); ++k)
+    {
+      if (k>0)
+	os<<", ";
+      jsonNumber(os, a[k]);
+    }
+    os<<"]";
+  }
+
+  void writeResultsJSON(std::ostream &os,
+			const WVRGCalResults &r,
+			int rval)
+  {
+    const std::streamsize prec=os.precision(std::numeric_limits<double>::digits10+2);
+
+    os<<"{"<<std::endl
+      <<"  \"version\": 1,"<<std::endl
+      <<"  \"rval\": "<<rval<<","<<std::endl;
+
+    os<<"  \"antennas\": [";
+    for(AntITable::const_iterator i=r.antinfo.begin(); i!=r.antinfo.end(); ++i)
+    {
+      os<<(i==r.antinfo.begin() ? "" : ",")<<std::endl
+	<<"    {\"no\": "<<i->no<<", \"name\": ";
+      jsonString(os, i->name);
+      os<<", \"wvr\": ";
+      jsonBool(os, i->haswvr);
+      os<<", \"flag\": ";
+      jsonBool(os, i->flag);
+      os<<", \"rms_um\": ";
+      jsonNumber(os, i->pathRMS/1e-6);
+      os<<", \"disc_um\": ";
+      jsonNumber(os, i->pathDisc/1e-6);
+      os<<"}";
+    }
+    os<<std::endl<<"  ],"<<std::endl;
+
+    os<<"  \"segments\": [";
+    for(size_t i=0; i<r.segments.size(); ++i)
+    {
+      const WVRGCalSegment &s=r.segments[i];
+      os<<(i==0 ? "" : ",")<<std::endl
+	<<"    {\"time\": "<<s.time
+	<<", \"start\": "<<s.start
+	<<", \"end\": "<<s.end
+	<<", \"antenna\": "<<s.antno
+	<<", \"source\": "<<s.source
+	<<", \"evidence\": ";
+      jsonNumber(os, s.ev);
+      os<<", \"c\": ";
+      jsonNumber(os, s.c);
+      os<<", \"c_err\": ";
+      jsonNumber(os, s.c_err);
+      os<<", \"dTdL\": ";
+      jsonArray(os, s.dTdL);
+      os<<", \"dTdL_err\": ";
+      jsonArray(os, s.dTdL_err);
+      os<<"}";
+    }
+    os<<std::endl<<"  ],"<<std::endl;
+
+    os<<"  \"timings\": {";
+    for(size_t i=0; i<r.timings.size(); ++i)
+    {
+      os<<(i==0 ? "" : ",")<<std::endl<<"    ";
+      jsonString(os, r.timings[i].first);
+      os<<": "<<r.timings[i].second;
+    }
+    os<<std::endl<<"  }"<<std::endl
+      <<"}"<<std::endl;
+
+    os.precision(prec);
+  }
+
+  void writeResultsJSON(const std::string &fname,
+			const WVRGCalResults &r,
+			int rval)
+  {
+    std::ofstream ofs(fname.c_str());
+    if (!ofs)
+    {
+      throw std::runtime_error("Could not open results file "+fname+" for writing");
+    }
+    writeResultsJSON(ofs, r, rval);
+  }
+
+}
@@ -0,0 +1,111 @@
+/**
+   Maintained by ESO since 2013.
+
+   This file is part of LibAIR and is licensed under GNU Public
+   License Version 2
+
+   \file wvrgcalresults.hpp
+
+   Machine-readable results of a wvrgcal run
+
+*/
+#ifndef _LIBAIR_CMDLINE_WVRGCALRESULTS__
+#define _LIBAIR_CMDLINE_WVRGCALRESULTS__
+
+#include <string>
+#include <vector>
+#include <utility>
+#include <chrono>
+#include <iosfwd>
+
+#include <boost/array.hpp>
+
+#include "wvrgcalfeedback.hpp"
+
+namespace LibAIR2 {
+
+  // Forward declarations
+  struct ALMAResBase;
+
+  /** \brief The retrieved dT/dL coefficients for one segment of the
+      observation
+   */
+  struct WVRGCalSegment {
+    /// Time of the WVR data the retrieval was made from
+    double time;
+    /// Time range to which the coefficients apply; equal to time if
+    /// the coefficients are interpolated in time (nsol)
+    double start, end;
+    /// Antenna whose WVR data were used
+    size_t antno;
+    /// Source observed, only meaningful with segsource
+    size_t source;
+    /// Bayesian evidence of the retrieval
+    double ev;
+    /// Water vapour column and its error
+    double c, c_err;
+    /// The coefficients and their errors in K/mm as in the
+    /// "Retrieved parameters" table
+    boost::array<double, 4> dTdL, dTdL_err;
+
+    WVRGCalSegment(double time,
+		   double start,
+		   double end,
+		   size_t antno,
+		   size_t source,
+		   const ALMAResBase &r);
+  };
+
+  /** \brief Results of a wvrgcal run which are of interest to the
+      caller beyond the gain table itself
+   */
+  struct WVRGCalResults {
+
+    /// Antenna/WVR information table of the final iteration
+    AntITable antinfo;
+
+    /// Retrieved coefficients of the final iteration
+    std::vector<WVRGCalSegment> segments;
+
+    /// Wall-clock time in seconds spent in each stage, in order
+    std::vector<std::pair<std::string, double> > timings;
+
+    /// Add the time spent in stage, accumulating if it is already
+    /// present (e.g., from the problem-antenna iteration)
+    void addTiming(const std::string &stage,
+		   double seconds);
+
+  };
+
+  /** \brief Measure the wall-clock time of a stage of the run
+   */
+  class StageTimer {
+
+    WVRGCalResults &res;
+    std::chrono::steady_clock::time_point start;
+
+  public:
+
+    StageTimer(WVRGCalResults &res);
+
+    /// Record the time since construction or the last call to
+    /// stage() as spent in stage s
+    void stage(const std::string &s);
+
+  };
+
+  /** Write the results as a JSON document
+   */
+  void writeResultsJSON(std::ostream &os,
+			const WVRGCalResults &r,
+			int rval);
+
+  /** Write the results as a JSON document to file fname
+   */
+  void writeResultsJSON(const std::string &fname,
+			const WVRGCalResults &r,
+			int rval);
+
+}
+
+#endif
@@ -8,6 +8,8 @@
 #include "almaabs.hpp"
 
 #include <iostream>
+#include <memory>
+#include <exception>
 #include <stdio.h>            /*** for sprintf(...) ***/
 #include <boost/format.hpp>
 #include <boost/foreach.hpp>
@@ -35,13 +37,19 @@ namespace LibAIR2 {
 
   ALMAAbsRet::ALMAAbsRet(const std::vector<double> &TObs,
 			 double el,
-			 const ALMAWVRCharacter &WVRChar):
+			 const ALMAWVRCharacter &WVRChar,
+			 const TbEmulatorTable *emu,
+			 const ALMARetOpts &opts):
     i(new iALMAAbsRet(TObs,
 		      el,
-		      WVRChar)),
+		      WVRChar,
+		      emu)),
     valid(true)
   {
-    if( ! i->sample()){
+    if(opts.method==ALMARetOpts::MAPLaplace && i->fitMAP()){
+      return;
+    }
+    if( ! i->sample(opts.Ztol)){
       valid = false;
     }
   }
@@ -52,6 +60,7 @@ namespace LibAIR2 {
 
   bool ALMAAbsRet::g_Res(ALMAResBase &res)
   {
+    i->g_Stop(res);
     if(valid){ 
       i->g_Pars(res);
       i->g_Coeffs(res);
@@ -132,7 +141,7 @@ namespace LibAIR2 {
     const size_t midpoint=static_cast<size_t>(d.g_time().size() *0.5);
     for(size_t k=0; k<4; ++k)
     {
-      TObs[k]=d.g_wvrdata()[midpoint][refant][k];
+      TObs[k]=d.g_tsky(midpoint, refant, k);
     }
     checkTObs(TObs);    
     el=d.g_el()[midpoint];
@@ -194,10 +203,11 @@ namespace LibAIR2 {
       }      
       a.antno=refant;
       for(size_t k=0; k<4; ++k)
-	a.TObs[k]=d.g_wvrdata()[row][refant][k];
+	a.TObs[k]=d.g_tsky(row, refant, k);
       a.el=d.g_el()[row];
       a.time=d.g_time()[row];
       a.state=d.g_state()[row];
+      a.source=d.g_source()[row];
       res.push_back(a);
     }
     return res;
@@ -236,7 +246,7 @@ namespace LibAIR2 {
       a.antno=refant;
       for(size_t k=0; k<4; ++k)
       {
-	a.TObs[k]=d.g_wvrdata()[row][refant][k];
+	a.TObs[k]=d.g_tsky(row, refant, k);
       }
       a.el=d.g_el()[row];
       a.time=d.g_time()[row];
@@ -248,19 +258,31 @@ namespace LibAIR2 {
   }
 
   dTdLCoeffsBase * 
-  SimpleSingle(const InterpArrayData &d, int refant)
+  SimpleSingle(const InterpArrayData &d,
+	       int refant,
+	       ALMAAbsRetCache *cache,
+	       const TbEmulatorTable *emu,
+	       const ALMARetOpts &opts)
   {
     std::vector<double>  TObs(4);
     double el, time;
     size_t state;
     getMidPointData(d, refant, TObs, el, time, state);
 
-    ALMAWVRCharacter wvrchar;
-    ALMAAbsRet ar(TObs, 
-		  M_PI/2.0,  
-		  wvrchar);
     ALMAResBase res;
-    ar.g_Res(res);
+    bool ok;
+    if (!cache || !cache->lookup(TObs, M_PI/2.0, ok, res))
+    {
+      ALMAWVRCharacter wvrchar;
+      ALMAAbsRet ar(TObs, 
+		    M_PI/2.0,  
+		    wvrchar,
+		    emu,
+		    opts);
+      ok=ar.g_Res(res);
+      if (cache)
+	cache->store(TObs, M_PI/2.0, ok, res);
+    }
 
     // Convert to units of K/meter
     std::vector<double> dTdL(4);
@@ -318,9 +340,25 @@ namespace LibAIR2 {
     
   }
 
+  static bool sameInput(const ALMAAbsInput &a,
+			const ALMAAbsInput &b)
+  {
+    for(size_t i=0; i<4; ++i)
+    {
+      if (a.TObs[i]!=b.TObs[i])
+	return false;
+    }
+    return a.antno==b.antno and a.el==b.el and a.time==b.time and
+      a.state==b.state and a.source==b.source;
+  }
+
   boost::ptr_list<ALMAResBase> doALMAAbsRet(ALMAAbsInpL &il,
 					    std::vector<std::pair<double, double> > &fb,
-					    AntSet& problemAnts)
+					    AntSet& problemAnts,
+					    ALMAAbsRetRecords *records,
+					    ALMAAbsRetCache *cache,
+					    const TbEmulatorTable *emu,
+					    const ALMARetOpts &opts)
   {
 
     problemAnts.clear();
@@ -336,28 +374,115 @@ namespace LibAIR2 {
 
     size_t count=0;
 
-    BOOST_FOREACH(const ALMAAbsInput &x, il)
+    ALMAAbsRetRecords newrecords;
+    size_t nreused=0;
+
+    // The inputs in order, with their checks and any result reused
+    // from the previous iteration
+    const std::vector<ALMAAbsInput> inputs(il.begin(), il.end());
+    const size_t n=inputs.size();
+    std::vector<std::string> tobsErr(n);
+    std::vector<const ALMAAbsRetRecord *> prev(n, (const ALMAAbsRetRecord *)NULL);
+    std::vector<ALMAAbsRetRecord> cached(n);
+    std::vector<char> fromcache(n, false);
+    size_t ncached=0;
+    for(size_t l=0; l<n; ++l)
     {
-      bool problematic = false;
-      std::vector<double>  TObs(4);
-      for(size_t i=0; i<4; ++i)
-        TObs[i]=x.TObs[i];
+      std::vector<double> TObs(inputs[l].TObs, inputs[l].TObs+4);
       try {
 	checkTObs(TObs);
       }
-      catch(const std::runtime_error rE){
+      catch(const std::runtime_error &rE){
+	tobsErr[l]=rE.what();
+      }
+      if(records)
+      {
+	for(ALMAAbsRetRecords::const_iterator r=records->begin(); r!=records->end(); ++r)
+	{
+	  if(sameInput(r->inp, inputs[l]))
+	  {
+	    prev[l]=&(*r);
+	    break;
+	  }
+	}
+      }
+      if(!prev[l] && cache && cache->lookup(TObs, inputs[l].el, cached[l].ok, cached[l].res))
+      {
+	fromcache[l]=true;
+	prev[l]=&cached[l];
+	++ncached;
+      }
+    }
+
+    // The retrievals are independent of each other: each builds its
+    // own model and its random number generators start from the same
+    // fixed seeds whatever the order, so they can be done in
+    // parallel. Nothing may be written to std::cout or std::cerr in
+    // this loop, as they may be redirected to a buffer which is not
+    // thread safe; messages are written in the bookkeeping below.
+    std::vector<std::unique_ptr<ALMAResBase> > ares(n);
+    std::vector<char> ok(n, false);
+    std::exception_ptr error;
+#pragma omp parallel for schedule(dynamic)
+    for(long l=0; l<(long)n; ++l)
+    {
+      try
+      {
+	ares[l].reset(new ALMAResBase);
+	if(prev[l])
+	{
+	  ok[l]=prev[l]->ok;
+	  static_cast<ALMARes_Basic &>(*ares[l])=prev[l]->res;
+	}
+	else
+	{
+	  std::vector<double> TObs(inputs[l].TObs, inputs[l].TObs+4);
+	  ALMAWVRCharacter wvrchar;
+	  ALMAAbsRet ar(TObs, 
+			inputs[l].el,  
+			wvrchar,
+			emu,
+			opts);
+	  ok[l]=ar.g_Res(*ares[l]);
+	}
+      }
+      catch(...)
+      {
+#pragma omp critical(LibAIR2_retrievalerror)
+	if(!error)
+	  error=std::current_exception();
+      }
+    }
+    if(error)
+      std::rethrow_exception(error);
+
+    // Bookkeeping in the order of the inputs
+    for(size_t l=0; l<n; ++l)
+    {
+      const ALMAAbsInput &x=inputs[l];
+      const std::vector<double> TObs(x.TObs, x.TObs+4);
+      bool problematic = false;
+      if(!tobsErr[l].empty()){
 	std::cout << std::endl << "WARNING: problem with Tobs of antenna " << x.antno
-		  << std::endl << "         LibAIR2::checkTObs: " << rE.what() << std::endl;
+		  << std::endl << "         LibAIR2::checkTObs: " << tobsErr[l] << std::endl;
 	std::cerr << std::endl << "WARNING: problem with Tobs of antenna " << x.antno
-		  << std::endl << "         LibAIR2::checkTObs: " << rE.what() << std::endl;
+		  << std::endl << "         LibAIR2::checkTObs: " << tobsErr[l] << std::endl;
 	problematic = true;
       }
-      ALMAWVRCharacter wvrchar;
-      ALMAAbsRet ar(TObs, 
-		    x.el,  
-		    wvrchar);
-      ALMAResBase *ares=new ALMAResBase;      
-      if(!ar.g_Res(*ares)){
+      if(ares[l]->stop==ALMAResBase::NoBetterPoint or
+	 ares[l]->stop==ALMAResBase::DuplicatePoint){
+	std::cout<<"Terminated after "<<ares[l]->niter<<std::endl;
+      }
+      if(prev[l] && !fromcache[l])
+	++nreused;
+      if(!prev[l] && cache)
+	cache->store(TObs, x.el, ok[l], *ares[l]);
+      ALMAAbsRetRecord rec;
+      rec.inp=x;
+      rec.ok=ok[l];
+      rec.res=*ares[l];
+      newrecords.push_back(rec);
+      if(!rec.ok){
 	std::cout << "WARNING: Bayesian evidence was zero for antenna " << x.antno << std::endl
 		  << "         TObs was " << TObs[0] << " " << TObs[1] << " " << TObs[2] << " " <<TObs[3] 
 		  << " K, elevation " << x.el/M_PI*180. << " deg" << std::endl;
@@ -366,7 +491,7 @@ namespace LibAIR2 {
 		  << " K, elevation " << x.el/M_PI*180. << " deg" << std::endl;
       }
       else{
-	res.push_back(ares);
+	res.push_back(ares[l].release());
 	newil.push_back(x);
 	if(fbFilled){
 	  newfb.push_back(fb[count++]);
@@ -395,6 +520,21 @@ namespace LibAIR2 {
     il = newil;
     fb = newfb;
 
+    if(records)
+    {
+      if(nreused>0)
+      {
+	std::cout << "Reused " << nreused << " of " << newrecords.size()
+		  << " retrievals from the previous iteration" << std::endl;
+      }
+      records->swap(newrecords);
+    }
+    if(ncached>0)
+    {
+      std::cout << "Took " << ncached << " of " << n
+		<< " retrievals from the retrieval cache" << std::endl;
+    }
+
     return res;
   }
 
@@ -535,12 +675,19 @@ namespace LibAIR2 {
 #endif 
     //ns->InitalS(new Minim::InitialRandom(200));
 
+    ns->Ztol=opts.Ztol;
     double evidence=ns->sample(3000);
+    nsStop(*ns, res);
+    if(evidence==0.)
+    {
+      std::cout << "Error: Cannot calculate dTdL Moments 1 and 2, evidence is zero." << std::endl;
+      std::cerr << "Error: Cannot calculate dTdL Moments 1 and 2, evidence is zero." << std::endl;
+    }
     /// The posterior 
     std::list<Minim::WPPoint> post;
     post=ns->g_post();
 
-    if (post.size() < 10000 )
+    if (post.size() < 10000 and ns->g_stop()!=Minim::NestedS::StopEvidence)
     {
       std::cout<<"Terminated after "<<post.size()
 	       <<std::endl;
@@ -564,20 +711,13 @@ namespace LibAIR2 {
     res.tau183=m1[3];
     res.tau183_err=std::pow(m2[3], 0.5);
 
-    dTdLMom1(post,
-	     *ns,
-	     m,
-	     evidence,
-	     1e-10,
-	     res.dTdL);
-
-    dTdLMom2(post,
-	     *ns,
-	     m,
-	     res.dTdL,
-	     evidence,
-	     1e-10,
-	     res.dTdL_err);
+    dTdLMom12(post,
+	      *ns,
+	      m,
+	      evidence,
+	      1e-10,
+	      res.dTdL,
+	      res.dTdL_err);
 
   }
 
@@ -22,6 +22,8 @@
 
 #include "alma_datastruct.h"
 #include "antennautils.hpp"
+#include "retcache.hpp"
+#include "almaopts.hpp"
 
 namespace LibAIR2 {
 
@@ -33,7 +35,7 @@ namespace LibAIR2 {
   class dTdLCoeffsBase;
   class InterpArrayData;
   class dTdLCoeffsSingleInterpolated;
-  struct ALMARetOpts;
+  class TbEmulatorTable;
 
   /**
    */
@@ -50,10 +52,17 @@ namespace LibAIR2 {
 
        \param WVRChar Characterisation of the WVR used to make this
        measurement
+
+       \param emu If not NULL, a table made for WVRChar from which the
+       model sky brightness is interpolated
+
+       \param opts Selects the retrieval method
      */
     ALMAAbsRet(const std::vector<double> &TObs,
 	       double el,
-	       const ALMAWVRCharacter &WVRChar);
+	       const ALMAWVRCharacter &WVRChar,
+	       const TbEmulatorTable *emu=NULL,
+	       const ALMARetOpts &opts=ALMARetOpts());
 
     virtual ~ALMAAbsRet();
 
@@ -110,12 +119,42 @@ namespace LibAIR2 {
 
   
 
+  /** \brief Outcome of the retrieval for one input, kept so that
+      the retrieval need not be repeated for an identical input
+   */
+  struct ALMAAbsRetRecord {
+    ALMAAbsInput inp;
+    /// False if the Bayesian evidence was zero
+    bool ok;
+    ALMARes_Basic res;
+  };
+
+  typedef std::vector<ALMAAbsRetRecord> ALMAAbsRetRecords;
+
   /**  Carry out the retrieval of coefficients form a list of inputs;
        remove the inputs which have zero Bayesian evidence from the list
+
+       \param records If not NULL, the retrievals recorded in it are
+       reused for identical inputs instead of being repeated. On
+       return it holds the records of all inputs of this call.
+
+       \param cache If not NULL, inputs not found in records are
+       looked up in it before retrieving, and new retrievals are added
+       to it
+
+       \param emu If not NULL, the retrievals use this table of the
+       model sky brightness, which must have been made for the nominal
+       WVR characteristics
+
+       \param opts Selects the retrieval method
    */
   boost::ptr_list<ALMAResBase> doALMAAbsRet(ALMAAbsInpL &il, 
 					    std::vector<std::pair<double, double> > &fb,
-					    LibAIR2::AntSet &problemAnts);
+					    LibAIR2::AntSet &problemAnts,
+					    ALMAAbsRetRecords *records=NULL,
+					    ALMAAbsRetCache *cache=NULL,
+					    const TbEmulatorTable *emu=NULL,
+					    const ALMARetOpts &opts=ALMARetOpts());
   
 
   /** \brief Calculate coefficients for phase correction from inputs
@@ -125,15 +164,21 @@ namespace LibAIR2 {
 		   boost::ptr_list<ALMAResBase> &r);
 
   /** Single retrieval for mid point of the observation
-   */
-  dTdLCoeffsBase * 
-  SimpleSingle(const InterpArrayData &d);  
 
+      \param cache If not NULL, looked up before retrieving; it must
+      have been made for the same emu and opts
 
-  /** Single retrieval for mid point of the observation
+      \param emu If not NULL, the sky brightness is interpolated from
+      this table
+
+      \param opts Selects the retrieval method
    */
   dTdLCoeffsBase * 
-  SimpleSingle(const InterpArrayData &d);
+  SimpleSingle(const InterpArrayData &d,
+	       int refant,
+	       ALMAAbsRetCache *cache=NULL,
+	       const TbEmulatorTable *emu=NULL,
+	       const ALMARetOpts &opts=ALMARetOpts());
 
   /** Single retrieval at mid-point, but fitting also for the
       continuum
@@ -7,10 +7,13 @@
    
 */
 #include <iostream>
+#include <cmath>
+#include <stdexcept>
 
 #include "almaabs_i.hpp"
 
 #include "../model_make.hpp"
+#include "../tbemulator.hpp"
 #include "../dtdltools.hpp"
 #include "bnmin1/src/nestedinitial.hxx"
 
@@ -20,12 +23,33 @@ namespace LibAIR2 {
   const double iALMAAbsRetLL::thermNoise=1.0;
   const size_t iALMAAbsRet::n_ss=200;
 
+  /// The flat priors of the retrieved parameters
+  static const struct {
+    const char *name;
+    double lo, hi;
+  } retPriors[3]={
+    {"n", 0, 10},
+    {"T", 250, 295},
+    {"P", 300, 550}
+  };
+
+  /// The model of the sky brightness, exact or from the table emu
+  static WVRAtmoQuantModel *mkWaterModel(const ALMAWVRCharacter &WVRChar,
+					 const TbEmulatorTable *emu)
+  {
+    if (emu)
+      return new TbEmulatorModel(*emu);
+    return mkSingleLayerWater(WVRChar,
+			      PartTable,
+			      AirCont);
+  }
+
   iALMAAbsRetLL::iALMAAbsRetLL(const std::vector<double> &TObs,
 			       double el,
-			       const ALMAWVRCharacter &WVRChar):
-    cm(new CouplingModel(mkSingleLayerWater(WVRChar,
-					    PartTable,
-					    AirCont))),
+			       const ALMAWVRCharacter &WVRChar,
+			       const TbEmulatorTable *emu):
+    cm(new CouplingModel(mkWaterModel(WVRChar,
+				      emu))),
     m(cm),
     ll(new AbsNormMeasure(m))
   {
@@ -40,19 +64,21 @@ namespace LibAIR2 {
 
   iALMAAbsRet::iALMAAbsRet(const std::vector<double> &TObs,
 			   double el,
-			   const ALMAWVRCharacter &WVRChar):
+			   const ALMAWVRCharacter &WVRChar,
+			   const TbEmulatorTable *emu):
     ls(TObs, 
        el, 
-       WVRChar),
+       WVRChar,
+       emu),
     pll(ls.ll),
-    evidence()
+    evidence(),
+    laplace(false)
   {
-    pll.AddPrior("n", 0, 10);
-    pll.AddPrior("T", 250, 295);
-    pll.AddPrior("P", 300, 550);
+    for(size_t j=0; j<3; ++j)
+      pll.AddPrior(retPriors[j].name, retPriors[j].lo, retPriors[j].hi);
   }
 
-  bool iALMAAbsRet::sample(void)
+  bool iALMAAbsRet::sample(double Ztol)
   {
     // Create starting set
     std::list<Minim::MCPoint> ss;
@@ -68,13 +94,10 @@ namespace LibAIR2 {
     // So far not obvious it is necessary to enable this
     //ns->InitalS(new Minim::InitialRandom(n_ss));
 
+    ns->Ztol=Ztol;
     evidence=ns->sample(10000);
     post=ns->g_post();
 
-    if (post.size() < 10000 )
-    {
-      std::cout<<"Terminated after "<<post.size()<<std::endl;
-    }
     if(evidence == 0.){
       return false;
     }
@@ -82,9 +105,280 @@ namespace LibAIR2 {
 
   }
 
+  /// Inverse of the symmetric 3x3 matrix a, row-major; returns false
+  /// if it is not positive definite to working precision
+  static bool invSym3(const boost::array<double, 9> &a,
+		      boost::array<double, 9> &res)
+  {
+    res[0]=a[4]*a[8]-a[5]*a[7];
+    res[1]=a[2]*a[7]-a[1]*a[8];
+    res[2]=a[1]*a[5]-a[2]*a[4];
+    const double det=a[0]*res[0]+a[3]*res[1]+a[6]*res[2];
+    // Relative to the product of the diagonal, so that the test does
+    // not depend on the units of the parameters
+    const double scale=a[0]*a[4]*a[8];
+    if (!(scale>0) || !(det>1e-12*scale))
+      return false;
+    res[3]=res[1];
+    res[4]=a[0]*a[8]-a[2]*a[6];
+    res[5]=a[2]*a[3]-a[0]*a[5];
+    res[6]=res[2];
+    res[7]=res[5];
+    res[8]=a[0]*a[4]-a[1]*a[3];
+    for(size_t i=0; i<9; ++i)
+      res[i]/=det;
+    return true;
+  }
+
+  /// Cholesky factor, lower triangular and row-major, of the
+  /// symmetric 3x3 matrix a; returns false if it is not positive
+  /// definite
+  static bool cholSym3(const boost::array<double, 9> &a,
+		       boost::array<double, 9> &res)
+  {
+    res.fill(0);
+    for(size_t j=0; j<3; ++j)
+    {
+      double d=a[j*3+j];
+      for(size_t k=0; k<j; ++k)
+	d-=res[j*3+k]*res[j*3+k];
+      if(!(d>0))
+	return false;
+      res[j*3+j]=std::sqrt(d);
+      for(size_t i=j+1; i<3; ++i)
+      {
+	double s=a[i*3+j];
+	for(size_t k=0; k<j; ++k)
+	  s-=res[i*3+k]*res[j*3+k];
+	res[i*3+j]=s/res[j*3+j];
+      }
+    }
+    return true;
+  }
+
+  /// Residuals of the model from the observations in units of the
+  /// noise
+  static void mapResiduals(const iALMAAbsRetLL &ls,
+			   std::vector<double> &r)
+  {
+    ls.m.eval(r);
+    for(size_t k=0; k<r.size(); ++k)
+      r[k]=(r[k]-ls.ll->obs[k])/ls.ll->thermNoise[k];
+  }
+
+  /// The dTdL coefficients of the model
+  static void mapdTdL(const iALMAAbsRetLL &ls,
+		      std::vector<double> &r)
+  {
+    ls.m.dTdL_ND(r);
+  }
+
+  /// Jacobian, row-major, of the values computed by f with respect to
+  /// the parameters p, by central differences with steps h
+  static void centralJacobian(const iALMAAbsRetLL &ls,
+			      void (*f)(const iALMAAbsRetLL &, std::vector<double> &),
+			      const boost::array<double *, 3> &p,
+			      const boost::array<double, 3> &h,
+			      std::vector<double> &J)
+  {
+    std::vector<double> fwd, back;
+    for(size_t j=0; j<3; ++j)
+    {
+      const double op=*p[j];
+      *p[j]=op+h[j];
+      f(ls, fwd);
+      *p[j]=op-h[j];
+      f(ls, back);
+      *p[j]=op;
+      J.resize(fwd.size()*3);
+      for(size_t k=0; k<fwd.size(); ++k)
+	J[k*3+j]=(fwd[k]-back[k])/(2*h[j]);
+    }
+  }
+
+  /// The parameters of the model in the order of retPriors
+  static void mapParams(iALMAAbsRetLL &ls,
+			boost::array<double *, 3> &p)
+  {
+    std::vector<Minim::DParamCtr> pars;
+    ls.m.AddParams(pars);
+    for(size_t j=0; j<3; ++j)
+    {
+      p[j]=NULL;
+      for(size_t i=0; i<pars.size(); ++i)
+	if(pars[i].name==retPriors[j].name)
+	  p[j]=pars[i].p;
+      if(!p[j])
+	throw std::runtime_error(std::string("No parameter ")+retPriors[j].name+" in the retrieval model");
+    }
+  }
+
+  /// Differentiation steps for the parameters
+  static boost::array<double, 3> mapSteps(void)
+  {
+    boost::array<double, 3> h;
+    for(size_t j=0; j<3; ++j)
+      h[j]=1e-4*(retPriors[j].hi-retPriors[j].lo);
+    return h;
+  }
+
+  bool iALMAAbsRet::fitMAP(void)
+  {
+    const size_t maxiter=100;
+    // Number of water columns tried for the start of the fit
+    const size_t nstart=21;
+
+    boost::array<double *, 3> p;
+    mapParams(ls, p);
+    const boost::array<double, 3> h=mapSteps();
+    for(size_t j=0; j<3; ++j)
+      *p[j]=0.5*(retPriors[j].lo+retPriors[j].hi);
+
+    // Start from the best of a coarse scan in the water column;
+    // starting from the middle of its prior the fit can run into the
+    // edge of the priors at small columns
+    std::vector<double> r, rnew, J;
+    double chi2=-1;
+    double n0=*p[0];
+    for(size_t i=0; i<nstart; ++i)
+    {
+      *p[0]=retPriors[0].lo+(retPriors[0].hi-retPriors[0].lo)*(i+0.5)/nstart;
+      mapResiduals(ls, rnew);
+      double c=0;
+      for(size_t k=0; k<rnew.size(); ++k)
+	c+=rnew[k]*rnew[k];
+      if(chi2<0 || c<chi2)
+      {
+	chi2=c;
+	n0=*p[0];
+	r.swap(rnew);
+      }
+    }
+    *p[0]=n0;
+
+    double lambda=1e-3;
+    bool converged=false;
+    for(size_t it=0; it<maxiter && !converged; ++it)
+    {
+      centralJacobian(ls, mapResiduals, p, h, J);
+      boost::array<double, 9> A;
+      boost::array<double, 3> g;
+      for(size_t i=0; i<3; ++i)
+      {
+	g[i]=0;
+	for(size_t k=0; k<r.size(); ++k)
+	  g[i]+=J[k*3+i]*r[k];
+	for(size_t j=0; j<3; ++j)
+	{
+	  A[i*3+j]=0;
+	  for(size_t k=0; k<r.size(); ++k)
+	    A[i*3+j]+=J[k*3+i]*J[k*3+j];
+	}
+      }
+
+      // Increase the damping until the step reduces chi^2; if no
+      // step does, the fit is at a minimum
+      while(true)
+      {
+	boost::array<double, 9> M=A, Minv;
+	for(size_t i=0; i<3; ++i)
+	  M[i*3+i]*=1+lambda;
+	if(lambda>1e10)
+	{
+	  converged=true;
+	  break;
+	}
+	if(!invSym3(M, Minv))
+	{
+	  lambda*=10;
+	  continue;
+	}
+	boost::array<double, 3> op;
+	bool smallstep=true;
+	for(size_t i=0; i<3; ++i)
+	{
+	  double d=0;
+	  for(size_t j=0; j<3; ++j)
+	    d-=Minv[i*3+j]*g[j];
+	  op[i]=*p[i];
+	  *p[i]=std::min(std::max(op[i]+d, retPriors[i].lo), retPriors[i].hi);
+	  if(std::fabs(*p[i]-op[i]) > 1e-8*(retPriors[i].hi-retPriors[i].lo))
+	    smallstep=false;
+	}
+	mapResiduals(ls, rnew);
+	double chi2new=0;
+	for(size_t k=0; k<rnew.size(); ++k)
+	  chi2new+=rnew[k]*rnew[k];
+	if(chi2new<=chi2)
+	{
+	  converged= smallstep || chi2-chi2new <= 1e-10*(1+chi2);
+	  chi2=chi2new;
+	  r.swap(rnew);
+	  lambda=std::max(lambda*0.1, 1e-12);
+	  break;
+	}
+	for(size_t i=0; i<3; ++i)
+	  *p[i]=op[i];
+	lambda*=10;
+      }
+    }
+    if(!converged)
+      return false;
+
+    // Covariance from the Jacobian at the maximum
+    centralJacobian(ls, mapResiduals, p, h, J);
+    boost::array<double, 9> A;
+    for(size_t i=0; i<3; ++i)
+      for(size_t j=0; j<3; ++j)
+      {
+	A[i*3+j]=0;
+	for(size_t k=0; k<r.size(); ++k)
+	  A[i*3+j]+=J[k*3+i]*J[k*3+j];
+      }
+    if(!invSym3(A, pcov))
+      return false;
+
+    // The normal approximation is poor if the priors cut it off
+    // within one standard deviation of the maximum along any of the
+    // directions given by the columns of the Cholesky factor of the
+    // covariance. This is the case for small water columns, where
+    // the posterior in T and P is far from normal.
+    boost::array<double, 9> L;
+    if(!cholSym3(pcov, L))
+      return false;
+    double V=1;
+    for(size_t j=0; j<3; ++j)
+    {
+      for(size_t c=0; c<3; ++c)
+      {
+	if(*p[j]-std::fabs(L[j*3+c]) < retPriors[j].lo ||
+	   *p[j]+std::fabs(L[j*3+c]) > retPriors[j].hi)
+	  return false;
+      }
+      pmap[j]=*p[j];
+      V*=retPriors[j].hi-retPriors[j].lo;
+    }
+
+    const double detcov=pcov[0]*(pcov[4]*pcov[8]-pcov[5]*pcov[7])
+      -pcov[1]*(pcov[3]*pcov[8]-pcov[5]*pcov[6])
+      +pcov[2]*(pcov[3]*pcov[7]-pcov[4]*pcov[6]);
+    evidence=std::exp(-ls.ll->lLikely())*std::pow(2*M_PI, 1.5)*std::sqrt(detcov)/V;
+    if(evidence == 0.)
+      return false;
+
+    laplace=true;
+    return true;
+  }
+
   void iALMAAbsRet::g_Pars(ALMAResBase &res)
   {
     res.ev=evidence;
+    if(laplace)
+    {
+      res.c=pmap[0];
+      res.c_err=std::sqrt(pcov[0]);
+      return;
+    }
 
     std::vector<double> m1(3), m2(3);
     moment1(post,
@@ -100,23 +394,69 @@ namespace LibAIR2 {
     res.c_err=std::pow(m2[0], 0.5);
   }
 
+  void iALMAAbsRet::g_Stop(ALMAResBase &r)
+  {
+    if(laplace)
+    {
+      r.stop=ALMAResBase::MAPFit;
+      r.niter=0;
+    }
+    else if(ns)
+      nsStop(*ns, r);
+  }
+
   void iALMAAbsRet::g_Coeffs(ALMAResBase &r)
   {
     r.ev=evidence;
-    dTdLMom1(post,
-	     *ns,
-	     ls.m,
-	     evidence,
-	     1e-10,
-	     r.dTdL);
-
-    dTdLMom2(post,
-	     *ns,
-	     ls.m,
-	     r.dTdL,
-	     evidence,
-	     1e-10,
-	     r.dTdL_err);
+    if(laplace)
+    {
+      // Linear propagation of the covariance of the parameters. As
+      // with the nested sampling, dTdL_err is the second moment.
+      boost::array<double *, 3> p;
+      mapParams(ls, p);
+      for(size_t j=0; j<3; ++j)
+	*p[j]=pmap[j];
+      std::vector<double> d, G;
+      mapdTdL(ls, d);
+      centralJacobian(ls, mapdTdL, p, mapSteps(), G);
+      for(size_t k=0; k<4; ++k)
+      {
+	r.dTdL[k]=d[k];
+	r.dTdL_err[k]=0;
+	for(size_t i=0; i<3; ++i)
+	  for(size_t j=0; j<3; ++j)
+	    r.dTdL_err[k]+=G[k*3+i]*pcov[i*3+j]*G[k*3+j];
+      }
+      return;
+    }
+    dTdLMom12(post,
+	      *ns,
+	      ls.m,
+	      evidence,
+	      1e-10,
+	      r.dTdL,
+	      r.dTdL_err);
+  }
+
+  void nsStop(const Minim::NestedS &ns,
+	      ALMAResBase &r)
+  {
+    switch(ns.g_stop())
+    {
+    case Minim::NestedS::StopNSamples:
+      r.stop=ALMAResBase::MaxSamples;
+      break;
+    case Minim::NestedS::StopNotBetter:
+      r.stop=ALMAResBase::NoBetterPoint;
+      break;
+    case Minim::NestedS::StopDuplicate:
+      r.stop=ALMAResBase::DuplicatePoint;
+      break;
+    case Minim::NestedS::StopEvidence:
+      r.stop=ALMAResBase::EvidenceConverged;
+      break;
+    }
+    r.niter=ns.g_nsampled();
   }
 
 
@@ -13,6 +13,7 @@
 #include <list>
 
 #include <boost/scoped_ptr.hpp>
+#include <boost/array.hpp>
 
 #include "bnmin1/src/nestedsampler.hxx"
 #include "bnmin1/src/priors.hxx"
@@ -44,9 +45,14 @@ namespace LibAIR2 {
     /// Representation of the measured values and errors
     AbsNormMeasure *ll;
 
+    /**
+       \param emu If not NULL, the sky brightness is interpolated from
+       this table instead of being computed
+     */
     iALMAAbsRetLL(const std::vector<double> &TObs,
 		  double el,
-		  const ALMAWVRCharacter &WVRChar);
+		  const ALMAWVRCharacter &WVRChar,
+		  const TbEmulatorTable *emu=NULL);
 
   };
 
@@ -68,6 +74,15 @@ namespace LibAIR2 {
 
     /// The nested sampler
     boost::scoped_ptr<Minim::NestedS> ns;
+
+    /// True if the results are from fitMAP rather than sample
+    bool laplace;
+
+    /// The parameters (n, T, P) at the maximum of the posterior
+    boost::array<double, 3> pmap;
+
+    /// Their covariance in the normal approximation, row-major
+    boost::array<double, 9> pcov;
     
 
     /// Number of points in the live set
@@ -75,9 +90,29 @@ namespace LibAIR2 {
 
     iALMAAbsRet(const std::vector<double> &TObs,
 		double el,
-		const ALMAWVRCharacter &WVRChar);
+		const ALMAWVRCharacter &WVRChar,
+		const TbEmulatorTable *emu=NULL);
 
-    bool sample(void); // returns false if evidence is zero
+    /** Sample the posterior by nested sampling
+
+	\param Ztol Convergence tolerance on the evidence, see
+	Minim::NestedS::Ztol
+
+	\returns false if the evidence is zero
+     */
+    bool sample(double Ztol=0);
+
+    /** Find the maximum of the posterior by a Levenberg-Marquardt
+	fit of n, T and P, and approximate the posterior around it by
+	a normal distribution with the covariance from the Jacobian
+	(the Laplace approximation)
+
+	\returns false if the fit did not converge, is at the edge of
+	the priors, or the normal distribution is not a good
+	approximation of the posterior; sample() should then be used
+	instead
+     */
+    bool fitMAP(void);
 
     // -------------- Retrieval of results ------------------
     
@@ -89,9 +124,19 @@ namespace LibAIR2 {
 	errors
     */
     void  g_Coeffs(ALMAResBase &r);
+
+    /** Get how the retrieval terminated
+     */
+    void  g_Stop(ALMAResBase &r);
     
   };
 
+  /** Record in r how the nested sampler ns stopped and the number of
+      samples it took
+   */
+  void nsStop(const Minim::NestedS &ns,
+	      ALMAResBase &r);
+
 
 }
 
@@ -12,7 +12,9 @@
 namespace LibAIR2 {
 
   ALMARetOpts::ALMARetOpts(void):
-    OSFPriors(false)
+    OSFPriors(false),
+    method(NestedSampling),
+    Ztol(0)
   {
   }
 
@@ -21,6 +21,25 @@ namespace LibAIR2 {
      */
     bool OSFPriors;
 
+    /// Methods of the water vapour retrieval of ALMAAbsRet
+    enum RetMethod {
+      /// Nested sampling of the posterior
+      NestedSampling,
+      /// Fit for the maximum of the posterior and approximate the
+      /// posterior around it by a normal distribution; nested
+      /// sampling is used when the fit is poorly conditioned
+      MAPLaplace
+    };
+
+    RetMethod method;
+
+    /** Nested sampling stops once the estimated evidence of the
+	remaining prior volume is less than this fraction of the
+	evidence accumulated so far; zero to always take the full
+	number of samples
+     */
+    double Ztol;
+
     ALMARetOpts(void);
     
 
@@ -16,7 +16,9 @@
 
 namespace LibAIR2 {
 
-  ALMAResBase::ALMAResBase(void)
+  ALMAResBase::ALMAResBase(void):
+    stop(NotRetrieved),
+    niter(0)
   {
     ev=-1;
     c=-1;
@@ -24,6 +24,29 @@ namespace LibAIR2 {
     public ALMARes_Basic 
   {
 
+    /// How the retrieval of these results terminated
+    enum RetStop {
+      /// No retrieval was made for these results, e.g. they were
+      /// reused from an earlier iteration or taken from the cache
+      NotRetrieved,
+      /// Nested sampling took the full number of samples
+      MaxSamples,
+      /// Nested sampling could not find a better point
+      NoBetterPoint,
+      /// Nested sampling found a point with the same likelihood as a
+      /// live point
+      DuplicatePoint,
+      /// Nested sampling stopped as the evidence had converged
+      EvidenceConverged,
+      /// The MAP fit with the Laplace approximation was used
+      MAPFit
+    };
+
+    RetStop stop;
+
+    /// Number of nested sampling iterations made
+    size_t niter;
+
     /**
        
      */
@@ -14,6 +14,7 @@
 #define _LIBAIR_APPS_ANTENNAUTILS_HPP__
 
 #include <set>
+#include <map>
 #include <boost/numeric/ublas/matrix.hpp>
 
 namespace LibAIR2 {
@@ -29,6 +30,12 @@ namespace LibAIR2 {
    */
   typedef std::set< std::pair<double, size_t> > AntSetWeight;
 
+  /** Sparse matrix of interpolation weights: for each antenna to be
+      interpolated, the weights and numbers of the antennas it is
+      interpolated from
+   */
+  typedef std::map<size_t, AntSetWeight> AntWeightMatrix;
+
   /** Antennas are represented by rows and the three cartesian
       coordinate of positions in columns
   */
@@ -12,6 +12,7 @@
 */
 
 #include <cmath>
+#include <algorithm>
 
 #include "arraydata.hpp"
 
@@ -24,16 +25,26 @@ namespace LibAIR2 {
 				   const std::vector<size_t> &state, 
 				   const std::vector<size_t> &field, 
 				   const std::vector<size_t> &source, 
-				   size_t nAnts):
+				   size_t nAnts,
+				   const std::vector<size_t> &seqno):
     time(time),
     el(el),
     az(az),
-    state(state),
-    field(field),
-    source(source),
-    wvrdata(boost::extents[time.size()][nAnts][4]),
+    state(state.begin(), state.end()),
+    field(field.begin(), field.end()),
+    source(source.begin(), source.end()),
+    seqno(seqno.begin(), seqno.end()),
+    tsky(time.size()*nAnts*4, 0.),
+    nwords((time.size()+63)/64),
     nAnts(nAnts)
   {
+    validbits.resize(nwords*nAnts, 0);
+    if (this->seqno.empty())
+    {
+      this->seqno.resize(time.size());
+      for(size_t i=0; i<time.size(); ++i)
+	this->seqno[i]=i;
+    }
   }
 
   void InterpArrayData::offsetTime(double dt)
@@ -47,7 +58,6 @@ namespace LibAIR2 {
 		    const AntSet &aset)
   {
     size_t n=aset.size();
-    const InterpArrayData::wvrdata_t &data(d.g_wvrdata());
     for(size_t i=0; i<d.g_time().size(); ++i)
     {
       for(size_t k=0; k < 4; ++k)
@@ -57,7 +67,7 @@ namespace LibAIR2 {
 	    j!=aset.end();
 	    ++j)
 	{
-	  p+=data[i][*j][k];
+	  p+=d.g_tsky(i, *j, k);
 	}
 	d.set(i, a, k, p/n);
       }
@@ -68,7 +78,6 @@ namespace LibAIR2 {
 		     size_t a,
 		     const AntSetWeight &aset)
   {
-    const InterpArrayData::wvrdata_t &data(d.g_wvrdata());
     for(size_t i=0; i<d.g_time().size(); ++i)
     {
       for(size_t k=0; k < 4; ++k)
@@ -78,13 +87,60 @@ namespace LibAIR2 {
 	    j!=aset.end();
 	    ++j)
 	{
-	  p+=data[i][j->second][k]*j->first;
+	  p+=d.g_tsky(i, j->second, k)*j->first;
 	}
 	d.set(i, a, k, p);
       }
     }
   }
 
+  void interpBadAntsW(InterpArrayData &d,
+		      const AntWeightMatrix &w)
+  {
+    typedef std::vector<std::pair<double, size_t> > row_t;
+    std::vector<std::pair<size_t, row_t> > rows;
+    for(AntWeightMatrix::const_iterator a=w.begin(); a!=w.end(); ++a)
+      rows.push_back(std::make_pair(a->first, row_t(a->second.begin(), a->second.end())));
+    const size_t N=d.nTimes();
+    // Blocks are multiples of 64 time points so that no two threads
+    // update the same word of the validity flags
+    const size_t blocksize=4096;
+    const long nblocks=(N+blocksize-1)/blocksize;
+
+#pragma omp parallel for schedule(dynamic)
+    for(long b=0; b<nblocks; ++b)
+    {
+      const size_t i0=b*blocksize;
+      const size_t i1=std::min(N, i0+blocksize);
+      for(size_t r=0; r<rows.size(); ++r)
+      {
+	const row_t &near=rows[r].second;
+	for(size_t k=0; k<4; ++k)
+	{
+	  for(size_t i=i0; i<i1; ++i)
+	  {
+	    double p=0;
+	    for(size_t j=0; j<near.size(); ++j)
+	    {
+	      const double thisData=d.series(near[j].second, k)[i];
+	      if (thisData>0)
+	      {
+		p+=thisData*near[j].first;
+	      }
+	      else
+	      {
+		// no good data; set solution to zero => will be flagged later
+		p=0.;
+		break;
+	      }
+	    }
+	    d.set(i, rows[r].first, k, p);
+	  }
+	}
+      }
+    }
+  }
+
   InterpArrayData *filterState(InterpArrayData &d,
 			       const std::set<size_t>& states)
   {
@@ -94,10 +150,12 @@ namespace LibAIR2 {
     std::vector<size_t> state;
     std::vector<size_t> field;
     std::vector<size_t> src;
+    std::vector<size_t> seqno;
     for(size_t i=0; i<d.g_state().size(); ++i)
     {
       if(states.count(d.g_state()[i]))
       {
+	seqno.push_back(d.g_seqno()[i]);
 	time.push_back(d.g_time()[i]);
 	el.push_back(d.g_el()[i]);
 	az.push_back(d.g_az()[i]);
@@ -113,7 +171,8 @@ namespace LibAIR2 {
 			      state,
 			      field,
 			      src,
-			      d.nAnts));
+			      d.nAnts,
+			      seqno));
     size_t n=0;
     for(size_t i=0; i<d.g_state().size(); ++i)
       if(states.count(d.g_state()[i]))
@@ -123,7 +182,7 @@ namespace LibAIR2 {
 	  for(size_t k=0; k<4; ++k)
 	  {
 	    res->set(n, j, k,
-		     d.g_wvrdata()[i][j][k]);
+		     d.g_tsky(i, j, k));
 	  }
 	}
 	++n;
@@ -132,7 +191,8 @@ namespace LibAIR2 {
   }
 
   void smoothWVR(InterpArrayData &d,
-		 size_t nsample)
+		 size_t nsample,
+		 WVRSmoothType t)
   {
     if (nsample<2) 
       return;
@@ -141,48 +201,83 @@ namespace LibAIR2 {
     const size_t delt=(nsample)/2;
     const bool even=((nsample%2)==0);
 
+    // Figure out where each source/state observation starts and ends
+    std::vector<std::pair<size_t, size_t> > segs;
     size_t starti=0;
     while (starti < N )
     {
-      // Figure out where the end of this source/state observation is
       size_t src=d.g_source()[starti];
       size_t state=d.g_state()[starti];
       size_t endi=starti;
-      while(endi<N and d.g_source()[endi] == src and d.g_state()[endi] == state)
+      while(endi<N and d.g_source()[endi] == src and d.g_state()[endi] == state
+	    and (endi==starti or d.g_seqno()[endi] == d.g_seqno()[endi-1]+1))
 	++endi;
+      // Segments too short to have a sample away from the edges are
+      // left unchanged
+      if (endi-starti > 2*delt)
+	segs.push_back(std::make_pair(starti, endi));
+      starti=endi;
+    }
 
-      //go through each wvr channel
-      for(size_t k=0; k<4; ++k)
+    // The antennas are independent; the channels of one antenna are
+    // done by the same thread as they share the validity flags
+#pragma omp parallel for schedule(dynamic)
+    for (long l=0; l<(long)d.nAnts; ++l)
+    {
+      std::vector<double> src, win;
+      for(size_t s=0; s<segs.size(); ++s)
       {
-	//go through each wvr.
-	for (size_t l=0; l<d.nAnts; ++l)
+	const size_t starti=segs[s].first;
+	const size_t endi=segs[s].second;
+	for(size_t k=0; k<4; ++k)
 	{
-	  //go through each sample in time
-	  for(size_t i=starti; i<endi; ++i)
+	  // Copy of the unsmoothed data of this segment
+	  const InterpArrayData::tsky_t *series=d.series(l, k);
+	  src.assign(series+starti, series+endi);
+	  const size_t n=src.size();
+
+	  if (t==WVRSmoothMean)
 	  {
-	    // Check if we are on edge
-	    if (i< starti+delt or i>endi - delt-1)
-	      continue;
-	    
+	    // Running sum over the window [i-delt, i+delt]
 	    double sum=0;
-	    // Go through elements to average over for new sample i
-	    for(size_t j=i-delt; j<i+delt+1; ++j)
+	    for(size_t j=0; j<2*delt+1; ++j)
+	      sum+=src[j];
+	    for(size_t i=delt; i+delt<n; ++i)
+	    {
+	      double wsum=sum;
+	      if (even)
+		wsum-=0.5*(src[i-delt]+src[i+delt]);
+	      d.set(starti+i, l, k, wsum/(float(nsample)));
+	      if (i+delt+1<n)
+		sum+=src[i+delt+1]-src[i-delt];
+	    }
+	  }
+	  else
+	  {
+	    for(size_t i=delt; i+delt<n; ++i)
+	    {
+	      win.clear();
+	      for(size_t j=i-delt; j<i+delt+1; ++j)
 	      {
-		if ( even and (j==i-delt or j==i+delt))
-		  {
-		    sum=sum+(d.g_wvrdata()[j][l][k]*0.5);
-		  }
-		else
-		  {
-		    sum=sum+(d.g_wvrdata()[j][l][k]);
-		  }
+		if (src[j]>0)
+		  win.push_back(src[j]);
 	      }
-	    d.set(i, l, k, sum/(float(nsample)));
-	      
+	      double med=0;
+	      if (win.size()>0)
+	      {
+		const size_t m=win.size()/2;
+		std::nth_element(win.begin(), win.begin()+m, win.end());
+		med=win[m];
+		if (win.size()%2==0)
+		{
+		  med=0.5*(med+*std::max_element(win.begin(), win.begin()+m));
+		}
+	      }
+	      d.set(starti+i, l, k, med);
+	    }
 	  }
 	}
       }
-      starti=endi;
     }
   }
     
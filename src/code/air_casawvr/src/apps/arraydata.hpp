@@ -14,7 +14,8 @@
 #define _LIBAIR_APPS_ARRAYDATA_HPP__
 
 #include <vector>
-#include <boost/multi_array.hpp>
+#include <set>
+#include <stdint.h>
 
 #include "antennautils.hpp"
 
@@ -27,14 +28,23 @@ namespace LibAIR2 {
       \note This number of time points and WVRs must be specified at
       construction of this object, it can not grow.
 
+      The sky brightness temperatures are stored in single precision,
+      antenna- and channel-major, so that the time series of one
+      channel of one WVR is contiguous in memory (see series()). A
+      point (time, WVR) is valid if its temperatures are positive; the
+      validity is kept in a bitmask which is updated by set(). Invalid
+      points hold zero temperatures so that they contribute nothing
+      to sums over the data.
    */
   class InterpArrayData {
 
   public:
     
-    /// This is the type which is used to store the actual sky
-    /// brightness data from all the WVRs
-    typedef boost::multi_array<double, 3> wvrdata_t;
+    /// Type used to store the sky brightness temperatures
+    typedef float tsky_t;
+
+    /// Type used to store the state, field and source IDs
+    typedef uint32_t index_t;
     
   private:
 
@@ -45,14 +55,23 @@ namespace LibAIR2 {
     /// Azimuth of each observation
     std::vector<double> az;
     /// State ID ([sub-]scan intent) of each observation
-    std::vector<size_t> state;
+    std::vector<index_t> state;
     /// Field ID of each observation
-    std::vector<size_t> field;
+    std::vector<index_t> field;
     /// Source ID of each observation
-    std::vector<size_t> source;
+    std::vector<index_t> source;
+    /// Position of each observation in the sequence of all WVR time
+    /// stamps before any of them were filtered out by state
+    std::vector<index_t> seqno;
     
-    /// The data itself
-    wvrdata_t wvrdata;
+    /// The data itself, element (time i, WVR j, channel k) at
+    /// (j*4+k)*nTimes()+i
+    std::vector<tsky_t> tsky;
+
+    /// Validity of (time i, WVR j) in bit i%64 of word
+    /// j*nwords+i/64
+    std::vector<uint64_t> validbits;
+    size_t nwords;
 
   public:
 
@@ -68,6 +87,10 @@ namespace LibAIR2 {
 
        \param nAnts number of Ants for which the data are recorded
 
+       \param seqno Position of each time point among all the WVR
+       time stamps, if some have been left out (see filterState); if
+       empty, the time points are taken to be consecutive
+
      */
     InterpArrayData(const std::vector<double> &time, 
 		    const std::vector<double> &el, 
@@ -75,7 +98,8 @@ namespace LibAIR2 {
 		    const std::vector<size_t> &state, 
 		    const std::vector<size_t> &field, 
 		    const std::vector<size_t> &source, 
-		    size_t nAnts);
+		    size_t nAnts,
+		    const std::vector<size_t> &seqno=std::vector<size_t>());
 
     // ----------------------- Public Interface -------------
 
@@ -94,34 +118,69 @@ namespace LibAIR2 {
       return az;
     }
 
-    const std::vector<size_t> &g_state(void) const
+    const std::vector<index_t> &g_state(void) const
     {
       return state;
     }
 
-    const std::vector<size_t> &g_field(void) const
+    const std::vector<index_t> &g_field(void) const
     {
       return field;
     }
 
-    const std::vector<size_t> &g_source(void) const
+    const std::vector<index_t> &g_source(void) const
     {
       return source;
     }
 
-    const wvrdata_t &g_wvrdata(void) const
+    const std::vector<index_t> &g_seqno(void) const
+    {
+      return seqno;
+    }
+
+    /** Sky brightness temperature of channel ch of WVR wvr at time
+	point time, zero if the point is not valid
+     */
+    double g_tsky(size_t time,
+		  size_t wvr,
+		  size_t ch) const
+    {
+      return tsky[(wvr*4+ch)*nTimes()+time];
+    }
+
+    /** The time series of channel ch of WVR wvr, nTimes() contiguous
+	elements
+     */
+    const tsky_t *series(size_t wvr,
+			 size_t ch) const
     {
-      return wvrdata;
+      return &tsky[(wvr*4+ch)*nTimes()];
     }
 
-    /** Set one element of the WVR data array
+    /** True if the data of WVR wvr at time point time are valid
+     */
+    bool valid(size_t time,
+	       size_t wvr) const
+    {
+      return (validbits[wvr*nwords+time/64] >> (time%64)) & 1;
+    }
+
+    /** Set one element of the WVR data array. The point is marked
+	valid if Tsky is positive and invalid otherwise; all channels
+	of a point are expected to be set together.
      */
     void set(size_t time,
 	     size_t wvr,
 	     size_t ch,
 	     double Tsky)
     {
-      wvrdata[time][wvr][ch]=Tsky;
+      tsky[(wvr*4+ch)*nTimes()+time]=Tsky;
+      uint64_t &w=validbits[wvr*nwords+time/64];
+      const uint64_t bit=uint64_t(1) << (time%64);
+      if (Tsky>0)
+	w|=bit;
+      else
+	w&=~bit;
     }
 
     /** Number of time points in the data
@@ -152,20 +211,44 @@ namespace LibAIR2 {
 		     size_t a,
 		     const AntSetWeight &aset);
 
+  /** Interpolate the data of all antennas in w at once by the
+      weighted sum of the antennas they are interpolated from. A
+      channel at a time point is set to zero if any of these antennas
+      has no positive data in it.
+
+      \note None of the antennas interpolated from may itself be
+      interpolated
+   */
+  void interpBadAntsW(InterpArrayData &d,
+		      const AntWeightMatrix &w);
+
   /** \brief Create new array data with only states in it
    */
   InterpArrayData *filterState(InterpArrayData &d,
 			       const std::set<size_t>& states);
 
+  /// Kinds of smoothing supported by smoothWVR()
+  enum WVRSmoothType {
+    WVRSmoothMean,
+    WVRSmoothMedian
+  };
+
   /** \brief Smooth the WVR data in time. The smoothing is symmetric
       in time. The initial and last nsample/2 are not smoothed 
 
       The smoothing is broken at every change of source and state id
       to avoid smoothing across large change of airmass or when
-      observing calibration loads.
+      observing calibration loads, and where time points have been
+      filtered out by state.
+
+      Each smoothed sample is computed from the unsmoothed data. The
+      mean of an even number of samples gives half weight to the two
+      outermost samples of the window. The median is taken over the
+      valid samples of the window only.
    */
   void smoothWVR(InterpArrayData &d,
-		 size_t nsample);
+		 size_t nsample,
+		 WVRSmoothType t=WVRSmoothMean);
 			       
 
 }
@@ -11,6 +11,9 @@
    Structure to hold gains derived from WVR data
 */
 
+#include <map>
+#include <algorithm>
+
 #include "arraygains.hpp"
 #include "arraydata.hpp"
 #include "dtdlcoeffs.hpp"
@@ -21,13 +24,15 @@ namespace LibAIR2 {
 
   ArrayGains::ArrayGains(const std::vector<double> &time, 
 			 const std::vector<double> &el, 
-			 const std::vector<size_t> &state, 
-			 const std::vector<size_t> &field, 
-			 const std::vector<size_t> &source, 
+			 const std::vector<uint32_t> &state, 
+			 const std::vector<uint32_t> &field, 
+			 const std::vector<uint32_t> &source, 
 			   size_t nAnt):
     time(time),
     el(el),
-    state(state), field(field), source(source),
+    state(state.begin(), state.end()),
+    field(field.begin(), field.end()),
+    source(source.begin(), source.end()),
     path(boost::extents[time.size()][nAnt]),
     nAnt(nAnt)
   {
@@ -40,22 +45,25 @@ namespace LibAIR2 {
     reweight_thermal(coeffs, c);
 
     const size_t ntimes=wvrdata.nTimes();
-    for (size_t i=0; i<ntimes; ++i)
+    std::vector<double> cpath(ntimes);
+    for(size_t j=0; j<wvrdata.nAnts; ++j)
     {
-      for(size_t j=0; j<wvrdata.nAnts; ++j)
+      std::fill(cpath.begin(), cpath.end(), 0.);
+      for(size_t k=0; k<4; ++k)
       {
-	double cpath=0;
-	for(size_t k=0; k<4; ++k)
+	if (!(coeffs[k]>0))
+	  continue;
+	const InterpArrayData::tsky_t *T=wvrdata.series(j, k);
+	for (size_t i=0; i<ntimes; ++i)
 	{
-	  double T = wvrdata.g_wvrdata()[i][j][k];
-
-	  if(T>0. && coeffs[k]>0)
+	  if(wvrdata.valid(i, j))
 	  {
-	    cpath+=T*c[k];
+	    cpath[i]+=T[i]*c[k];
 	  }
 	}
-	path[i][j]=cpath;
       }
+      for (size_t i=0; i<ntimes; ++i)
+	path[i][j]=cpath[i];
     }
   }
 
@@ -68,21 +76,25 @@ namespace LibAIR2 {
     reweight_thermal(coeffs, coeffs2, c, c2);
 
     const size_t ntimes=wvrdata.nTimes();
-    for (size_t i=0; i<ntimes; ++i)
+    std::vector<double> cpath(ntimes);
+    for(size_t j=0; j<wvrdata.nAnts; ++j)
     {
-      for(size_t j=0; j<wvrdata.nAnts; ++j)
+      std::fill(cpath.begin(), cpath.end(), 0.);
+      for(size_t k=0; k<4; ++k)
       {
-	double cpath=0;
-	for(size_t k=0; k<4; ++k)
+	if (!(coeffs[k]>0))
+	  continue;
+	const InterpArrayData::tsky_t *T=wvrdata.series(j, k);
+	for (size_t i=0; i<ntimes; ++i)
 	{
-	  const double T = wvrdata.g_wvrdata()[i][j][k];
-	  if(T>0. && coeffs[k]>0)
+	  if(wvrdata.valid(i, j))
 	  {
-	    cpath+=(T-TRef[k])*c[k]+ 0.5*std::pow(T-TRef[k], 2)*c2[k];
+	    cpath[i]+=(T[i]-TRef[k])*c[k]+ 0.5*std::pow(T[i]-TRef[k], 2)*c2[k];
 	  }
 	}
-	path[i][j]=cpath;
       }
+      for (size_t i=0; i<ntimes; ++i)
+	path[i][j]=cpath[i];
     }
   }
 
@@ -95,21 +107,25 @@ namespace LibAIR2 {
       c[i]=weights[i]/coeffs[i];
 
     const size_t ntimes=wvrdata.nTimes();
-    for (size_t i=0; i<ntimes; ++i)
+    std::vector<double> cpath(ntimes);
+    for(size_t j=0; j<wvrdata.nAnts; ++j)
     {
-      for(size_t j=0; j<wvrdata.nAnts; ++j)
+      std::fill(cpath.begin(), cpath.end(), 0.);
+      for(size_t k=0; k<4; ++k)
       {
-	double cpath=0;
-	for(size_t k=0; k<4; ++k)
+	if (!(coeffs[k]>0))
+	  continue;
+	const InterpArrayData::tsky_t *T=wvrdata.series(j, k);
+	for (size_t i=0; i<ntimes; ++i)
 	{
-	  const double T = wvrdata.g_wvrdata()[i][j][k];
-	  if(T>0. && coeffs[k]>0)
+	  if(wvrdata.valid(i, j))
 	  {
-	    cpath+=T*c[k];
+	    cpath[i]+=T[i]*c[k];
 	  }
 	}
-	path[i][j]=cpath;
       }
+      for (size_t i=0; i<ntimes; ++i)
+	path[i][j]=cpath[i];
     }
   }
 
@@ -122,9 +138,13 @@ namespace LibAIR2 {
     // coefficients
     std::vector<double> c, c2, cw;
 
-    for (size_t i=0; i<ntimes; ++i)
+    for(size_t j=0; j<wvrdata.nAnts; ++j)
     {
-      for(size_t j=0; j<wvrdata.nAnts; ++j)
+      const InterpArrayData::tsky_t *T[4];
+      for(size_t k=0; k<4; ++k)
+	T[k]=wvrdata.series(j, k);
+
+      for (size_t i=0; i<ntimes; ++i)
       {
 	double cpath=0;
 	coeffs.get(j, 
@@ -133,13 +153,14 @@ namespace LibAIR2 {
 		   c,
 		   c2);
 	reweight_thermal(c, cw);
-	for(size_t k=0; k<4; ++k)
+	if(wvrdata.valid(i, j))
 	{
-	  const double T = wvrdata.g_wvrdata()[i][j][k];
-	  if(T>0. && c[k]!=0)
+	  for(size_t k=0; k<4; ++k)
 	  {
-	    //std::cout << "i j k cw[k] T " << i << " " << j << " " << k << " " << cw[k] << " " << T << std::endl;
-	    cpath+=T*cw[k];
+	    if(c[k]!=0)
+	    {
+	      cpath+=T[k][i]*cw[k];
+	    }
 	  }
 	}
 	path[i][j]=cpath;
@@ -197,6 +218,85 @@ namespace LibAIR2 {
     }
   }
 
+  void ArrayGains::smooth(double smtime,
+			  SmoothType t)
+  {
+    const size_t ntimes=time.size();
+    const double hw=0.5*smtime;
+
+    // Rows of each field, in time order
+    std::map<size_t, std::vector<size_t> > fieldrows;
+    for (size_t i=0; i<ntimes; ++i)
+    {
+      fieldrows[field[i]].push_back(i);
+    }
+
+    path_t res(path);
+    std::vector<double> win;
+    for(std::map<size_t, std::vector<size_t> >::const_iterator f=fieldrows.begin();
+	f!=fieldrows.end();
+	++f)
+    {
+      const std::vector<size_t> &rows=f->second;
+      const size_t n=rows.size();
+      for(size_t j=0; j<nAnt; ++j)
+      {
+	// Running window [lo, hi) with the sum and number of the
+	// unflagged paths in it
+	size_t lo=0, hi=0, nwin=0;
+	double sum=0;
+	for(size_t k=0; k<n; ++k)
+	{
+	  const double tk=time[rows[k]];
+	  while(hi<n && time[rows[hi]]<=tk+hw)
+	  {
+	    if (path[rows[hi]][j]!=0)
+	    {
+	      sum+=path[rows[hi]][j];
+	      ++nwin;
+	    }
+	    ++hi;
+	  }
+	  while(time[rows[lo]]<tk-hw)
+	  {
+	    if (path[rows[lo]][j]!=0)
+	    {
+	      sum-=path[rows[lo]][j];
+	      --nwin;
+	    }
+	    ++lo;
+	  }
+
+	  if (path[rows[k]][j]==0 or nwin==0)
+	    continue;
+
+	  if (t==SmoothMean)
+	  {
+	    res[rows[k]][j]=sum/nwin;
+	  }
+	  else
+	  {
+	    win.clear();
+	    for(size_t l=lo; l<hi; ++l)
+	    {
+	      if (path[rows[l]][j]!=0)
+		win.push_back(path[rows[l]][j]);
+	    }
+	    const size_t m=win.size()/2;
+	    std::nth_element(win.begin(), win.begin()+m, win.end());
+	    double med=win[m];
+	    if (win.size()%2==0)
+	    {
+	      med=0.5*(med+*std::max_element(win.begin(), win.begin()+m));
+	    }
+	    res[rows[k]][j]=med;
+	  }
+	}
+      }
+    }
+    path=res;
+  }
+
   double ArrayGains::deltaPath(size_t timei,
 			       size_t i,
 			       size_t j) const
@@ -15,6 +15,7 @@
 
 #include <vector>
 #include <set>
+#include <stdint.h>
 
 #include <boost/multi_array.hpp>
 
@@ -63,9 +64,9 @@ namespace LibAIR2 {
      */
     ArrayGains(const std::vector<double> &time, 
 	       const std::vector<double> &el, 
-	       const std::vector<size_t> &state, 
-	       const std::vector<size_t> &field, 
-	       const std::vector<size_t> &source, 
+	       const std::vector<uint32_t> &state, 
+	       const std::vector<uint32_t> &field, 
+	       const std::vector<uint32_t> &source, 
 	       size_t nAnt);
 
     // ----------------------- Public interface ---------------------
@@ -115,6 +116,25 @@ namespace LibAIR2 {
      */
     void scale(double s);
 
+    /// Kinds of time smoothing supported by smooth()
+    enum SmoothType {
+      SmoothMean,
+      SmoothMedian
+    };
+
+    /** \brief Smooth the paths of each antenna in time
+
+	Each path is replaced by the mean or median of the paths of
+	the same antenna and field within +/- smtime/2 of it, in the
+	same way as the calibrater smooth would do on the gain
+	table. Zero (i.e., flagged) paths are neither used nor
+	changed.
+
+	\param smtime Width of the smoothing window in seconds
+     */
+    void smooth(double smtime,
+		SmoothType t);
+
 
     const std::vector<double> &g_time(void) const
     {
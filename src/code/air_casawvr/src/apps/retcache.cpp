@@ -0,0 +1,193 @@
+/**
+   Maintained by ESO since 2013.
+
+   This file is part of LibAIR and is licensed under GNU Public
+   License Version 2
+
+   \file retcache.cpp
+
+*/
+
+#include <cmath>
+#include <cstdio>
+#include <ctime>
+#include <fstream>
+#include <functional>
+#include <iomanip>
+#include <limits>
+#include <sstream>
+#include <algorithm>
+
+#include <boost/filesystem.hpp>
+
+#include "retcache.hpp"
+
+namespace LibAIR2 {
+
+  /// Identifies the retrieval whose results are cached. Change it
+  /// whenever the WVR characteristics, priors or sampler settings used
+  /// by ALMAAbsRet change, so that old entries are no longer found.
+  static const char retrievalTag[]="ALMAAbsRet-1";
+
+  ALMAAbsRetCache::ALMAAbsRetCache(double tol,
+				   double eltol,
+				   const std::string &dir,
+				   size_t maxentries,
+				   const std::string &modeltag):
+    tol(tol),
+    eltol(eltol),
+    dir(dir),
+    maxentries(maxentries),
+    modeltag(modeltag),
+    hits(0),
+    misses(0)
+  {
+    if (!dir.empty())
+    {
+      boost::system::error_code ec;
+      boost::filesystem::create_directories(dir, ec);
+    }
+  }
+
+  /// Append x quantised to tol, or exactly if tol is zero
+  static void keyValue(std::ostream &os,
+		       double x,
+		       double tol)
+  {
+    if (tol>0)
+      os<<std::llround(x/tol);
+    else
+      os<<std::hexfloat<<x<<std::defaultfloat;
+    os<<":";
+  }
+
+  std::string ALMAAbsRetCache::key(const std::vector<double> &TObs,
+				   double el) const
+  {
+    std::ostringstream os;
+    os<<retrievalTag<<":"<<modeltag<<":";
+    keyValue(os, tol, 0);
+    keyValue(os, eltol, 0);
+    for(size_t k=0; k<TObs.size(); ++k)
+      keyValue(os, TObs[k], tol);
+    keyValue(os, el, eltol);
+    return os.str();
+  }
+
+  std::string ALMAAbsRetCache::fileName(const std::string &k) const
+  {
+    std::ostringstream os;
+    os<<std::hex<<std::setw(16)<<std::setfill('0')<<std::hash<std::string>()(k);
+    return (boost::filesystem::path(dir)/os.str()).string();
+  }
+
+  bool ALMAAbsRetCache::readEntry(const std::string &k,
+				  Entry &e) const
+  {
+    const std::string fname=fileName(k);
+    std::ifstream ifs(fname.c_str());
+    std::string fk;
+    // The file name is a hash of the key, so check the key itself
+    if (!std::getline(ifs, fk) || fk!=k)
+      return false;
+    ifs>>e.ok>>e.res.ev>>e.res.c>>e.res.c_err;
+    for(size_t i=0; i<4; ++i)
+      ifs>>e.res.dTdL[i];
+    for(size_t i=0; i<4; ++i)
+      ifs>>e.res.dTdL_err[i];
+    if (!ifs)
+      return false;
+    // Record the use for the least recently used eviction
+    boost::system::error_code ec;
+    boost::filesystem::last_write_time(fname, std::time(NULL), ec);
+    return true;
+  }
+
+  void ALMAAbsRetCache::writeEntry(const std::string &k,
+				   const Entry &e) const
+  {
+    const std::string fname=fileName(k);
+    const std::string tmpname=fname+".tmp";
+    {
+      std::ofstream ofs(tmpname.c_str());
+      ofs<<std::setprecision(std::numeric_limits<double>::digits10+2)
+	 <<k<<std::endl
+	 <<e.ok<<" "<<e.res.ev<<" "<<e.res.c<<" "<<e.res.c_err;
+      for(size_t i=0; i<4; ++i)
+	ofs<<" "<<e.res.dTdL[i];
+      for(size_t i=0; i<4; ++i)
+	ofs<<" "<<e.res.dTdL_err[i];
+      ofs<<std::endl;
+      if (!ofs)
+      {
+	std::remove(tmpname.c_str());
+	return;
+      }
+    }
+    // The store is only an optimisation; failing to write it is not
+    // an error
+    if (std::rename(tmpname.c_str(), fname.c_str())!=0)
+      std::remove(tmpname.c_str());
+  }
+
+  bool ALMAAbsRetCache::lookup(const std::vector<double> &TObs,
+			       double el,
+			       bool &ok,
+			       ALMARes_Basic &res)
+  {
+    const std::string k=key(TObs, el);
+    std::map<std::string, Entry>::const_iterator i=mem.find(k);
+    if (i==mem.end() && !dir.empty())
+    {
+      Entry e;
+      if (readEntry(k, e))
+	i=mem.insert(std::make_pair(k, e)).first;
+    }
+    if (i==mem.end())
+    {
+      ++misses;
+      return false;
+    }
+    ++hits;
+    ok=i->second.ok;
+    res=i->second.res;
+    return true;
+  }
+
+  void ALMAAbsRetCache::store(const std::vector<double> &TObs,
+			      double el,
+			      bool ok,
+			      const ALMARes_Basic &res)
+  {
+    const std::string k=key(TObs, el);
+    Entry e;
+    e.ok=ok;
+    e.res=res;
+    mem[k]=e;
+    if (!dir.empty())
+      writeEntry(k, e);
+  }
+
+  void ALMAAbsRetCache::prune(void)
+  {
+    namespace fs=boost::filesystem;
+    if (dir.empty())
+      return;
+
+    boost::system::error_code ec;
+    std::vector<std::pair<std::time_t, fs::path> > files;
+    for(fs::directory_iterator i(dir, ec), end; !ec && i!=end; i.increment(ec))
+    {
+      if (!fs::is_regular_file(i->status()))
+	continue;
+      files.push_back(std::make_pair(fs::last_write_time(i->path(), ec), i->path()));
+    }
+    if (files.size()<=maxentries)
+      return;
+
+    std::sort(files.begin(), files.end());
+    for(size_t i=0; i<files.size()-maxentries; ++i)
+      fs::remove(files[i].second, ec);
+  }
+
+}
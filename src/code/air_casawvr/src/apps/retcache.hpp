@@ -0,0 +1,124 @@
+/**
+   Maintained by ESO since 2013.
+
+   This file is part of LibAIR and is licensed under GNU Public
+   License Version 2
+
+   \file retcache.hpp
+
+   Cache of the results of the ALMAAbsRet retrievals, so that
+   identical or nearly identical inputs are retrieved only once
+*/
+#ifndef _LIBAIR_APPS_RETCACHE_HPP__
+#define _LIBAIR_APPS_RETCACHE_HPP__
+
+#include <map>
+#include <string>
+#include <vector>
+
+#include "alma_datastruct.h"
+
+namespace LibAIR2 {
+
+  /** \brief Results of ALMAAbsRet retrievals indexed by their inputs
+
+      A retrieval depends only on the observed sky temperatures and
+      the elevation; the WVR characteristics, priors and sampler
+      settings are fixed and are represented by a version tag in the
+      key, together with a tag for the model of the sky brightness.
+      The inputs are quantised to the given tolerances, so that an
+      input within the tolerance of an earlier one gets the earlier
+      result.
+
+      The entries are kept in memory and, if a directory is given,
+      also on disk, one file per entry, so that they can be used by
+      later runs. The least recently used files are removed by prune()
+      when there are more than maxentries of them.
+   */
+  class ALMAAbsRetCache {
+
+    struct Entry {
+      /// False if the Bayesian evidence was zero
+      bool ok;
+      ALMARes_Basic res;
+    };
+
+    const double tol;
+    const double eltol;
+    const std::string dir;
+    const size_t maxentries;
+    const std::string modeltag;
+
+    std::map<std::string, Entry> mem;
+
+    /// The key for the given inputs
+    std::string key(const std::vector<double> &TObs,
+		    double el) const;
+
+    /// The file holding the entry with key k
+    std::string fileName(const std::string &k) const;
+
+    bool readEntry(const std::string &k,
+		   Entry &e) const;
+
+    void writeEntry(const std::string &k,
+		    const Entry &e) const;
+
+  public:
+
+    /// Number of lookups which found an entry
+    size_t hits;
+    /// Number of lookups which did not
+    size_t misses;
+
+    /**
+       \param tol Tolerance on the sky temperatures in K; zero for
+       exact matches only
+
+       \param eltol Tolerance on the elevation in radians; zero for
+       exact matches only
+
+       \param dir Directory of the on-disk store; if empty, the
+       entries are only kept in memory
+
+       \param maxentries Maximum number of entries kept on disk
+
+       \param modeltag Distinguishes retrievals made with different
+       models of the sky brightness, e.g. the exact model and its
+       tabulation
+     */
+    ALMAAbsRetCache(double tol=0,
+		    double eltol=0,
+		    const std::string &dir="",
+		    size_t maxentries=100000,
+		    const std::string &modeltag="");
+
+    /** Look for a retrieval of TObs at elevation el
+
+	\param ok Set to false if the evidence of the retrieval was
+	zero
+
+	\returns True if an entry was found
+     */
+    bool lookup(const std::vector<double> &TObs,
+		double el,
+		bool &ok,
+		ALMARes_Basic &res);
+
+    /** Add the result of the retrieval of TObs at elevation el
+     */
+    void store(const std::vector<double> &TObs,
+	       double el,
+	       bool ok,
+	       const ALMARes_Basic &res);
+
+    /** Remove the least recently used entries from the on-disk
+	store until at most maxentries are left
+     */
+    void prune(void);
+
+  };
+
+}
+
+#endif
@@ -0,0 +1,50 @@
+/**
+   Maintained by ESO since 2013.
+
+   This file is part of LibAIR and is licensed under GNU Public
+   License Version 2
+
+   \file scanindex.hpp
+
+   Time-sorted index of the main table of a measurement set
+*/
+#ifndef _LIBAIR_APPS_SCANINDEX_HPP__
+#define _LIBAIR_APPS_SCANINDEX_HPP__
+
+#include <vector>
+#include <cstddef>
+
+namespace LibAIR2 {
+
+  /** \brief Time-sorted index of the main table
+
+      Holds the metadata needed by wvrgcal so that the main table only
+      needs to be read once per run. There is one element for each
+      distinct combination of time, data description, field and state
+      in the main table, in order of increasing time, rather than one
+      per row, so that the size of the index does not grow with the
+      number of baselines.
+
+      It is built by buildScanIndex (see msutils.hpp) and kept in the
+      WVR extract file.
+   */
+  struct MSScanIndex {
+    std::vector<double> time;
+    std::vector<int> field;
+    /// SOURCE_ID of the field, as given in the FIELD table
+    std::vector<int> source;
+    /// False if the field is not in the FIELD table, in which case
+    /// source is not defined
+    std::vector<char> hasSource;
+    std::vector<int> state;
+    std::vector<int> ddid;
+
+    size_t size(void) const
+    {
+      return time.size();
+    }
+  };
+
+}
+
+#endif
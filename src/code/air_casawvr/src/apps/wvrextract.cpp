@@ -0,0 +1,328 @@
+/**
+   Maintained by ESO since 2013.
+
+   This file is part of LibAIR and is licensed under GNU Public
+   License Version 2
+
+   \file wvrextract.cpp
+
+*/
+
+#include <cstdio>
+#include <cstring>
+#include <ctime>
+#include <fstream>
+#include <sstream>
+#include <stdexcept>
+#include <vector>
+
+#include <stdint.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+
+#include <boost/filesystem.hpp>
+
+#include "wvrextract.hpp"
+#include "arraydata.hpp"
+#include "scanindex.hpp"
+
+namespace LibAIR2 {
+
+  /// Identifies the file type
+  static const char extractMagic[8]={'L', 'A', 'I', 'R', 'W', 'V', 'R', 'X'};
+
+  /// Increment whenever the layout changes
+  static const uint32_t extractVersion=4;
+
+  /// Written in native byte order to detect files from other machines
+  static const uint32_t extractByteOrder=0x01020304;
+
+  /** Fixed size header at the start of the file. It is followed by
+      the stamp and params strings, then by the arrays, each starting
+      at a multiple of 8 bytes:
+
+      time, el, az: double[ntimes]
+      state, field, source, seqno: uint32[ntimes]
+      tsky: float[nants][4][ntimes]
+      flag: uint8[nants][ntimes], 1 if the data point is flagged
+      antflag: uint8[nants], 1 if the antenna is flagged in the main table
+      idxtime: double[nidx]
+      idxfield, idxsource, idxstate, idxddid: int32[nidx]
+      idxhassource: uint8[nidx]
+   */
+  struct ExtractHeader {
+    char magic[8];
+    uint32_t version;
+    uint32_t byteorder;
+    uint64_t ntimes;
+    uint64_t nants;
+    uint64_t stamplen;
+    uint64_t paramslen;
+    uint64_t nidx;
+  };
+
+  static size_t pad8(size_t n)
+  {
+    return (n+7)/8*8;
+  }
+
+  /// Size of the file for the given header
+  static size_t extractSize(const ExtractHeader &h)
+  {
+    return sizeof(ExtractHeader)
+      +pad8(h.stamplen)
+      +pad8(h.paramslen)
+      +3*8*h.ntimes
+      +4*pad8(4*h.ntimes)
+      +pad8(4*4*h.ntimes*h.nants)
+      +pad8(h.ntimes*h.nants)
+      +pad8(h.nants)
+      +8*h.nidx
+      +4*pad8(4*h.nidx)
+      +pad8(h.nidx);
+  }
+
+  std::string wvrExtractName(const std::string &msname)
+  {
+    std::string n(msname);
+    while(n.size()>1 && n[n.size()-1]=='/')
+      n.erase(n.size()-1);
+    return n+".wvrextract";
+  }
+
+  std::string tableStamp(const std::string &path)
+  {
+    namespace fs=boost::filesystem;
+    std::time_t newest=0;
+    uintmax_t size=0;
+    size_t nfiles=0;
+    for(fs::recursive_directory_iterator i(path), end; i!=end; ++i)
+    {
+      if(!fs::is_regular_file(i->status()) ||
+	 i->path().filename()=="table.lock")
+	continue;
+      newest=std::max(newest, fs::last_write_time(i->path()));
+      size+=fs::file_size(i->path());
+      ++nfiles;
+    }
+    std::ostringstream os;
+    os<<newest<<":"<<size<<":"<<nfiles;
+    return os.str();
+  }
+
+  template<class T>
+  static void writeArray(std::ostream &os,
+			 const std::vector<T> &v)
+  {
+    os.write(reinterpret_cast<const char*>(v.data()), v.size()*sizeof(T));
+    static const char zeros[8]={0};
+    os.write(zeros, pad8(v.size()*sizeof(T))-v.size()*sizeof(T));
+  }
+
+  static void writeString(std::ostream &os,
+			  const std::string &s)
+  {
+    writeArray(os, std::vector<char>(s.begin(), s.end()));
+  }
+
+  void writeWVRExtract(const std::string &fname,
+		       const std::string &stamp,
+		       const std::string &params,
+		       const InterpArrayData &d,
+		       const std::set<int> &flaggedantsInMain,
+		       const MSScanIndex &idx)
+  {
+    const size_t ntimes=d.nTimes();
+    const size_t nants=d.nAnts;
+
+    ExtractHeader h;
+    std::memset(&h, 0, sizeof(h));
+    std::memcpy(h.magic, extractMagic, sizeof(h.magic));
+    h.version=extractVersion;
+    h.byteorder=extractByteOrder;
+    h.ntimes=ntimes;
+    h.nants=nants;
+    h.stamplen=stamp.size();
+    h.paramslen=params.size();
+    h.nidx=idx.size();
+
+    std::vector<InterpArrayData::tsky_t> tsky;
+    tsky.reserve(ntimes*nants*4);
+    for(size_t j=0; j<nants; ++j)
+      for(size_t k=0; k<4; ++k)
+	tsky.insert(tsky.end(), d.series(j, k), d.series(j, k)+ntimes);
+    std::vector<uint8_t> flag(ntimes*nants, 0);
+    for(size_t j=0; j<nants; ++j)
+      for(size_t i=0; i<ntimes; ++i)
+	flag[j*ntimes+i]=!d.valid(i, j);
+    std::vector<uint8_t> antflag(nants, 0);
+    for(std::set<int>::const_iterator i=flaggedantsInMain.begin(); i!=flaggedantsInMain.end(); ++i)
+      if(*i>=0 && (size_t)*i<nants)
+	antflag[*i]=1;
+    std::vector<uint8_t> idxhassource(idx.hasSource.begin(), idx.hasSource.end());
+
+    const std::string tmpname=fname+".tmp";
+    {
+      std::ofstream ofs(tmpname.c_str(), std::ios::binary);
+      if(!ofs)
+	throw std::runtime_error("Could not open WVR extract file "+tmpname+" for writing");
+      ofs.write(reinterpret_cast<const char*>(&h), sizeof(h));
+      writeString(ofs, stamp);
+      writeString(ofs, params);
+      writeArray(ofs, d.g_time());
+      writeArray(ofs, d.g_el());
+      writeArray(ofs, d.g_az());
+      writeArray(ofs, d.g_state());
+      writeArray(ofs, d.g_field());
+      writeArray(ofs, d.g_source());
+      writeArray(ofs, d.g_seqno());
+      writeArray(ofs, tsky);
+      writeArray(ofs, flag);
+      writeArray(ofs, antflag);
+      writeArray(ofs, idx.time);
+      writeArray(ofs, std::vector<int32_t>(idx.field.begin(), idx.field.end()));
+      writeArray(ofs, std::vector<int32_t>(idx.source.begin(), idx.source.end()));
+      writeArray(ofs, std::vector<int32_t>(idx.state.begin(), idx.state.end()));
+      writeArray(ofs, std::vector<int32_t>(idx.ddid.begin(), idx.ddid.end()));
+      writeArray(ofs, idxhassource);
+      if(!ofs)
+      {
+	std::remove(tmpname.c_str());
+	throw std::runtime_error("Could not write WVR extract file "+tmpname);
+      }
+    }
+    if(std::rename(tmpname.c_str(), fname.c_str())!=0)
+    {
+      std::remove(tmpname.c_str());
+      throw std::runtime_error("Could not rename WVR extract file to "+fname);
+    }
+  }
+
+  /// Read-only memory map of a file, unmapped on destruction
+  class MappedFile {
+    void *p;
+    size_t n;
+  public:
+    MappedFile(const std::string &fname):
+      p(NULL),
+      n(0)
+    {
+      const int fd=open(fname.c_str(), O_RDONLY);
+      if(fd<0)
+	return;
+      struct stat st;
+      if(fstat(fd, &st)==0 && st.st_size>0)
+      {
+	void *m=mmap(NULL, st.st_size, PROT_READ, MAP_PRIVATE, fd, 0);
+	if(m!=MAP_FAILED)
+	{
+	  p=m;
+	  n=st.st_size;
+	}
+      }
+      close(fd);
+    }
+    ~MappedFile()
+    {
+      if(p)
+	munmap(p, n);
+    }
+    const char *data() const
+    {
+      return static_cast<const char*>(p);
+    }
+    size_t size() const
+    {
+      return n;
+    }
+  };
+
+  InterpArrayData *readWVRExtract(const std::string &fname,
+				  const std::string &stamp,
+				  const std::string &params,
+				  std::set<int> &flaggedantsInMain,
+				  MSScanIndex &idx)
+  {
+    const MappedFile f(fname);
+    if(f.data()==NULL || f.size()<sizeof(ExtractHeader))
+      return NULL;
+
+    const ExtractHeader &h=*reinterpret_cast<const ExtractHeader*>(f.data());
+    if(std::memcmp(h.magic, extractMagic, sizeof(h.magic))!=0 ||
+       h.version!=extractVersion ||
+       h.byteorder!=extractByteOrder ||
+       f.size()!=extractSize(h))
+      return NULL;
+
+    const char *p=f.data()+sizeof(ExtractHeader);
+    if(std::string(p, h.stamplen)!=stamp)
+      return NULL;
+    p+=pad8(h.stamplen);
+    if(std::string(p, h.paramslen)!=params)
+      return NULL;
+    p+=pad8(h.paramslen);
+
+    const size_t ntimes=h.ntimes;
+    const size_t nants=h.nants;
+    const double *time=reinterpret_cast<const double*>(p);
+    const double *el=time+ntimes;
+    const double *az=el+ntimes;
+    p+=3*8*ntimes;
+    const uint32_t *state=reinterpret_cast<const uint32_t*>(p);
+    p+=pad8(4*ntimes);
+    const uint32_t *field=reinterpret_cast<const uint32_t*>(p);
+    p+=pad8(4*ntimes);
+    const uint32_t *source=reinterpret_cast<const uint32_t*>(p);
+    p+=pad8(4*ntimes);
+    const uint32_t *seqno=reinterpret_cast<const uint32_t*>(p);
+    p+=pad8(4*ntimes);
+    const float *tsky=reinterpret_cast<const float*>(p);
+    p+=pad8(4*4*ntimes*nants);
+    const uint8_t *flag=reinterpret_cast<const uint8_t*>(p);
+    const uint8_t *antflag=flag+pad8(ntimes*nants);
+    p=reinterpret_cast<const char*>(antflag)+pad8(nants);
+    const size_t nidx=h.nidx;
+    const double *idxtime=reinterpret_cast<const double*>(p);
+    p+=8*nidx;
+    const int32_t *idxfield=reinterpret_cast<const int32_t*>(p);
+    p+=pad8(4*nidx);
+    const int32_t *idxsource=reinterpret_cast<const int32_t*>(p);
+    p+=pad8(4*nidx);
+    const int32_t *idxstate=reinterpret_cast<const int32_t*>(p);
+    p+=pad8(4*nidx);
+    const int32_t *idxddid=reinterpret_cast<const int32_t*>(p);
+    p+=pad8(4*nidx);
+    const uint8_t *idxhassource=reinterpret_cast<const uint8_t*>(p);
+
+    InterpArrayData *res=new InterpArrayData(std::vector<double>(time, time+ntimes),
+					     std::vector<double>(el, el+ntimes),
+					     std::vector<double>(az, az+ntimes),
+					     std::vector<size_t>(state, state+ntimes),
+					     std::vector<size_t>(field, field+ntimes),
+					     std::vector<size_t>(source, source+ntimes),
+					     nants,
+					     std::vector<size_t>(seqno, seqno+ntimes));
+    for(size_t j=0; j<nants; ++j)
+      for(size_t k=0; k<4; ++k)
+	for(size_t i=0; i<ntimes; ++i)
+	  res->set(i, j, k,
+		   flag[j*ntimes+i] ? 0. : tsky[(j*4+k)*ntimes+i]);
+
+    flaggedantsInMain.clear();
+    for(size_t j=0; j<nants; ++j)
+      if(antflag[j])
+	flaggedantsInMain.insert(j);
+
+    idx.time.assign(idxtime, idxtime+nidx);
+    idx.field.assign(idxfield, idxfield+nidx);
+    idx.source.assign(idxsource, idxsource+nidx);
+    idx.state.assign(idxstate, idxstate+nidx);
+    idx.ddid.assign(idxddid, idxddid+nidx);
+    idx.hasSource.assign(idxhassource, idxhassource+nidx);
+
+    return res;
+  }
+
+}
@@ -0,0 +1,75 @@
+/**
+   Maintained by ESO since 2013.
+
+   This file is part of LibAIR and is licensed under GNU Public
+   License Version 2
+
+   \file wvrextract.hpp
+
+   Sidecar file holding the WVR data loaded from a measurement set and
+   the index of its main table, so that repeated runs on the same MS
+   do not need to scan its main table
+*/
+#ifndef _LIBAIR_APPS_WVREXTRACT_HPP__
+#define _LIBAIR_APPS_WVREXTRACT_HPP__
+
+#include <set>
+#include <string>
+
+namespace LibAIR2 {
+
+  // Forward declarations
+  class InterpArrayData;
+  struct MSScanIndex;
+
+  /** Name of the WVR extract file belonging to the MS msname, which
+      is placed next to the MS
+   */
+  std::string wvrExtractName(const std::string &msname);
+
+  /** Modification stamp of the table (or any directory) at path,
+      built from the modification times and sizes of the files below
+      it. The lock files are ignored since they change whenever the
+      table is opened.
+   */
+  std::string tableStamp(const std::string &path);
+
+  /** Write the WVR data d, the set of antennas flagged in the main
+      table and the index of the main table to the extract file fname
+
+      \param stamp The modification stamp of the MS, see tableStamp
+
+      \param params Description of the options used for loading the
+      data; the extract is only used again with the same options
+
+      The file is written to a temporary name first and then renamed
+      so that concurrent readers never see a partial file.
+   */
+  void writeWVRExtract(const std::string &fname,
+		       const std::string &stamp,
+		       const std::string &params,
+		       const InterpArrayData &d,
+		       const std::set<int> &flaggedantsInMain,
+		       const MSScanIndex &idx);
+
+  /** Read the WVR data and the index of the main table from the
+      extract file fname
+
+      The file is mapped into memory to check and read it, but the
+      data are copied into the returned object and idx, so this is no
+      cheaper than reading the file in the usual way.
+
+      \returns The data or NULL if the file does not exist, has a
+      different format version or byte order, or was made from a
+      different state of the MS (stamp) or with different options
+      (params); idx is then unchanged
+   */
+  InterpArrayData *readWVRExtract(const std::string &fname,
+				  const std::string &stamp,
+				  const std::string &params,
+				  std::set<int> &flaggedantsInMain,
+				  MSScanIndex &idx);
+
+}
+
+#endif
@@ -42,6 +42,13 @@ namespace LibAIR2 {
     return ISingleLayerWater::TbGrid(sr);
   }
 
+  const std::vector<double> &   ICloudyWater::TbAndDerivGrid(std::vector<double> &dTbdn)
+  {
+    updatePars();
+    sr.UpdateI(ISingleLayerWater::getBckg());
+    return ISingleLayerWater::TbAndDerivGrid(sr, dTbdn);
+  }
+
   void ICloudyWater::updatePars(void)
   {
     col.setN(tau183);
@@ -58,6 +58,12 @@ namespace LibAIR2 {
      */
     const std::vector<double> &   TbGrid(void);
 
+    /**
+       \note The continuum is behind the water layer and does not
+       depend on n. As TbGrid, this function is NOT virtual
+     */
+    const std::vector<double> &   TbAndDerivGrid(std::vector<double> &dTbdn);
+
 
   private:
     
@@ -109,6 +109,68 @@ namespace LibAIR2 {
     }
   }
 
+  /// Weighted running mean and sum of squared deviations of the four
+  /// dTdL coefficients (West 1979)
+  struct dTdLMomAcc {
+    double W;
+    double mean[4];
+    double M2[4];
+
+    dTdLMomAcc(void):
+      W(0)
+    {
+      for(size_t j=0; j<4; ++j)
+	mean[j]=M2[j]=0;
+    }
+
+    void add(const std::vector<double> &x,
+	     double w)
+    {
+      W+=w;
+      for(size_t j=0; j<4; ++j)
+      {
+	const double d=x[j]-mean[j];
+	mean[j]+=d*w/W;
+	M2[j]+=w*d*(x[j]-mean[j]);
+      }
+    }
+  };
+
+  void dTdLMom12(const std::list<Minim::WPPoint> &l,
+		 Minim::ModelDesc &md,
+		 const WVRAtmoQuants &model,
+		 double Z,
+		 double thresh,
+		 double *m1,
+		 double *m2)
+  {
+    std::vector<double> scratch(4, 0.0);
+    const double Pthresh= Z*thresh;
+    dTdLMomAcc acc;
+
+    for(std::list<Minim::WPPoint>::const_iterator i=l.begin();
+	i!= l.end();
+	++i)
+    {
+      const double w=i->w *exp(- i->ll);
+      if (w > Pthresh)
+      {
+	md.put(i->p);
+	model.dTdL_ND(scratch);
+	acc.add(scratch, w);
+      }
+    }
+    // The moments are normalised by the evidence rather than by the
+    // sum of the weights above the threshold, so the second moment is
+    // about m1 rather than about the weighted mean
+    const double norm= Z==0. ? 1.0 : Z;
+    for(size_t j=0; j<4; ++j) 
+    {
+      m1[j]=acc.W*acc.mean[j]/norm;
+      m2[j]=(acc.M2[j]+acc.W*std::pow(acc.mean[j]-m1[j], 2))/norm;
+    }
+  }
+
   struct CenFD_bind {
     WVRAtmoQuantModel &md;
     CenFD_bind(WVRAtmoQuantModel &md_) : md(md_) { }
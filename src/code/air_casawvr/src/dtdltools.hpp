@@ -54,6 +54,23 @@ namespace LibAIR2 {
 		double *res
 		);
 
+  /** Calculate both the mean and the variance of the dTdL
+      coefficients from a weighted likelihood point list
+
+      Gives the same results as dTdLMom1 followed by dTdLMom2 but
+      evaluates dTdL only once for each point. Unlike them it writes
+      no message if Z is zero, so that it can be used in the parallel
+      retrievals; the caller should report this.
+   */
+  void dTdLMom12(const std::list<Minim::WPPoint> &l,
+		 Minim::ModelDesc &md,
+		 const WVRAtmoQuants &model,
+		 double Z,
+		 double thresh,
+		 double *m1,
+		 double *m2
+		 );
+
   /** Calculate 2nd derivative of dT by DL
    */
   void dTdL2_ND(WVRAtmoQuantModel &m,
@@ -67,8 +67,20 @@ namespace LibAIR2 {
 	res[i]= mr->eval(tbg,i);
     }
 
+    /** The derivatives with respect to the water column are computed
+	analytically, together with the sky brightness, except at
+	n<=0 where finite differences are used
+     */
     virtual double dTdc (size_t ch) const
     {
+      if (am->n > 0)
+      {
+	std::vector<double> dtbg;
+	am->TbAndDerivGrid(dtbg);
+	return mr->eval(dtbg,
+			ch);
+      }
+
       const double invdelta = 0.5/n_bump( );
       const double on=am->n;
       
@@ -83,8 +95,18 @@ namespace LibAIR2 {
 
     void dTdc (std::vector<double> &res) const
     {
-      const double invdelta = 0.5/ n_bump( );
       const size_t nc = mr->nchannels();
+      if (am->n > 0)
+      {
+	std::vector<double> dtbg;
+	am->TbAndDerivGrid(dtbg);
+	res.resize(nc);
+	for (size_t i = 0 ; i < nc ; ++i)
+	  res[i]= mr->eval(dtbg,i);
+	return;
+      }
+
+      const double invdelta = 0.5/ n_bump( );
       const double on=am->n;
       
       std::vector<double> fwdval(nc);
@@ -19,7 +19,9 @@ namespace LibAIR2 {
   
   RTResult::RTResult(const std::vector<double> &fp):
     I(fp.size(), 0.0),
+    dI(fp.size(), 0.0),
     Tb(fp.size()),
+    dTb(fp.size()),
     _f(fp),
     f(_f)    
   {
@@ -34,11 +36,21 @@ namespace LibAIR2 {
     return Tb;
   }  
 
+  const std::vector<double> &  RTResult::UpdateTbDeriv()
+  {
+    for (size_t i =0 ; i< f.size() ; ++i)
+    {
+      dTb[i]  = dI[i] / std::pow(f[i],2)  * CSquared_On_TwoK;
+    }
+    return dTb;
+  }  
+
 
   SliceResult::SliceResult( const Slice & p_slice,
 			    const std::vector<double> & f ) :
     RTResult(f),
     tx(f.size()),
+    dtx(f.size()),
     slice(p_slice)
   {
 
@@ -56,6 +68,19 @@ namespace LibAIR2 {
     }
   }
 
+  void SliceResult::UpdateIDeriv(const SliceResult & bckg)
+  {
+
+    slice.ComputeTx( f, tx, dtx);
+    
+    for (size_t i =0 ; i< f.size() ; ++i)
+    {
+      const double B=BPlanck(f[i], slice.getT());
+      I[i]  = tx[i] * bckg.I[i] + B * (1-tx[i]) ;
+      dI[i] = tx[i] * bckg.dI[i] + dtx[i] * (bckg.I[i] - B) ;
+    }
+  }
+
   void SliceResult::UpdateI(void)
   {
     slice.ComputeTx( f, tx);
@@ -93,6 +118,27 @@ namespace LibAIR2 {
     I=current->getI();
     
   }
+
+  void LayerResult::UpdateIDeriv(const SliceResult & bckg)
+  {
+    typedef boost::shared_ptr<SliceResult> sr_p;
+
+    sr_p current( new SliceResult(bckg));
+    for ( Layer::sliceL_t::const_iterator slice = layer.getFar();
+	  slice != layer.getEnd();
+	  ++slice)
+    {
+      sr_p newslice( new SliceResult( **slice,
+				      f));
+      newslice->UpdateIDeriv( *current);
+      current=newslice;
+    }
+    
+    // Copy result
+    I=current->getI();
+    dI=current->getdI();
+    
+  }
   
 }
 
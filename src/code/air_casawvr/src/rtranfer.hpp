@@ -32,10 +32,18 @@ namespace LibAIR2 {
     /// Irradiance of this component
     std::vector<double> I;
 
+    /// Derivative of the irradiance with respect to the logarithm of
+    /// a common scaling of the column densities of all slices. Only
+    /// updated by UpdateIDeriv, and zero until it is first called
+    std::vector<double> dI;
+
   private:
     /// Brighness temperature of this component
     std::vector<double> Tb;
 
+    /// Derivative of the brightness temperature, as for dI
+    std::vector<double> dTb;
+
     /// Our copy of the frequency grid
     std::vector<double>  _f;
 
@@ -65,15 +73,33 @@ namespace LibAIR2 {
      */
     const std::vector<double> & UpdateTb(void);
 
+    /**
+       \brief Compute the derivative of the brightness temperature
+       from dI, as UpdateTb does from I
+     */
+    const std::vector<double> & UpdateTbDeriv(void);
+
     /** \brief Update the irradiance of this slice
      */
     virtual void UpdateI(const SliceResult & bckg) = 0;
 
+    /** \brief Update the irradiance of this slice and its derivative
+	with respect to the column densities, in the same pass
+	
+	The derivative of the background, bckg.dI, is included.
+     */
+    virtual void UpdateIDeriv(const SliceResult & bckg) = 0;
+
 
     const std::vector<double>  & getI(void)
     {
       return I;
     }
+
+    const std::vector<double>  & getdI(void)
+    {
+      return dI;
+    }
   };
 
   /**
@@ -85,6 +111,9 @@ namespace LibAIR2 {
     /// Transmissivity of this slice
     std::vector<double> tx;
 
+    /// Derivative of the transmissivity, see Slice::ComputeTx
+    std::vector<double> dtx;
+
   public:
 
     /// Const reference to slice that this result is for
@@ -97,6 +126,9 @@ namespace LibAIR2 {
     // ---------- Public interface ------------------------
 
     virtual void UpdateI(const SliceResult & bckg);
+
+    virtual void UpdateIDeriv(const SliceResult & bckg);
+
     /**
        Update irradiance assuming zero-temperature background. Only
        makes sense really for opaque slices.
@@ -124,6 +156,8 @@ namespace LibAIR2 {
 
     void UpdateI(const SliceResult & bckg);
 
+    void UpdateIDeriv(const SliceResult & bckg);
+
   };
   
   
@@ -72,6 +72,26 @@ namespace LibAIR2 {
   }
     
   
+  const std::vector<double> &
+  ISingleLayerWater::TbAndDerivGrid(std::vector<double> &dTbdn)
+  {
+    return TbAndDerivGrid(*bckg, dTbdn);
+  }
+
+  const std::vector<double> &
+  ISingleLayerWater::TbAndDerivGrid(const SliceResult &background,
+				    std::vector<double> &dTbdn)
+  {
+    updatePars();
+    sr->UpdateIDeriv(background);
+    // The derivative is with respect to ln(n)
+    const std::vector<double> &dTb=sr->UpdateTbDeriv();
+    dTbdn.resize(dTb.size());
+    for(size_t i=0; i<dTb.size(); ++i)
+      dTbdn[i]=dTb[i]/n;
+    return sr->UpdateTb();
+  }
+  
   const SliceResult & ISingleLayerWater::getBckg(void) const
   {
     return *bckg;
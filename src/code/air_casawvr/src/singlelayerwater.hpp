@@ -86,6 +86,21 @@ namespace LibAIR2 {
 
     const std::vector<double> &   TbGrid(const SliceResult &background);
 
+    /** \brief Calculate the brightness temperature and its derivative
+	with respect to the water vapour column n at each point in the
+	frequency grid, in a single radiative transfer calculation
+
+	The opacity of the water line and continuum columns is
+	proportional to n, so the derivative is exact. n must be
+	greater than zero.
+
+	\param dTbdn The derivatives (K/mm) are stored here
+     */
+    const std::vector<double> &   TbAndDerivGrid(std::vector<double> &dTbdn);
+
+    const std::vector<double> &   TbAndDerivGrid(const SliceResult &background,
+						 std::vector<double> &dTbdn);
+
     /** \brief Set the temperature of the background 
 
 	Normally the background will be the CMB @ 2.7K
@@ -50,6 +50,31 @@ namespace LibAIR2 {
     }
   }
 
+  void Slice::ComputeTx (const std::vector<double> & f,
+			 std::vector<double> & res,
+			 std::vector<double> & dres) const 
+  {
+    res.resize(f.size());
+    dres.resize(f.size());
+    
+    std::vector<double> scratch( f.size() , 0.0 );
+    std::vector<double> total  ( f.size() , 0.0 );
+    for ( size_t cn =0 ; cn < cols.size() ; ++cn)
+    {
+      cols[cn]->ComputeTau(f, *this, scratch );
+      for (size_t i =0 ; i < f.size() ; ++i )
+      {
+	total[i] += (scratch[i]*scale);
+      }
+    }
+    
+    for (size_t i =0 ; i < f.size() ; ++i )
+    {
+      res[i] = exp( -1.0 * total[i] );
+      dres[i] = -1.0 * res[i] * total[i];
+    }
+  }
+
   OpaqueSlice::OpaqueSlice( double T , double P):
     Slice(T,P)
   {
@@ -65,6 +90,14 @@ namespace LibAIR2 {
     }
   }
 
+  void OpaqueSlice::ComputeTx (const std::vector<double> & f,
+			       std::vector<double> & res,
+			       std::vector<double> & dres) const   
+  {
+    ComputeTx(f, res);
+    dres.assign(f.size(), 0.0);
+  }
+
 
 
 }
@@ -90,6 +90,20 @@ namespace LibAIR2 {
     virtual void ComputeTx (const std::vector<double> & f,
 			    std::vector<double> & res) const ;
 
+    /**
+       \brief Compute the transmission of this slice and its
+       derivative with respect to the logarithm of a common scaling of
+       all of the column densities
+
+       All columns have opacity proportional to their column density,
+       so the derivative is -tx*tau.
+
+       \param dres The derivatives are stored here
+     */
+    virtual void ComputeTx (const std::vector<double> & f,
+			    std::vector<double> & res,
+			    std::vector<double> & dres) const ;
+
   };
 
   /** \brief A slice whose transmission is always zero
@@ -108,6 +122,10 @@ namespace LibAIR2 {
     virtual void ComputeTx (const std::vector<double> & f,
 			    std::vector<double> & res) const ;
 
+    virtual void ComputeTx (const std::vector<double> & f,
+			    std::vector<double> & res,
+			    std::vector<double> & dres) const ;
+
   };
 
 
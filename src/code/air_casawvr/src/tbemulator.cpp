@@ -0,0 +1,423 @@
+/**
+   Maintained by ESO since 2013.
+
+   This file is part of LibAIR and is licensed under GNU Public
+   License Version 2
+
+   \file tbemulator.cpp
+
+*/
+
+#include <cmath>
+#include <cstdio>
+#include <cstring>
+#include <fstream>
+#include <stdexcept>
+#include <algorithm>
+#include <memory>
+#include <sstream>
+
+#include <stdint.h>
+
+#include <boost/scoped_ptr.hpp>
+
+#include "tbemulator.hpp"
+#include "model_make.hpp"
+#include "model_water.hpp"
+#include "singlelayerwater.hpp"
+#include "basicphys.hpp"
+
+namespace LibAIR2 {
+
+  /// Identifies the file type
+  static const char emuMagic[8]={'L', 'A', 'I', 'R', 'T', 'B', 'E', 'M'};
+
+  /// Increment whenever the layout or the tabulated model changes
+  static const uint32_t emuVersion=2;
+
+  /// Written in native byte order to detect files from other machines
+  static const uint32_t emuByteOrder=0x01020304;
+
+  /** Fixed size header at the start of the file, followed by the Tb
+      and dTb/dn arrays as double[nn][nT][nP][4]
+   */
+  struct EmuHeader {
+    char magic[8];
+    uint32_t version;
+    uint32_t byteorder;
+    double wvrchar[8];
+    double n0, dn, T0, dT, P0, dP;
+    uint64_t nn, nT, nP;
+    /// Result of maxError() when the table was computed
+    double maxerr[4];
+  };
+
+  TbEmulatorGrid::TbEmulatorGrid(void):
+    n0(0), dn(0.2), nn(201),
+    T0(250), dT(2.5), nT(19),
+    P0(300), dP(12.5), nP(21)
+  {
+  }
+
+  bool TbEmulatorGrid::operator==(const TbEmulatorGrid &o) const
+  {
+    return n0==o.n0 and dn==o.dn and nn==o.nn and
+      T0==o.T0 and dT==o.dT and nT==o.nT and
+      P0==o.P0 and dP==o.dP and nP==o.nP;
+  }
+
+  static void charArray(const ALMAWVRCharacter &c,
+			double *a)
+  {
+    a[0]=c.cf1; a[1]=c.cf2; a[2]=c.cf3; a[3]=c.cf4;
+    a[4]=c.bw1; a[5]=c.bw2; a[6]=c.bw3; a[7]=c.bw4;
+  }
+
+  /// The exact model and pointers to its n, T and P parameters
+  struct ExactModel {
+    boost::scoped_ptr<WaterModel<ISingleLayerWater> > m;
+    double *n, *T, *P;
+
+    ExactModel(const ALMAWVRCharacter &c):
+      m(mkSingleLayerWater(c, PartTable, AirCont)),
+      n(NULL), T(NULL), P(NULL)
+    {
+      std::vector<Minim::DParamCtr> pars;
+      m->AddParams(pars);
+      for(size_t i=0; i<pars.size(); ++i)
+      {
+	if (pars[i].name=="n")
+	  n=pars[i].p;
+	else if (pars[i].name=="T")
+	  T=pars[i].p;
+	else if (pars[i].name=="P")
+	  P=pars[i].p;
+      }
+    }
+  };
+
+  TbEmulatorTable::TbEmulatorTable(void)
+  {
+  }
+
+  TbEmulatorTable::TbEmulatorTable(const ALMAWVRCharacter &WVRChar,
+				   const TbEmulatorGrid &g):
+    wvrchar(WVRChar),
+    grid(g),
+    Tb(g.nn*g.nT*g.nP*4),
+    dTbdn(g.nn*g.nT*g.nP*4)
+  {
+    if (g.nn<2 or g.nT<2 or g.nP<2)
+      throw std::runtime_error("The Tb emulator grid needs at least two points along each axis");
+
+#pragma omp parallel
+    {
+      // The models are not thread-safe, so each thread has its own
+      ExactModel e(wvrchar);
+      std::vector<double> tb, d;
+#pragma omp for schedule(dynamic)
+      for(long i=0; i<(long)g.nn; ++i)
+      {
+	for(size_t j=0; j<g.nT; ++j)
+	{
+	  for(size_t l=0; l<g.nP; ++l)
+	  {
+	    *e.n=g.n0+i*g.dn;
+	    *e.T=g.T0+j*g.dT;
+	    *e.P=g.P0+l*g.dP;
+	    e.m->eval(tb);
+	    e.m->dTdc(d);
+	    const size_t o=((i*g.nT+j)*g.nP+l)*4;
+	    for(size_t k=0; k<4; ++k)
+	    {
+	      Tb[o+k]=tb[k];
+	      dTbdn[o+k]=d[k];
+	    }
+	  }
+	}
+      }
+    }
+    err=maxError();
+  }
+
+  TbEmulatorTable *TbEmulatorTable::read(const std::string &fname,
+					 const ALMAWVRCharacter &WVRChar,
+					 const TbEmulatorGrid &g)
+  {
+    std::ifstream ifs(fname.c_str(), std::ios::binary);
+    if (!ifs)
+      return NULL;
+    EmuHeader h;
+    if (!ifs.read(reinterpret_cast<char*>(&h), sizeof(h)))
+      return NULL;
+
+    double c[8];
+    charArray(WVRChar, c);
+    TbEmulatorGrid fg;
+    fg.n0=h.n0; fg.dn=h.dn; fg.nn=h.nn;
+    fg.T0=h.T0; fg.dT=h.dT; fg.nT=h.nT;
+    fg.P0=h.P0; fg.dP=h.dP; fg.nP=h.nP;
+    if (std::memcmp(h.magic, emuMagic, sizeof(h.magic))!=0 ||
+	h.version!=emuVersion ||
+	h.byteorder!=emuByteOrder ||
+	std::memcmp(h.wvrchar, c, sizeof(c))!=0 ||
+	!(fg==g))
+      return NULL;
+
+    std::unique_ptr<TbEmulatorTable> res(new TbEmulatorTable());
+    res->wvrchar=WVRChar;
+    res->grid=g;
+    for(size_t k=0; k<4; ++k)
+      res->err[k]=h.maxerr[k];
+    const size_t n=g.nn*g.nT*g.nP*4;
+    res->Tb.resize(n);
+    res->dTbdn.resize(n);
+    if (!ifs.read(reinterpret_cast<char*>(res->Tb.data()), n*sizeof(double)) ||
+	!ifs.read(reinterpret_cast<char*>(res->dTbdn.data()), n*sizeof(double)))
+      return NULL;
+    return res.release();
+  }
+
+  void TbEmulatorTable::write(const std::string &fname) const
+  {
+    EmuHeader h;
+    std::memset(&h, 0, sizeof(h));
+    std::memcpy(h.magic, emuMagic, sizeof(h.magic));
+    h.version=emuVersion;
+    h.byteorder=emuByteOrder;
+    charArray(wvrchar, h.wvrchar);
+    h.n0=grid.n0; h.dn=grid.dn; h.nn=grid.nn;
+    h.T0=grid.T0; h.dT=grid.dT; h.nT=grid.nT;
+    h.P0=grid.P0; h.dP=grid.dP; h.nP=grid.nP;
+    for(size_t k=0; k<4; ++k)
+      h.maxerr[k]=err[k];
+
+    const std::string tmpname=fname+".tmp";
+    {
+      std::ofstream ofs(tmpname.c_str(), std::ios::binary);
+      if (!ofs)
+	throw std::runtime_error("Could not open Tb emulator file "+tmpname+" for writing");
+      ofs.write(reinterpret_cast<const char*>(&h), sizeof(h));
+      ofs.write(reinterpret_cast<const char*>(Tb.data()), Tb.size()*sizeof(double));
+      ofs.write(reinterpret_cast<const char*>(dTbdn.data()), dTbdn.size()*sizeof(double));
+      if (!ofs)
+      {
+	std::remove(tmpname.c_str());
+	throw std::runtime_error("Could not write Tb emulator file "+tmpname);
+      }
+    }
+    if (std::rename(tmpname.c_str(), fname.c_str())!=0)
+    {
+      std::remove(tmpname.c_str());
+      throw std::runtime_error("Could not rename Tb emulator file to "+fname);
+    }
+  }
+
+  bool TbEmulatorTable::inside(double n,
+			       double T,
+			       double P) const
+  {
+    return n>=grid.n0 and n<=grid.n0+(grid.nn-1)*grid.dn and
+      T>=grid.T0 and T<=grid.T0+(grid.nT-1)*grid.dT and
+      P>=grid.P0 and P<=grid.P0+(grid.nP-1)*grid.dP;
+  }
+
+  /// Cell index and fractional position of x along one axis
+  static size_t cell(double x,
+		     double x0,
+		     double dx,
+		     size_t nx,
+		     double &f)
+  {
+    const double u=(x-x0)/dx;
+    size_t i=std::min(static_cast<size_t>(std::max(u, 0.)), nx-2);
+    f=u-i;
+    return i;
+  }
+
+  void TbEmulatorTable::eval(double n,
+			     double T,
+			     double P,
+			     boost::array<double, 4> &resTb,
+			     boost::array<double, 4> &resdTbdn) const
+  {
+    double fn, fT, fP;
+    const size_t i=cell(n, grid.n0, grid.dn, grid.nn, fn);
+    const size_t j=cell(T, grid.T0, grid.dT, grid.nT, fT);
+    const size_t l=cell(P, grid.P0, grid.dP, grid.nP, fP);
+
+    // Cubic Hermite basis along n, using the tabulated derivatives
+    const double h=grid.dn;
+    const double h00=(2*fn-3)*fn*fn+1, h10=((fn-2)*fn+1)*fn*h;
+    const double h01=(3-2*fn)*fn*fn, h11=(fn-1)*fn*fn*h;
+    const double g00=6*(fn-1)*fn/h, g10=(3*fn-4)*fn+1;
+    const double g01=-g00, g11=(3*fn-2)*fn;
+
+    resTb.fill(0);
+    resdTbdn.fill(0);
+    for(size_t c=0; c<4; ++c)
+    {
+      const size_t dj=c&1, dl=(c>>1)&1;
+      const double w=(dj ? fT : 1-fT)*(dl ? fP : 1-fP);
+      const size_t o0=((i*grid.nT+j+dj)*grid.nP+l+dl)*4;
+      const size_t o1=o0+grid.nT*grid.nP*4;
+      for(size_t k=0; k<4; ++k)
+      {
+	resTb[k]+=w*(h00*Tb[o0+k]+h10*dTbdn[o0+k]+h01*Tb[o1+k]+h11*dTbdn[o1+k]);
+	resdTbdn[k]+=w*(g00*Tb[o0+k]+g10*dTbdn[o0+k]+g01*Tb[o1+k]+g11*dTbdn[o1+k]);
+      }
+    }
+  }
+
+  std::string TbEmulatorTable::tag(void) const
+  {
+    std::ostringstream os;
+    os<<"tbemulator-"<<emuVersion<<"-"
+      <<grid.n0<<"-"<<grid.dn<<"-"<<grid.nn<<"-"
+      <<grid.T0<<"-"<<grid.dT<<"-"<<grid.nT<<"-"
+      <<grid.P0<<"-"<<grid.dP<<"-"<<grid.nP;
+    return os.str();
+  }
+
+  boost::array<double, 4> TbEmulatorTable::maxError(size_t stride) const
+  {
+    boost::array<double, 4> res;
+    res.fill(0);
+    if (stride<1)
+      stride=1;
+
+#pragma omp parallel
+    {
+      ExactModel e(wvrchar);
+      std::vector<double> tb;
+      boost::array<double, 4> emuTb, emudTbdn, err;
+      err.fill(0);
+#pragma omp for schedule(dynamic)
+      for(long i=0; i<(long)grid.nn-1; i+=stride)
+      {
+	for(size_t j=0; j+1<grid.nT; j+=stride)
+	{
+	  for(size_t l=0; l+1<grid.nP; l+=stride)
+	  {
+	    *e.n=grid.n0+(i+0.5)*grid.dn;
+	    *e.T=grid.T0+(j+0.5)*grid.dT;
+	    *e.P=grid.P0+(l+0.5)*grid.dP;
+	    e.m->eval(tb);
+	    eval(*e.n, *e.T, *e.P, emuTb, emudTbdn);
+	    for(size_t k=0; k<4; ++k)
+	      err[k]=std::max(err[k], std::fabs(emuTb[k]-tb[k]));
+	  }
+	}
+      }
+#pragma omp critical(LibAIR2_tbemulator)
+      for(size_t k=0; k<4; ++k)
+	res[k]=std::max(res[k], err[k]);
+    }
+    return res;
+  }
+
+  TbEmulatorModel::TbEmulatorModel(const TbEmulatorTable &table):
+    table(table),
+    exact(mkSingleLayerWater(table.g_WVRChar(), PartTable, AirCont)),
+    n(0),
+    T(0),
+    P(0)
+  {
+  }
+
+  TbEmulatorModel::~TbEmulatorModel()
+  {
+  }
+
+  bool TbEmulatorModel::useExact(void) const
+  {
+    if (table.inside(n, T, P))
+      return false;
+    std::vector<Minim::DParamCtr> pars;
+    exact->AddParams(pars);
+    for(size_t i=0; i<pars.size(); ++i)
+    {
+      if (pars[i].name=="n")
+	*pars[i].p=n;
+      else if (pars[i].name=="T")
+	*pars[i].p=T;
+      else if (pars[i].name=="P")
+	*pars[i].p=P;
+    }
+    return true;
+  }
+
+  double TbEmulatorModel::eval(size_t ch) const
+  {
+    if (useExact())
+      return exact->eval(ch);
+    boost::array<double, 4> tb, d;
+    table.eval(n, T, P, tb, d);
+    return tb[ch];
+  }
+
+  void TbEmulatorModel::eval(std::vector<double> &res) const
+  {
+    if (useExact())
+    {
+      exact->eval(res);
+      return;
+    }
+    boost::array<double, 4> tb, d;
+    table.eval(n, T, P, tb, d);
+    res.assign(tb.begin(), tb.end());
+  }
+
+  double TbEmulatorModel::dTdc(size_t ch) const
+  {
+    if (useExact())
+      return exact->dTdc(ch);
+    boost::array<double, 4> tb, d;
+    table.eval(n, T, P, tb, d);
+    return d[ch];
+  }
+
+  double TbEmulatorModel::dTdL_ND(size_t ch) const
+  {
+    return dTdc(ch) / SW_WaterToPath_Simplified(1.0,
+						T);
+  }
+
+  void TbEmulatorModel::dTdL_ND(std::vector<double> &res) const
+  {
+    if (useExact())
+    {
+      exact->dTdL_ND(res);
+      return;
+    }
+    boost::array<double, 4> tb, d;
+    table.eval(n, T, P, tb, d);
+    const double conv = 1.0 / SW_WaterToPath_Simplified(1.0,
+							T);
+    res.resize(4);
+    for (size_t i =0 ; i < res.size() ; ++i)
+      res[i] = d[i]*conv;
+  }
+
+  void TbEmulatorModel::AddParams(std::vector< Minim::DParamCtr > &pars)
+  {
+    pars.push_back(Minim::DParamCtr ( &n ,
+				      "n",
+				      true     ,
+				      "Water column (mm)"
+				      ));
+
+    pars.push_back(Minim::DParamCtr ( &T ,
+				      "T",
+				      true     ,
+				      "Temperature (K)"
+				      ));
+
+    pars.push_back(Minim::DParamCtr ( &P ,
+				      "P",
+				      true     ,
+				      "Pressure (mBar)"
+				      ));
+  }
+
+}
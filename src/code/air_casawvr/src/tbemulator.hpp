@@ -0,0 +1,188 @@
+/**
+   Maintained by ESO since 2013.
+
+   This file is part of LibAIR and is licensed under GNU Public
+   License Version 2
+
+   \file tbemulator.hpp
+
+   Tabulated sky brightness of the single layer water vapour model,
+   used in place of the radiative transfer calculation in the
+   retrievals
+*/
+#ifndef _LIBAIR_TBEMULATOR_HPP__
+#define _LIBAIR_TBEMULATOR_HPP__
+
+#include <vector>
+#include <string>
+#include <boost/array.hpp>
+#include <boost/scoped_ptr.hpp>
+
+#include "model_iface.hpp"
+#include "radiometermeasure.hpp"
+
+namespace LibAIR2 {
+
+  // Forward declarations
+  class ISingleLayerWater;
+  template<class AM> class WaterModel;
+
+  /** \brief Regular grid in water vapour column, temperature and
+      pressure on which the sky brightness is tabulated
+
+      The zenith angle is not a dimension of the grid: the plane
+      parallel model depends on it only through the slant water
+      column n/cos(za), so n here is the slant column and nmax must
+      cover the lowest elevation of interest.
+   */
+  struct TbEmulatorGrid {
+    /// Slant water vapour column (mm)
+    double n0, dn;
+    size_t nn;
+    /// Temperature (K)
+    double T0, dT;
+    size_t nT;
+    /// Pressure (mBar)
+    double P0, dP;
+    size_t nP;
+
+    /// By default covers the priors of ALMAAbsRet down to an
+    /// elevation of about 15 degrees
+    TbEmulatorGrid(void);
+
+    bool operator==(const TbEmulatorGrid &o) const;
+  };
+
+  /** \brief Sky brightness and its derivative with respect to the
+      water column of the four WVR channels, tabulated for one WVR
+      characterisation
+
+      The values are those of mkSingleLayerWater(WVRChar, PartTable,
+      AirCont). They are interpolated by cubic Hermite polynomials in
+      the water column, using the tabulated derivatives, and linearly
+      in temperature and pressure.
+   */
+  class TbEmulatorTable {
+
+    ALMAWVRCharacter wvrchar;
+    TbEmulatorGrid grid;
+    /// Tb and dTb/dn of channel k at grid point (i, j, l) at
+    /// ((i*nT+j)*nP+l)*4+k
+    std::vector<double> Tb, dTbdn;
+    /// maxError() of the table, computed once when it is made
+    boost::array<double, 4> err;
+
+    TbEmulatorTable(void);
+
+  public:
+
+    /** Compute the table by evaluating the model at each grid point,
+	and its interpolation error by maxError()
+     */
+    TbEmulatorTable(const ALMAWVRCharacter &WVRChar,
+		    const TbEmulatorGrid &g=TbEmulatorGrid());
+
+    /** Read a table written by write()
+
+	\returns The table, or NULL if the file does not exist, has a
+	different format version or byte order, or was computed for a
+	different WVR characterisation or grid
+     */
+    static TbEmulatorTable *read(const std::string &fname,
+				 const ALMAWVRCharacter &WVRChar,
+				 const TbEmulatorGrid &g=TbEmulatorGrid());
+
+    /** Write the table to fname, through a temporary file which is
+	then renamed
+     */
+    void write(const std::string &fname) const;
+
+    const ALMAWVRCharacter &g_WVRChar(void) const
+    {
+      return wvrchar;
+    }
+
+    /** True if (n, T, P) is inside the grid
+     */
+    bool inside(double n,
+		double T,
+		double P) const;
+
+    /** Interpolate the brightness temperatures and their derivatives
+	with respect to the water column at (n, T, P), which must be
+	inside the grid
+     */
+    void eval(double n,
+	      double T,
+	      double P,
+	      boost::array<double, 4> &resTb,
+	      boost::array<double, 4> &resdTbdn) const;
+
+    /** Largest difference, in each channel, between the interpolated
+	and the exact brightness temperatures, evaluated at the centres
+	of every stride-th grid cell along each axis, where the error
+	of the interpolation is largest
+
+	\note Evaluates the exact model about as many times as making
+	the table does; g_maxError() gives the result stored with the
+	table
+     */
+    boost::array<double, 4> maxError(size_t stride=1) const;
+
+    /** maxError() as computed when the table was made
+     */
+    const boost::array<double, 4> &g_maxError(void) const
+    {
+      return err;
+    }
+
+    /** Identifies the format version and grid of the table, so that
+	results computed with different tables can be told apart
+     */
+    std::string tag(void) const;
+
+  };
+
+  /** \brief Single layer water vapour model evaluated from a
+      TbEmulatorTable
+
+      Has the same parameters (n, T, P) as the model made by
+      mkSingleLayerWater and can be used in its place. Outside the grid
+      of the table the exact model is used.
+   */
+  class TbEmulatorModel:
+    public WVRAtmoQuantModel
+  {
+    const TbEmulatorTable &table;
+    boost::scoped_ptr<WaterModel<ISingleLayerWater> > exact;
+
+    double n, T, P;
+
+    /// Transfer the parameters to the exact model, returning true if
+    /// it is needed
+    bool useExact(void) const;
+
+  public:
+
+    /**
+       \param table The table; must outlive this object
+     */
+    TbEmulatorModel(const TbEmulatorTable &table);
+
+    virtual ~TbEmulatorModel();
+
+    // Inherited from WVRAtmoQuants
+    virtual double eval(size_t ch) const;
+    virtual void eval(std::vector<double> &res) const;
+    virtual double dTdc(size_t ch) const;
+    virtual double dTdL_ND(size_t ch) const;
+    virtual void dTdL_ND(std::vector<double> &res) const;
+
+    // Inherited from WVRAtmoModel
+    void AddParams(std::vector< Minim::DParamCtr > &pars);
+
+  };
+
+}
+
+#endif
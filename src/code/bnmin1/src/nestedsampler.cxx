@@ -39,8 +39,11 @@ namespace Minim {
     //ps(new CSPAdaptive(ml, *this, sigmas)),
     ps(new CSRMSSS(ml, *this, g_ss())),
     initials(new InitialWorst()),
+    stop(StopNSamples),
+    nsampled(0),
     mon(NULL),
-    n_psample(100)
+    n_psample(100),
+    Ztol(0)
   {
     llPoint(ml,
 	    start,
@@ -62,8 +65,11 @@ namespace Minim {
     ml(ml),
     ps(NULL),
     initials(new InitialWorst()),
+    stop(StopNSamples),
+    nsampled(0),
     mon(NULL),
-    n_psample(100)
+    n_psample(100),
+    Ztol(0)
   {
   }
 
@@ -91,6 +97,8 @@ namespace Minim {
 			 g_ss()));
     Zseq=boost::assign::list_of(0.0).convert_to_container<std::vector<double> >( );
     Xseq=boost::assign::list_of(1.0).convert_to_container<std::vector<double> >( );
+    stop=StopNSamples;
+    nsampled=0;
     llPoint(ml,
 	    *this,
 	    start,
@@ -109,8 +117,20 @@ namespace Minim {
 
   double NestedS::sample(size_t j)
   {
+    stop=StopNSamples;
+    nsampled=0;
     for (size_t i=0; i<j; ++i)
     {
+      // The live set is ordered by increasing -log(L), so the best
+      // point is the first
+      const double Zrem=exp(-ss.begin()->ll)*Xseq[Xseq.size()-1];
+      const double Zcur=Zseq[Zseq.size()-1];
+      if (Ztol > 0 and Zcur > 0 and Zrem < Ztol*Zcur)
+      {
+	stop=StopEvidence;
+	break;
+      }
+
       std::set<MCPoint>::iterator worst( --ss.end() );
 
       const double Llow=exp(-worst->ll);
@@ -142,6 +162,7 @@ namespace Minim {
 	// they haven not actually advanced their chain at all. See
 	// below.
 
+	stop=StopNotBetter;
 	break;
       }
 
@@ -152,6 +173,7 @@ namespace Minim {
 
       // Erase old point
       ss.erase(worst);
+      ++nsampled;
       
       std::pair<std::set<MCPoint>::iterator, bool> r=ss.insert(np);
       if (not r.second)
@@ -162,6 +184,7 @@ namespace Minim {
 
 	// Note that this is often due to the chain not avancing in
 	// the constained sampler.
+	stop=StopDuplicate;
 	break;
       }
 
@@ -177,6 +200,16 @@ namespace Minim {
     return Zseq[Zseq.size()-1];
   }
 
+  NestedS::StopReason NestedS::g_stop(void) const
+  {
+    return stop;
+  }
+
+  size_t NestedS::g_nsampled(void) const
+  {
+    return nsampled;
+  }
+
   
   const std::list<WPPoint> & NestedS::g_post(void) const
   {
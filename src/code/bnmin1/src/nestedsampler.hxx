@@ -41,6 +41,22 @@ namespace Minim {
   class NestedS:
     public ModelDesc
   {
+  public:
+
+    /// Reasons for sample() to stop
+    enum StopReason {
+      /// The requested number of samples was taken
+      StopNSamples,
+      /// The constrained sampler did not find a better point
+      StopNotBetter,
+      /// The new point had the same likelihood as a live point
+      StopDuplicate,
+      /// The evidence had converged to within Ztol
+      StopEvidence
+    };
+
+  private:
+
     /** \brief Sample (or "live")set
 	
 	This is the current set of points
@@ -72,6 +88,12 @@ namespace Minim {
 
     /// The strategy for picking the inital point
     boost::scoped_ptr<NestedInitial> initials;
+
+    /// Why the last call to sample() stopped
+    StopReason stop;
+
+    /// Number of samples taken by the last call to sample()
+    size_t nsampled;
     
   public:
 
@@ -84,6 +106,14 @@ namespace Minim {
     /// the likelihood constraint 
     size_t n_psample;
 
+    /** Stop sampling once the evidence of the remaining prior volume,
+	estimated as the largest likelihood in the live set times the
+	remaining volume, is less than this fraction of the evidence
+	accumulated so far. Zero (the default) to always take the
+	requested number of samples.
+     */
+    double Ztol;
+
 
     // -------------- Construction/Destruction ---------------------
 
@@ -133,10 +163,21 @@ namespace Minim {
     /** \brief Return current evidence estimate */
     double Z(void) const;
 
-    /** \brief Take j samples and return evidence estimate
+    /** \brief Take up to j samples and return evidence estimate
+
+	Fewer samples are taken if a better point can not be found or
+	the evidence has converged according to Ztol; see g_stop()
      */
     double sample(size_t j);
 
+    /** \brief Why the last call to sample() stopped
+     */
+    StopReason g_stop(void) const;
+
+    /** \brief Number of samples taken by the last call to sample()
+     */
+    size_t g_nsampled(void) const;
+
     /** \brief Return the points describing the posterior
      */
     const std::list<WPPoint> & g_post(void) const;
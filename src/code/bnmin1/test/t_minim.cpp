@@ -444,6 +444,30 @@ void t_NestedSampling_Gauss()
 	      0.1));
 }
 
+void t_NestedSampling_Ztol()
+{
+  using namespace Minim;
+  const size_t nsample=150;
+  const double Ztol=1e-2;
+
+  // Without a tolerance all requested samples are taken
+  pdesc full=mkDesc(1.0, false);
+  const double Zfull=full.s->sample(nsample);
+  AlwaysAssertExit(full.s->g_stop() == NestedS::StopNSamples);
+  AlwaysAssertExit(full.s->g_nsampled() == nsample);
+  AlwaysAssertExit(full.s->g_post().size() == nsample);
+
+  // The same sequence of samples, stopped once the remaining
+  // evidence is less than Ztol of the accumulated evidence
+  pdesc early=mkDesc(1.0, false);
+  early.s->Ztol=Ztol;
+  const double Zearly=early.s->sample(nsample);
+  AlwaysAssertExit(early.s->g_stop() == NestedS::StopEvidence);
+  AlwaysAssertExit(early.s->g_nsampled() < nsample);
+  AlwaysAssertExit(early.s->g_post().size() == early.s->g_nsampled());
+  AlwaysAssertExit(near(Zearly, Zfull, Ztol));
+}
+
 void t_NestedSampling()
 {  
   using namespace Minim;
@@ -746,6 +770,8 @@ int main()
   //t_LineTwoErr_LavMarq();
   std::cout << "t_NestedSampling_Gauss" << std::endl;
   t_NestedSampling_Gauss();
+  std::cout << "t_NestedSampling_Ztol" << std::endl;
+  t_NestedSampling_Ztol();
   std::cout << "t_NestedSampling" << std::endl;
   t_NestedSampling();
 
@@ -1,7 +1,90 @@
 import os
+import json
+import shlex
 import numpy
 from casatasks import casalog
-from casatools import ctsys, ms, calibrater, quanta
+from casatools import ctsys, ms, quanta
+
+from . import wvrgcal_cache
+
+try:
+    from . import _wvrgcal
+except ImportError:
+    _wvrgcal = None
+
+def _run_inprocess(wvrgcal_args):
+    """
+    Run wvrgcal in this process through the _wvrgcal extension module.
+    Returns the exit status in the form of an os.system return value,
+    as _run_standalone does, the exit status itself, the antenna
+    information table and whether it is complete.
+    """
+    res = _wvrgcal.run(wvrgcal_args)
+    for ll in res['log'].splitlines():
+        casalog.post(ll.expandtabs())
+
+    info = { 'Name': [], 'WVR': [], 'Flag': [], 'RMS_um': [], 'Disc_um': [] }
+    if res['rval'] == 0:
+        # round as in the printed table so that results do not depend on how wvrgcal was run
+        info = { 'Name': res['Name'],
+                 'WVR': res['WVR'],
+                 'Flag': res['Flag'],
+                 'RMS_um': [ float('%4.3g' % x) for x in res['RMS_um'] ],
+                 'Disc_um': [ float('%4.3g' % x) for x in res['Disc_um'] ] }
+
+    return res['rval'] << 8, res['rval'], info, True
+
+def _run_standalone(theexecutable, wvrgcal_args):
+    """
+    Run the wvrgcal executable and read the antenna information table
+    from the JSON results file it writes. Returns the os.system return
+    value, the exit status, the antenna information table and whether
+    it could be read without errors.
+    """
+    execute_string = ' '.join([theexecutable] + [ shlex.quote(a) for a in wvrgcal_args ])
+
+    casalog.post('Running '+theexecutable+' standalone invoked as:')
+    casalog.post(execute_string)
+    print(execute_string)
+
+    templogfile = 'wvrgcal_tmp_'+str(numpy.random.randint(1E6,1E8))
+    if not os.access(".", os.W_OK):
+        import tempfile
+        templogfile = tempfile.gettempdir()+"/"+templogfile
+    tempresfile = templogfile+'.json'
+
+    rval = os.system(execute_string + ' --results-out ' + shlex.quote(tempresfile)
+                     + " > "+ templogfile)
+
+    fp = open(templogfile)
+    loglines = fp.readlines()
+    fp.close()
+
+    for ll in loglines:
+        casalog.post(ll.expandtabs())
+
+    info = { 'Name': [], 'WVR': [], 'Flag': [], 'RMS_um': [], 'Disc_um': [] }
+    parsingok = True
+
+    if rval==0:
+        try:
+            with open(tempresfile) as fp:
+                results = json.load(fp)
+            for ant in results['antennas']:
+                info['Name'].append(ant['name'])
+                info['WVR'].append(ant['wvr'])
+                info['Flag'].append(ant['flag'])
+                # round as in the printed table so that results do not depend on how wvrgcal was run
+                info['RMS_um'].append(float('%4.3g' % ant['rms_um']))
+                info['Disc_um'].append(float('%4.3g' % ant['disc_um']))
+        except (IOError, ValueError, KeyError) as e:
+            casalog.post('Error reading wvrgcal results file '+tempresfile+': '+str(e),'WARN')
+            info = { 'Name': [], 'WVR': [], 'Flag': [], 'RMS_um': [], 'Disc_um': [] }
+            parsingok = False
+
+    os.system('rm -rf '+templogfile+' '+tempresfile)
+
+    return rval, os.WEXITSTATUS(rval), info, parsingok
 
 def wvrgcal(vis=None, caltable=None, toffset=None, segsource=None,
         sourceflag=None, tie=None, nsol=None, disperse=None, 
@@ -9,7 +92,7 @@ def wvrgcal(vis=None, caltable=None, toffset=None, segsource=None,
         scale=None, spw=None, wvrspw=None,
         reversespw=None,  cont=None, maxdistm=None,
         minnumants=None, mingoodfrac=None, usefieldtab=None, 
-        refant=None, offsetstable=None):
+        refant=None, offsetstable=None, smoothtype=None):
     """
     Generate a gain table based on Water Vapour Radiometer data.
     Returns a dictionary containing the RMS of the path length variation
@@ -57,7 +140,7 @@ def wvrgcal(vis=None, caltable=None, toffset=None, segsource=None,
                                                                 
       smooth -- Smooth the calibration solution on the given timescale 
                  default: '' (no smoothing), example: '3s' smooth on a timescale of 3 seconds
-             
+
       scale -- Scale the entire phase correction by this factor                                
                  default: 1. (no scaling)                                            
 
@@ -98,6 +181,9 @@ def wvrgcal(vis=None, caltable=None, toffset=None, segsource=None,
              default: '' (do not apply any offsets)
              examples: 'uid___A002_Xabd867_X2277.cloud_offsets' use the given table
 
+      smoothtype -- Type of smoothing used with smooth: 'mean' or 'median'
+                 default: 'mean'
+
         """
     #Python script
 
@@ -117,32 +203,35 @@ def wvrgcal(vis=None, caltable=None, toffset=None, segsource=None,
         if os.path.exists(caltable):
             raise Exception("Output caltable %s already exists - will not overwrite." % caltable)
 
-        execute_string=  '--ms ' + vis
+        wvrgcal_args = ['--ms', vis]
+
+        wvrgcal_args += ['--output', caltable]
 
-        smoothing = -1
         if (type(smooth)==str and smooth!=''):
             smoothing = qa.convert(qa.quantity(smooth), 's')['value']
-            execute_string+= ' --output ' + caltable + '_unsmoothed'
-        else:
-            execute_string+= ' --output ' + caltable
+            if smoothtype not in [None, '', 'mean', 'median']:
+                raise Exception("Parameter smoothtype must be 'mean' or 'median'.")
+            wvrgcal_args += ['--smoothtime', str(smoothing)]
+            if smoothtype=='median':
+                wvrgcal_args += ['--smoothtype', 'median']
 
         
-        execute_string+= ' --toffset ' + str(toffset)
+        wvrgcal_args += ['--toffset', str(toffset)]
 
         if nsol>1:
             if not segsource:
-                execute_string+= ' --nsol ' + str(nsol)
+                wvrgcal_args += ['--nsol', str(nsol)]
             else:
                 raise Exception("In order to use nsol>1, segsource must be set to False." % caltable)
         if segsource:
-            execute_string+= ' --segsource'
+            wvrgcal_args += ['--segsource']
 
         if segsource and (len(sourceflag)>0):
             for src in sourceflag:
                 if not (type(src)==int or type(src)==str):
                     raise Exception("List elements of parameter sourceflag must be int or string.")
                 if (src != ''):
-                    execute_string += ' --sourceflag \"'+str(src)+'\"'
+                    wvrgcal_args += ['--sourceflag', str(src)]
 
         if segsource and (len(tie)>0):
             for i in range(0,len(tie)):
@@ -150,31 +239,29 @@ def wvrgcal(vis=None, caltable=None, toffset=None, segsource=None,
                 if not (type(src)==str):
                     raise Exception("List elements of parameter tie must be strings.")
                 if (src != ''):
-                    execute_string += ' --tie '
-                    execute_string += '\"'+str(src)+'\"'
-                    if not (i==len(tie)-1):
-                        execute_string += ' '
+                    wvrgcal_args += ['--tie', str(src)]
                         
         if (len(spw)>0):
             for myspw in spw:
                 if not (type(myspw)==int):
                     raise Exception("List elements of parameter spw must be int.")
                 if (myspw>=0):
-                    execute_string += ' --spw '+str(myspw)
+                    wvrgcal_args += ['--spw', str(myspw)]
 
         if (len(wvrspw)>0):
             for myspw in wvrspw:
                 if not (type(myspw)==int):
                     raise Exception("List elements of parameter wvrspw must be int.")
                 if (myspw>=0):
-                    execute_string += ' --wvrspw '+str(myspw)
+                    wvrgcal_args += ['--wvrspw', str(myspw)]
             
 
         if not (reversespw==''):
             spws = mst.msseltoindex(vis=vis,spw=reversespw)['spw']
             for id in spws:
-                execute_string += ' --reversespw '+str(id)
+                wvrgcal_args += ['--reversespw', str(id)]
 
+        disptable = ''
         if disperse:
             dispdirpath = os.getenv('WVRGCAL_DISPDIR', '')
             if not os.path.exists(dispdirpath+'/libair-ddefault.csv'):
@@ -186,20 +273,21 @@ def wvrgcal(vis=None, caltable=None, toffset=None, segsource=None,
                 
                 os.putenv('WVRGCAL_DISPDIR', dispdirpath)
                 
-            execute_string+= ' --disperse'
-            casalog.post('Using dispersion table '+dispdirpath+'/libair-ddefault.csv')
+            wvrgcal_args += ['--disperse']
+            disptable = dispdirpath+'/libair-ddefault.csv'
+            casalog.post('Using dispersion table '+disptable)
 
         if cont:
             if not segsource:
-                execute_string+= ' --cont'
+                wvrgcal_args += ['--cont']
             else:
                 raise Exception("cont and segsource are not permitted to be True at the same time.")
 
         if usefieldtab:
-            execute_string+= ' --usefieldtab'
+            wvrgcal_args += ['--usefieldtab']
                 
         if offsetstable!='' and type(offsetstable)==str:
-            execute_string+= ' --offsets '+offsetstable
+            wvrgcal_args += ['--offsets', offsetstable]
 
         if (len(wvrflag)>0):
             theflagants = ""
@@ -211,7 +299,7 @@ def wvrgcal(vis=None, caltable=None, toffset=None, segsource=None,
                         theflagants += ","
                     theflagants += str(ant)
             if len(theflagants)>0:
-                execute_string += ' --wvrflag \"'+str(theflagants)+'\"'
+                wvrgcal_args += ['--wvrflag', str(theflagants)]
 
         if (type(refant)!=list):
             refant = [refant]
@@ -225,107 +313,60 @@ def wvrgcal(vis=None, caltable=None, toffset=None, segsource=None,
                         therefants += ","
                     therefants += str(ant)
             if len(therefants)>0:
-                execute_string += ' --refant \"'+str(therefants)+'\"'
+                wvrgcal_args += ['--refant', str(therefants)]
 
         if not (statfield==None or statfield=="") and type(statfield)==str:
-            execute_string += ' --statfield \"'+ statfield + '\"'
+            wvrgcal_args += ['--statfield', statfield]
 
         if not (statsource==None or statsource=="") and type(statsource)==str:
-            execute_string += ' --statsource \"'+ statsource + '\"'
+            wvrgcal_args += ['--statsource', statsource]
 
         if (scale != 1.):
-            execute_string+= ' --scale ' + str(scale)
+            wvrgcal_args += ['--scale', str(scale)]
         
         if (maxdistm>=0.):
-            execute_string+= ' --maxdistm ' + str(maxdistm)
+            wvrgcal_args += ['--maxdistm', str(maxdistm)]
         
         if (minnumants>=0):
-            execute_string+= ' --minnumants ' + str(minnumants)
+            wvrgcal_args += ['--minnumants', str(minnumants)]
         
         if (0.<=mingoodfrac and mingoodfrac<=1.):
-            execute_string+= ' --mingoodfrac ' + str(mingoodfrac)
+            wvrgcal_args += ['--mingoodfrac', str(mingoodfrac)]
 
         theexecutable = os.path.join(os.path.abspath(os.path.dirname(os.path.dirname(__file__))), '__bin__', 'wvrgcal')
-        execute_string = theexecutable+' '+execute_string
-
-        casalog.post('Running '+theexecutable+' standalone invoked as:')
-        casalog.post(execute_string)
-        print(execute_string)
 
-        templogfile = 'wvrgcal_tmp_'+str(numpy.random.randint(1E6,1E8))
-        if not os.access(".", os.W_OK):
-            import tempfile
-            templogfile = tempfile.gettempdir()+"/"+templogfile
-            
-        rval = os.system(execute_string + " > "+ templogfile)
-
-        fp = open(templogfile)
-        loglines = fp.readlines()
-        fp.close()
-
-        # prepare variables for parsing log lines to extract info table
-        hfound = False
-        hend = False
-        namel = []
-        wvrl = []
-        flagl = []
-        rmsl = []
-        discl = []
-        parsingok = True
-        
-        for ll in loglines:
-            casalog.post(ll.expandtabs())
-            if hfound:
-                if "Expected performance" in ll:
-                    hend = True
-                elif not hend:
-                    vals = ll.split()
-                    wvrv = False
-                    flagv = False
-                    rmsv = 0.
-                    discv = 0.
-                    if(len(vals)!=6):
-                        casalog.post('Error parsing wvrgcal info table.line: '+ll,'WARN')
-                        parsingok=False
-                    else:
-                        if vals[2]=='Yes':
-                            wvrv=True
-                        else:
-                            wvrv=False
-                        if vals[3]=='Yes':
-                            flagv=True
-                        else:
-                            flagv=False
-                    try:
-                        rmsv = float(vals[4])
-                    except:
-                        casalog.post('Error parsing RMS value in info table line: '+ll,'WARN')
-                        rmsv = -1.
-                        parsingok=False
-                    try:
-                        discv = float(vals[5])
-                    except:
-                        casalog.post('Error parsing Disc. value in info table line: '+ll,'WARN')
-                        discv = -1.
-                        parsingok=False
-
-                    namel.append(vals[1])
-                    wvrl.append(wvrv)
-                    flagl.append(flagv)
-                    rmsl.append(rmsv)
-                    discl.append(discv)
-
-                    
-            elif (rval==0) and (not hend) and ("Disc (um)" in ll):
-                hfound = True
-
-        # end for ll
-
-        os.system('rm -rf '+templogfile)
+        cachekey = None
+        cached = None
+        if wvrgcal_cache.cachedir() is not None:
+            try:
+                cachekey = wvrgcal_cache.fingerprint(vis, wvrgcal_args,
+                                                     offsetstable if type(offsetstable)==str else '',
+                                                     disptable,
+                                                     _wvrgcal.__file__ if _wvrgcal is not None else theexecutable)
+                cached = wvrgcal_cache.lookup(cachekey, vis, caltable)
+            except Exception as instance:
+                casalog.post('Cannot use the wvrgcal cache, running without it: '+str(instance), 'WARN')
+                cachekey = None
+                cached = None
+            if cached is not None:
+                casalog.post('Using the cached result of an identical wvrgcal run from '
+                             +wvrgcal_cache.cachedir())
+                return cached
+
+        if _wvrgcal is not None:
+            casalog.post('Running wvrgcal in-process invoked as:')
+            casalog.post(' '.join(['wvrgcal'] + wvrgcal_args))
+            rval, rcode, info, parsingok = _run_inprocess(wvrgcal_args)
+        else:
+            rval, rcode, info, parsingok = _run_standalone(theexecutable, wvrgcal_args)
 
+        namel = info['Name']
+        flagl = info['Flag']
+        rmsl = info['RMS_um']
+        discl = info['Disc_um']
 
         taskrval = { 'Name': namel,
-                 'WVR': wvrl,
+                 'WVR': info['WVR'],
                  'Flag': flagl,
                  'RMS_um': rmsl,
                  'Disc_um': discl,
@@ -338,26 +379,21 @@ def wvrgcal(vis=None, caltable=None, toffset=None, segsource=None,
                          +' could not be interpolated due to insufficient number of near antennas. Was set to unity.',
                          'WARN')
 
-        if (rval==0) and parsingok:
+        if (rcode==0) and parsingok:
             taskrval['success'] = True
+            if cachekey is not None:
+                wvrgcal_cache.store(cachekey, vis, caltable, taskrval)
         
 
-        if(rval == 0):
-            if (smoothing>0):
-                mycb = calibrater()
-                mycb.open(filename=vis, compress=False, addcorr=False, addmodel=False)
-                mycb.smooth(tablein=caltable+'_unsmoothed', tableout=caltable,
-                        smoothtype='mean', smoothtime=smoothing)
-                mycb.close()
+        if(rcode == 0):
             return taskrval
         else:
-            rcode = os.WEXITSTATUS(rval)
             if(rcode == 127):
                 raise Exception("wvrgcal executable not available.")
             elif(rcode == 255):
                 casalog.post(theexecutable+' terminated with exit status '+str(rcode),'SEVERE')
                 return taskrval
-            elif(rcode == 134 or rval==1):
+            elif(rcode == 134):
                 casalog.post(theexecutable+' terminated with exit status '+str(rcode),'WARN')
                 casalog.post("No useful input data.",'SEVERE')
                 return taskrval
@@ -0,0 +1,224 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from casatasks import casalog
+from casatools import table
+
+# Rough memory footprint of one wvrgcal run: a fixed part for the
+# process (casacore, the retrieval model) and a part proportional to
+# the number of WVR rows in the MS (loaded data, smoothed and
+# interpolated copies, gains)
+_BASE_BYTES = 256 * 1024**2
+_BYTES_PER_WVR_ROW = 1024
+
+def _wvr_rows(vis):
+    """
+    Number of rows in the main table of vis which contain WVR data,
+    i.e. whose spectral window has 4 channels.
+    """
+    mytb = table( )
+    try:
+        mytb.open(os.path.join(vis, 'SPECTRAL_WINDOW'))
+        nchan = mytb.getcol('NUM_CHAN')
+        mytb.close()
+        mytb.open(os.path.join(vis, 'DATA_DESCRIPTION'))
+        ddspw = mytb.getcol('SPECTRAL_WINDOW_ID')
+        mytb.close()
+        wvrdd = [ i for i in range(len(ddspw)) if nchan[ddspw[i]]==4 ]
+        if len(wvrdd)==0:
+            return 0
+        mytb.open(vis)
+        sel = mytb.query('DATA_DESC_ID IN [%s]' % ','.join([str(i) for i in wvrdd]))
+        nrows = sel.nrows()
+        sel.close()
+        return nrows
+    finally:
+        mytb.close()
+
+def _memory_estimate(vis):
+    """
+    Estimated peak memory in bytes of a wvrgcal run on vis.
+    """
+    return _BASE_BYTES + _BYTES_PER_WVR_ROW * _wvr_rows(vis)
+
+def _physical_memory():
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+def _run_one(vis, caltable, pars):
+    """
+    Run wvrgcal on a single MS in a worker process. Errors are returned
+    rather than raised so that they do not affect the other MSs.
+    """
+    from .task_wvrgcal import wvrgcal
+    try:
+        res = wvrgcal(vis=vis, caltable=caltable, **pars)
+        if type(res)!=dict:
+            res = { 'success': False }
+    except Exception as instance:
+        res = { 'success': False, 'error': str(instance) }
+    return res
+
+def _run_pool(ctx, nproc, budget, pending, needed, results, vislist, caltablelist, pars):
+    """
+    Run wvrgcal on the MSs with the indices in pending, filling in
+    results, with at most nproc processes and the given memory budget.
+    """
+    while len(pending)>0:
+        running = { }
+        inuse = 0
+        broken = False
+        with ProcessPoolExecutor(max_workers=nproc, mp_context=ctx) as pool:
+            while len(pending)>0 or len(running)>0:
+                # start as many MSs as the number of processes and the memory budget allow
+                for i in list(pending):
+                    if len(running)>=nproc:
+                        break
+                    if len(running)>0 and budget>0 and inuse+needed[i]>budget:
+                        continue
+                    casalog.post('Starting wvrgcal on '+vislist[i]
+                                 +' (estimated memory %.2f GB)' % (needed[i] / 1024**3))
+                    running[pool.submit(_run_one, vislist[i], caltablelist[i], pars)] = i
+                    inuse += needed[i]
+                    pending.remove(i)
+
+                done, notdone = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+                for f in done:
+                    i = running.pop(f)
+                    inuse -= needed[i]
+                    try:
+                        results[i] = f.result()
+                    except BrokenProcessPool:
+                        # a worker died, e.g. in the wvrgcal library; the pool
+                        # is unusable and any of the running MSs may be the cause
+                        results[i] = { 'success': False,
+                                       'error': 'wvrgcal process terminated abnormally' }
+                        broken = True
+                    except Exception as instance:
+                        results[i] = { 'success': False, 'error': str(instance) }
+                    casalog.post('Finished wvrgcal on '+vislist[i]
+                                 +(' successfully' if results[i].get('success') else ' with errors'),
+                                 'INFO' if results[i].get('success') else 'WARN')
+                if broken:
+                    for f, i in running.items():
+                        results[i] = { 'success': False,
+                                       'error': 'wvrgcal process terminated abnormally' }
+                    running = { }
+                    break
+        if broken and len(pending)>0:
+            casalog.post('Restarting the wvrgcal process pool', 'WARN')
+
+def wvrgcal_batch(vislist=None, caltablelist=None, toffset=None, segsource=None,
+        sourceflag=None, tie=None, nsol=None, disperse=None,
+        wvrflag=None, statfield=None, statsource=None, smooth=None,
+        scale=None, spw=None, wvrspw=None,
+        reversespw=None,  cont=None, maxdistm=None,
+        minnumants=None, mingoodfrac=None, usefieldtab=None,
+        refant=None, offsetstable=None, smoothtype=None, nproc=None, memlimit=None):
+
+    """
+    Run wvrgcal on several independent MSs in parallel
+
+    The parameters other than vislist, caltablelist, nproc and memlimit
+    are passed unchanged to wvrgcal for every MS.
+
+      vislist -- Names of the input visibility files
+                 example: vislist=['uid___A002_X1.ms', 'uid___A002_X2.ms']
+
+      caltablelist -- Names of the output gain calibration tables, one per
+                 input visibility file
+
+      nproc -- Maximum number of MSs processed at the same time. Each
+                 wvrgcal process uses the number of CPU cores divided by
+                 nproc (at least one) OpenMP threads.
+                 default: 0 (number of CPU cores)
+
+      memlimit -- Memory (GB) available to all concurrently running wvrgcal
+                 processes. The memory needed for each MS is estimated from
+                 its number of WVR rows; an MS is started only if it fits
+                 into what is left of the budget, or if nothing else runs.
+                 default: 0 (80% of the physical memory)
+
+    Returns a dictionary with the element 'results', the list of the
+    wvrgcal return dictionaries in the order of vislist, each extended
+    by 'vis', 'caltable' and, if the run raised an error, 'error'. The
+    element 'success' is True if all runs were successful.
+    """
+
+    casalog.origin('wvrgcal_batch')
+
+    if type(vislist)==str:
+        vislist = [vislist]
+    if type(caltablelist)==str:
+        caltablelist = [caltablelist]
+    if not vislist:
+        raise Exception('Must provide the input visibility files in parameter vislist.')
+    if caltablelist is None or len(caltablelist)!=len(vislist):
+        raise Exception('Parameter caltablelist must have one entry per element of vislist.')
+    if len(set(caltablelist))!=len(caltablelist):
+        raise Exception('The names in parameter caltablelist must be unique.')
+
+    pars = { 'toffset': toffset, 'segsource': segsource, 'sourceflag': sourceflag,
+             'tie': tie, 'nsol': nsol, 'disperse': disperse, 'wvrflag': wvrflag,
+             'statfield': statfield, 'statsource': statsource, 'smooth': smooth,
+             'smoothtype': smoothtype, 'scale': scale, 'spw': spw, 'wvrspw': wvrspw,
+             'reversespw': reversespw,
+             'cont': cont, 'maxdistm': maxdistm, 'minnumants': minnumants,
+             'mingoodfrac': mingoodfrac, 'usefieldtab': usefieldtab,
+             'refant': refant, 'offsetstable': offsetstable }
+
+    if not nproc or nproc<=0:
+        nproc = multiprocessing.cpu_count()
+    nproc = min(nproc, len(vislist))
+    # wvrgcal itself runs OpenMP parallel regions; share the cores
+    # between the processes rather than starting a full set of threads
+    # in each of them
+    nthreads = max(1, multiprocessing.cpu_count() // nproc)
+
+    budget = 0
+    if memlimit and memlimit>0:
+        budget = memlimit * 1024**3
+    else:
+        budget = 0.8 * _physical_memory()
+
+    results = [ None ] * len(vislist)
+    needed = [ 0 ] * len(vislist)
+    for i, vis in enumerate(vislist):
+        try:
+            needed[i] = _memory_estimate(vis)
+        except Exception as instance:
+            results[i] = { 'success': False, 'error': 'Could not read visibility file: '+str(instance) }
+
+    pending = [ i for i in range(len(vislist)) if results[i] is None ]
+    casalog.post('Processing %d MSs with up to %d parallel wvrgcal processes of %d threads each'
+                 % (len(pending), nproc, nthreads))
+    if budget>0:
+        casalog.post('Memory budget %.1f GB' % (budget / 1024**3))
+
+    # spawn rather than fork: the parent may hold open tables and threads
+    ctx = multiprocessing.get_context('spawn')
+    # The OpenMP runtime reads OMP_NUM_THREADS when it is loaded, which
+    # may happen while a spawned worker imports this module, i.e. before
+    # any initializer would run. The workers therefore inherit it from
+    # the environment of this process, which is restored at the end.
+    omp_saved = os.environ.get('OMP_NUM_THREADS')
+    os.environ['OMP_NUM_THREADS'] = str(nthreads)
+    try:
+        _run_pool(ctx, nproc, budget, pending, needed, results, vislist, caltablelist, pars)
+    finally:
+        if omp_saved is None:
+            del os.environ['OMP_NUM_THREADS']
+        else:
+            os.environ['OMP_NUM_THREADS'] = omp_saved
+
+    for i in range(len(vislist)):
+        results[i]['vis'] = vislist[i]
+        results[i]['caltable'] = caltablelist[i]
+        if 'error' in results[i]:
+            casalog.post('wvrgcal on '+vislist[i]+' failed: '+results[i]['error'], 'SEVERE')
+
+    return { 'results': results,
+             'success': all([ r['success'] for r in results ]) }
@@ -0,0 +1,242 @@
+"""
+On-disk cache of wvrgcal results
+
+The cache is enabled by setting the environment variable
+WVRGCAL_CACHEDIR to a directory. Each entry holds the gain table and
+the task return dictionary of one successful wvrgcal run. It is keyed
+by a fingerprint of the data wvrgcal reads from the MS, of the offsets
+and dispersion tables, if used, of the wvrgcal program and of the
+command line arguments other than the MS and output table names.
+To keep the fingerprint cheap for large MSs, only the contents of the
+WVR rows of the main table are hashed; the subtables, among them the
+potentially large POINTING table, enter through the names, sizes and
+modification times of their files. Any change of the data or rebuild
+of wvrgcal therefore leads to a new key; stale entries are removed by the
+least recently used eviction which keeps the total size below
+WVRGCAL_CACHESIZE GB (default 10) or explicitly with invalidate().
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import numpy
+from casatools import table
+
+# Increment when the layout of the entries or the fingerprint changes
+_CACHE_VERSION = 3
+
+_SUBTABLES = [ 'ANTENNA', 'DATA_DESCRIPTION', 'FEED', 'FIELD', 'POINTING',
+               'SOURCE', 'SPECTRAL_WINDOW', 'STATE' ]
+
+def cachedir():
+    """
+    The cache directory, or None if caching is disabled.
+    """
+    d = os.getenv('WVRGCAL_CACHEDIR', '')
+    if d=='':
+        return None
+    return d
+
+def _cachesize():
+    try:
+        return float(os.getenv('WVRGCAL_CACHESIZE', '10')) * 1024**3
+    except ValueError:
+        return 10. * 1024**3
+
+def _hash_file(h, fname):
+    """
+    Add the contents of the file fname to hash h.
+    """
+    with open(fname, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(1 << 20), b''):
+            h.update(chunk)
+
+def _hash_files(h, path):
+    """
+    Add the contents of all files below path to hash h, apart from the
+    table lock files, which change whenever a table is opened.
+    """
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for f in sorted(files):
+            if f=='table.lock':
+                continue
+            fname = os.path.join(root, f)
+            h.update(os.path.relpath(fname, path).encode())
+            _hash_file(h, fname)
+
+def _hash_stamps(h, path):
+    """
+    Add the names, sizes and modification times of all files below
+    path to hash h, apart from the table lock files.
+    """
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for f in sorted(files):
+            if f=='table.lock':
+                continue
+            fname = os.path.join(root, f)
+            st = os.stat(fname)
+            h.update(('%s %d %d' % (os.path.relpath(fname, path),
+                                    st.st_size, st.st_mtime_ns)).encode())
+
+def _hash_columns(h, mytb, columns, blocksize=100000):
+    """
+    Add the contents of the given columns of the open table tool mytb
+    to hash h, reading blocksize rows at a time.
+    """
+    nrows = mytb.nrows()
+    colnames = mytb.colnames()
+    for c in columns:
+        if c not in colnames:
+            continue
+        h.update(c.encode())
+        for start in range(0, nrows, blocksize):
+            block = mytb.getcol(c, start, min(blocksize, nrows-start))
+            h.update(numpy.ascontiguousarray(block).tobytes())
+
+def fingerprint(vis, wvrgcal_args, offsetstable='', disptable='', program=''):
+    """
+    Fingerprint of the inputs of a wvrgcal run with the given command
+    line arguments on vis. disptable is the dispersion table read
+    with --disperse and program the wvrgcal executable or extension
+    module which is run.
+    """
+    h = hashlib.sha256()
+    h.update(str(_CACHE_VERSION).encode())
+
+    if program!='' and os.path.exists(program):
+        h.update(b'program')
+        _hash_file(h, program)
+
+    # the arguments, apart from the names of the MS and of the output
+    args = list(wvrgcal_args)
+    for opt in ['--ms', '--output']:
+        while opt in args:
+            i = args.index(opt)
+            del args[i:i+2]
+    h.update(json.dumps(args).encode())
+
+    for sub in _SUBTABLES:
+        if os.path.exists(os.path.join(vis, sub)):
+            h.update(sub.encode())
+            _hash_stamps(h, os.path.join(vis, sub))
+
+    mytb = table( )
+    try:
+        mytb.open(os.path.join(vis, 'SPECTRAL_WINDOW'))
+        nchan = mytb.getcol('NUM_CHAN')
+        mytb.close()
+        mytb.open(os.path.join(vis, 'DATA_DESCRIPTION'))
+        ddspw = mytb.getcol('SPECTRAL_WINDOW_ID')
+        mytb.close()
+        wvrdd = [ i for i in range(len(ddspw)) if nchan[ddspw[i]]==4 ]
+
+        mytb.open(vis)
+        h.update(('nrows %d' % mytb.nrows()).encode())
+        if len(wvrdd)>0:
+            sel = mytb.query('DATA_DESC_ID IN [%s]' % ','.join([str(i) for i in wvrdd]))
+            try:
+                _hash_columns(h, sel, ['TIME', 'ANTENNA1', 'DATA', 'FLAG', 'FLAG_ROW'])
+            finally:
+                sel.close()
+    finally:
+        mytb.close()
+
+    if offsetstable!='':
+        h.update(b'offsets')
+        _hash_files(h, offsetstable)
+
+    if disptable!='':
+        h.update(b'dispersion')
+        _hash_file(h, disptable)
+
+    return h.hexdigest()
+
+def _entrydir(key):
+    return os.path.join(cachedir(), key)
+
+def lookup(key, vis, caltable):
+    """
+    If there is an entry for key, copy its gain table to caltable and
+    return the cached task return dictionary, otherwise return None.
+    """
+    if cachedir() is None:
+        return None
+    d = _entrydir(key)
+    resfile = os.path.join(d, 'result.json')
+    try:
+        with open(resfile) as fp:
+            entry = json.load(fp)
+        shutil.copytree(os.path.join(d, 'caltable'), caltable)
+    except (IOError, OSError, ValueError):
+        shutil.rmtree(caltable, ignore_errors=True)
+        return None
+    # record the use for the LRU eviction
+    os.utime(resfile, None)
+    return entry['result']
+
+def store(key, vis, caltable, result):
+    """
+    Add the gain table caltable and the task return dictionary result
+    to the cache under key, then evict the least recently used entries
+    if the cache is larger than its limit.
+    """
+    if cachedir() is None:
+        return
+    d = _entrydir(key)
+    tmp = d + '.tmp%d' % os.getpid()
+    try:
+        if os.path.exists(d):
+            return
+        os.makedirs(tmp)
+        shutil.copytree(caltable, os.path.join(tmp, 'caltable'))
+        with open(os.path.join(tmp, 'result.json'), 'w') as fp:
+            json.dump({ 'vis': os.path.abspath(vis), 'result': result }, fp)
+        os.rename(tmp, d)
+    except (IOError, OSError):
+        shutil.rmtree(tmp, ignore_errors=True)
+        return
+    _evict(_cachesize())
+
+def _entries():
+    """
+    The entries in the cache as a list of (last use, size, path).
+    """
+    res = [ ]
+    for k in os.listdir(cachedir()):
+        d = os.path.join(cachedir(), k)
+        resfile = os.path.join(d, 'result.json')
+        if not os.path.exists(resfile):
+            continue
+        size = 0
+        for root, dirs, files in os.walk(d):
+            size += sum([ os.path.getsize(os.path.join(root, f)) for f in files ])
+        res.append((os.path.getmtime(resfile), size, d))
+    return res
+
+def _evict(limit):
+    entries = sorted(_entries())
+    total = sum([ e[1] for e in entries ])
+    while total>limit and len(entries)>0:
+        t, size, d = entries.pop(0)
+        shutil.rmtree(d, ignore_errors=True)
+        total -= size
+
+def invalidate(vis=None):
+    """
+    Remove the cache entries made from vis, or all entries if vis is
+    None.
+    """
+    if cachedir() is None or not os.path.exists(cachedir()):
+        return
+    for t, size, d in _entries():
+        if vis is not None:
+            try:
+                with open(os.path.join(d, 'result.json')) as fp:
+                    if json.load(fp)['vis']!=os.path.abspath(vis):
+                        continue
+            except (IOError, OSError, ValueError, KeyError):
+                pass
+        shutil.rmtree(d, ignore_errors=True)
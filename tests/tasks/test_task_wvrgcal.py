@@ -28,7 +28,7 @@ import numpy as np
 
 from casatools import ctsys, table
 from casatasks import flagdata, smoothcal, split
-from almatasks import wvrgcal
+from almatasks import wvrgcal, wvrgcal_batch
 import unittest
 
 from casatestutils import testhelper as th
@@ -206,10 +206,14 @@ class wvrgcal_test(unittest.TestCase):
 
         print(rvaldict)
 
-        self.rval = rvaldict['success']
-
+        # the smoothing is done by wvrgcal itself, only one table is written
         self.assertTrue(os.path.exists(self.out))
-        self.assertTrue(os.path.exists(self.out+'_unsmoothed'))
+        self.assertFalse(os.path.exists(self.out+'_unsmoothed'))
+
+        rvaldict2 = wvrgcal(vis="myinput.ms",caltable=self.out+'_unsmoothed', segsource=False, toffset=0.)
+
+        self.rval = rvaldict['success'] and rvaldict2['success']
+
         smoothcal(vis = "myinput.ms",
 		  tablein = self.out+'_unsmoothed',
 		  caltable = self.out+'_ref',
@@ -575,5 +579,60 @@ class wvrgcal_test(unittest.TestCase):
                                                   6990.0, 6700.0, 7280.0, 7040.0, 7160.0, 6790.0, 6980.0, 6890.0, 7120.0, 0.0, 7080.0, 6970.0,
                                                   6950.0, 6930.0, 7060.0, 6850.0, 7030.0])
 
+    def test22(self):
+        '''Test 22:  wvrgcal_batch on two MSs gives the same tables as wvrgcal'''
+        os.system('cp -R ' + self.vis_g + ' myinput.ms')
+        os.system('cp -R ' + self.vis_h + ' myinput2.ms')
+
+        rvaldict = wvrgcal_batch(vislist=['myinput.ms', 'myinput2.ms'],
+                                 caltablelist=[self.out, self.out+'2'],
+                                 toffset=-1., nproc=2)
+
+        rvaldict2 = wvrgcal(vis="myinput.ms", caltable='comp.W', toffset=-1.)
+        rvaldict3 = wvrgcal(vis="myinput2.ms", caltable='comp2.W', toffset=-1.)
+
+        print(rvaldict)
+
+        self.assertEqual(len(rvaldict['results']), 2)
+        self.rval = rvaldict['success']
+
+        if(self.rval):
+            self.assertEqual(rvaldict['results'][0]['Disc_um'], rvaldict2['Disc_um'])
+            self.assertEqual(rvaldict['results'][1]['Disc_um'], rvaldict3['Disc_um'])
+            self.rval = th.compTables('comp.W', self.out, ['WEIGHT']) and \
+                        th.compTables('comp2.W', self.out+'2', ['WEIGHT'])
+
+        self.assertTrue(self.rval)
+
+    def test23(self):
+        '''Test 23:  wvrgcal4quasar_10s.ms, result cache'''
+        os.system('cp -R ' + self.vis_g + ' myinput.ms')
+        os.system('rm -rf mywvrcache')
+        os.environ['WVRGCAL_CACHEDIR'] = 'mywvrcache'
+        try:
+            rvaldict = wvrgcal(vis="myinput.ms", caltable=self.out, toffset=-1.)
+            self.assertEqual(len(os.listdir('mywvrcache')), 1)
+
+            # identical run: taken from the cache
+            rvaldict2 = wvrgcal(vis="myinput.ms", caltable='comp.W', toffset=-1.)
+            self.assertEqual(len(os.listdir('mywvrcache')), 1)
+
+            # different parameters: new entry
+            rvaldict3 = wvrgcal(vis="myinput.ms", caltable='comp2.W', toffset=-1., scale=0.8)
+            self.assertEqual(len(os.listdir('mywvrcache')), 2)
+        finally:
+            del os.environ['WVRGCAL_CACHEDIR']
+            os.system('rm -rf mywvrcache')
+
+        print(rvaldict)
+
+        self.assertEqual(rvaldict, rvaldict2)
+        self.rval = rvaldict['success'] and rvaldict3['success']
+
+        if(self.rval):
+            self.rval = th.compTables(self.out, 'comp.W', ['WEIGHT'])
+
+        self.assertTrue(self.rval)
+
 if __name__ == '__main__':
     unittest.main()